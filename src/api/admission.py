@@ -0,0 +1,87 @@
+import datetime
+import os
+import random
+import shutil
+import time
+from typing import Any, Dict, Optional
+
+from job_scheduler import DEFAULT_DURATION_SECONDS, queue_load
+
+# --- アップロードの受け入れ制御 (バックプレッシャー) ---
+# 施設全体の一括同期などでアップロードが集中したとき、待ち行列やディスクを使い切る前に
+# 503 + Retry-After で断り、PWA のバックグラウンド同期に時間をおいて再送させる。
+# 断る条件 (いずれか):
+#   - 待ち行列 (pending / processing) の件数が MAX_QUEUE_DEPTH 以上
+#   - 今のワーカー数で処理し終えるまでの予想秒数 (drain) が MAX_DRAIN_SECONDS 以上
+#   - uploads/ の空き容量が MIN_FREE_BYTES + このアップロードの大きさ 未満
+# 判定に使う待ち行列の集計は CACHE_SECONDS だけ使い回す (集中時に毎回集計しない)。
+# その間に受け入れた件数は手元で加算しておく。
+# Retry-After は超過分が捌けるまでの見込み (上下限あり) に揺らぎを加え、端末の再送が一斉に戻らないようにする。
+
+MAX_QUEUE_DEPTH = int(os.environ.get("KOENO_ADMIT_MAX_QUEUE", "500"))
+MAX_DRAIN_SECONDS = float(os.environ.get("KOENO_ADMIT_MAX_DRAIN_SECONDS", str(6 * 3600)))
+MIN_FREE_BYTES = int(os.environ.get("KOENO_ADMIT_MIN_FREE_MB", "1024")) * 1024 * 1024
+CACHE_SECONDS = 5.0
+RETRY_MIN_SECONDS = 60
+RETRY_MAX_SECONDS = 3600
+RETRY_DISK_SECONDS = 1800   # 空き容量不足はアーカイブ (archive_job.py) などの対処が必要なため長めに待たせる
+RETRY_JITTER = 0.2
+
+
+class AdmissionDecision:
+    def __init__(self, admit: bool, reason: Optional[str] = None, retry_after: Optional[int] = None, **stats: Any):
+        self.admit = admit
+        self.reason = reason            # queue_depth / drain_time / disk_space
+        self.retry_after = retry_after  # 秒
+        self.stats = stats
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"admit": self.admit, "reason": self.reason, "retry_after": self.retry_after, **self.stats}
+
+
+def _retry_after(seconds: float) -> int:
+    seconds = min(max(seconds, RETRY_MIN_SECONDS), RETRY_MAX_SECONDS)
+    return int(seconds * (1.0 + random.uniform(0.0, RETRY_JITTER)))
+
+
+class UploadAdmission:
+    def __init__(self, database, recordings, upload_dir: str):
+        self.database = database
+        self.recordings = recordings
+        self.upload_dir = upload_dir
+        self._load: Optional[Dict[str, Any]] = None
+        self._loaded_at = 0.0
+        self._admitted_since = 0   # 集計後に受け入れた件数
+
+    async def _queue_load(self) -> Dict[str, Any]:
+        if self._load is None or time.monotonic() - self._loaded_at > CACHE_SECONDS:
+            self._load = await queue_load(self.database, self.recordings, datetime.datetime.now(datetime.UTC))
+            self._loaded_at = time.monotonic()
+            self._admitted_since = 0
+        return self._load
+
+    def _free_bytes(self) -> int:
+        os.makedirs(self.upload_dir, exist_ok=True)
+        return shutil.disk_usage(self.upload_dir).free
+
+    async def check(self, content_length: Optional[int] = None) -> AdmissionDecision:
+        free = self._free_bytes()
+        load = await self._queue_load()
+        depth = load["depth"] + self._admitted_since
+        per_job = DEFAULT_DURATION_SECONDS * load["rtf"] / load["workers"]
+        drain = load["drain_seconds"] + self._admitted_since * per_job
+        stats = {"queue_depth": depth, "drain_seconds": round(drain), "free_bytes": free}
+
+        if free - (content_length or 0) < MIN_FREE_BYTES:
+            return AdmissionDecision(False, "disk_space", _retry_after(RETRY_DISK_SECONDS), **stats)
+        if depth >= MAX_QUEUE_DEPTH:
+            # 上限を下回るまでに処理すべき件数ぶんの時間
+            excess = (depth - MAX_QUEUE_DEPTH + 1) * (drain / depth if depth else per_job)
+            return AdmissionDecision(False, "queue_depth", _retry_after(excess), **stats)
+        if drain >= MAX_DRAIN_SECONDS:
+            return AdmissionDecision(False, "drain_time", _retry_after(drain - MAX_DRAIN_SECONDS), **stats)
+        return AdmissionDecision(True, **stats)
+
+    def admitted(self) -> None:
+        """受け入れたアップロードを次の集計まで見込みに加える"""
+        self._admitted_since += 1
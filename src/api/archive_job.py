@@ -0,0 +1,188 @@
+"""
+[アーカイブジョブ] 確定済みの日の録音を冷えたストレージへ移す (1日1回の実行を想定)
+
+  py .\\archive_job.py [--days 30] [--dry-run] [--vacuum]
+
+対象: ai_status が completed で、割り当てられた全入居者の日報 (care_records) が
+      その録音のJST日付で作成済み、かつ --days 日より古い録音。
+処理: 0. 対象の録音IDと音声のパスだけを先に全件読み、JST月ごとにまとめる
+      1. 月ごとに、その月の音声をまとめて archive/audio/YYYY-MM.zip に追加して検証 (zip の差し替えは1回の実行で月に1回。
+         zip は複製に追記してから差し替えるため、配信中の zip を書き換えない)
+      2. その月の録音を BATCH_SIZE 件ずつ読み、transcription_result / assignment_snapshot を zlib 圧縮して
+         recording_archive へ移し、recordings 側は NULL にする (1件ずつ同一トランザクション)
+      3. コミット後に元の音声ファイルを削除
+途中で止めても、再実行すれば未処理の録音から続きを行う。
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import sqlalchemy
+
+# db.py からDB定義（接続情報、テーブル定義）をインポート (FastAPI は読み込まない)
+from db import database, recordings, recording_assignments, care_records, recording_archive
+from migrations import upgrade
+import archive_store
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("KOENO_ARCHIVE_AFTER_DAYS", "30"))
+BATCH_SIZE = 50
+
+
+def _jst_month():
+    return sqlalchemy.func.strftime('%Y-%m', sqlalchemy.func.datetime(recordings.c.created_at, '+9 hours')).label("jst_month")
+
+
+def _candidate_query(cutoff: datetime.datetime, after_id: int):
+    """アーカイブ対象の録音の ID・音声のパス・JST月 (大きなJSONは読まない)"""
+    jst = sqlalchemy.func.datetime(recordings.c.created_at, '+9 hours')
+    a = recording_assignments.alias("a")
+    day_finalized = sqlalchemy.exists().where(
+        (care_records.c.user_id == a.c.user_id) & (care_records.c.record_date == sqlalchemy.func.date(jst))
+    )
+    has_assignment = sqlalchemy.exists().where(a.c.recording_id == recordings.c.recording_id)
+    has_unfinalized = sqlalchemy.exists().where((a.c.recording_id == recordings.c.recording_id) & sqlalchemy.not_(day_finalized))
+    return (
+        sqlalchemy.select(recordings.c.recording_id, recordings.c.audio_file_path, _jst_month())
+        .where(
+            recordings.c.archived_at.is_(None)
+            & (recordings.c.ai_status == "completed")
+            & (recordings.c.created_at < cutoff)
+            & (recordings.c.recording_id > after_id)
+            & has_assignment
+            & sqlalchemy.not_(has_unfinalized)
+        )
+        .order_by(recordings.c.recording_id)
+        .limit(BATCH_SIZE)
+    )
+
+
+def _rows_query(recording_ids: List[int]):
+    """移す録音の行 (JSON込み)。アーカイブ済みになった行は除く"""
+    return (
+        sqlalchemy.select(
+            recordings.c.recording_id, recordings.c.audio_file_path, recordings.c.transcription_result, recordings.c.assignment_snapshot,
+            _jst_month(),
+        )
+        .where(recordings.c.recording_id.in_(recording_ids) & recordings.c.archived_at.is_(None))
+        .order_by(recordings.c.recording_id)
+    )
+
+
+def _archive_path(row) -> Optional[str]:
+    """音声の移し先の月別 zip (音声ファイルが無ければ None)"""
+    has_audio = bool(row.audio_file_path) and os.path.exists(row.audio_file_path)
+    return archive_store.month_archive_path(row.jst_month) if has_audio else None
+
+
+async def collect_candidates(cutoff: datetime.datetime) -> Dict[Optional[str], List[Any]]:
+    """0. 対象の録音を移し先の月別 zip ごとにまとめる (音声ファイルの無い録音は None にまとめる)"""
+    per_archive: Dict[Optional[str], List[Any]] = defaultdict(list)
+    after_id = 0
+    while True:
+        rows = await database.fetch_all(_candidate_query(cutoff, after_id))
+        if not rows:
+            break
+        for row in rows:
+            per_archive[_archive_path(row)].append(row)
+        after_id = rows[-1].recording_id
+    return per_archive
+
+
+def archive_audio(archive_path: str, rows) -> bool:
+    """1. その月の音声をまとめて月別アーカイブへ (検証込み)。失敗したら False (その月の録音は次回の実行で再試行される)"""
+    try:
+        archive_store.add_audio(archive_path, [(r.recording_id, r.audio_file_path) for r in rows])
+        return True
+    except Exception as e:
+        print(f"!!! {archive_path} への音声の追加に失敗 ({len(rows)} 件, ID {rows[0].recording_id} 〜 {rows[-1].recording_id}): {e}")
+        return False
+
+
+async def archive_one(row, dry_run: bool) -> bool:
+    """(音声は archive_audio で月別アーカイブに追加済み。dry_run では _candidate_query の行を渡してよい)"""
+    rid = row.recording_id
+    audio_path = row.audio_file_path
+    archive_path = _archive_path(row)
+    has_audio = archive_path is not None
+
+    if dry_run:
+        print(f"[DRY-RUN] ID {rid}: 音声 {'→ ' + archive_path if has_audio else 'なし'}")
+        return True
+
+    # 2. 冷えたJSONを圧縮して側テーブルへ移し、ホットな行を小さくする
+    now = datetime.datetime.now(datetime.UTC)
+    async with database.transaction():
+        await database.execute(recording_archive.delete().where(recording_archive.c.recording_id == rid))
+        await database.execute(recording_archive.insert().values(
+            recording_id=rid,
+            transcription_result_z=archive_store.compress_json(row.transcription_result),
+            assignment_snapshot_z=archive_store.compress_json(row.assignment_snapshot),
+            archived_at=now,
+        ))
+        # (JSON型に None を渡すと 'null' 文字列になるため、SQL の NULL を明示する)
+        await database.execute(recordings.update().where(recordings.c.recording_id == rid).values(
+            transcription_result=sqlalchemy.null(),
+            assignment_snapshot=sqlalchemy.null(),
+            archived_at=now,
+            audio_archive=archive_path,
+        ))
+
+    # 3. DBが新しい場所を指してから元ファイルを消す
+    if has_audio:
+        os.remove(audio_path)
+    print(f"ID {rid}: アーカイブ完了 ({archive_path or '音声なし'})")
+    return True
+
+
+async def run_archive(days: int, dry_run: bool, vacuum: bool):
+    cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=days)
+    print(f"--- [ARCHIVE] {cutoff.date()} より前の確定済み録音をアーカイブします ---")
+    per_archive = await collect_candidates(cutoff)
+    total = 0
+    for archive_path, candidates in per_archive.items():
+        if dry_run:
+            for row in candidates:
+                await archive_one(row, dry_run)
+            total += len(candidates)
+            continue
+        if archive_path is not None and not archive_audio(archive_path, candidates):
+            continue
+        ids = [r.recording_id for r in candidates]
+        for start in range(0, len(ids), BATCH_SIZE):
+            for row in await database.fetch_all(_rows_query(ids[start:start + BATCH_SIZE])):
+                try:
+                    if await archive_one(row, dry_run):
+                        total += 1
+                except Exception as e:
+                    # 1件の失敗で全体を止めない (次回の実行で再試行される)
+                    print(f"!!! ID {row.recording_id} のアーカイブに失敗: {e}")
+    print(f"--- [ARCHIVE] {total} 件を処理しました ---")
+
+    if vacuum and not dry_run and total:
+        print("[ARCHIVE] VACUUM でデータベースファイルを縮小しています...")
+        await database.execute("VACUUM")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="確定済みの録音をアーカイブする")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="この日数より古い録音を対象にする")
+    parser.add_argument("--dry-run", action="store_true", help="対象を表示するだけで変更しない")
+    parser.add_argument("--vacuum", action="store_true", help="最後に VACUUM を実行する")
+    args = parser.parse_args()
+
+    upgrade()
+    await database.connect()
+    try:
+        await run_archive(args.days, args.dry_run, args.vacuum)
+    finally:
+        if database.is_connected:
+            await database.disconnect()
+            print("データベース接続を切断しました。")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
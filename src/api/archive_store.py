@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
+from typing import Any, List, Optional, Tuple
+
+# --- 録音アーカイブの保存形式 ---
+# 確定済みの日の録音は、音声を月別 zip (archive/audio/YYYY-MM.zip) に、
+# 大きなJSON (transcription_result / assignment_snapshot) を zlib 圧縮して recording_archive に移す。
+# 読み出し側 (API・ワーカー) はこのモジュール経由で透過的に元の形に戻す。
+
+ARCHIVE_DIR = "archive"
+AUDIO_ARCHIVE_DIR = os.path.join(ARCHIVE_DIR, "audio")
+
+# すでに圧縮済みのコーデックは無圧縮で格納する (再圧縮しても縮まず、Range 配信のシークが遅くなるため)
+_STORED_EXTENSIONS = {".webm", ".ogg", ".opus", ".mp3", ".m4a"}
+
+REPLACE_RETRIES = 20
+REPLACE_RETRY_SECONDS = 0.25
+
+
+def compress_json(obj: Any) -> Optional[bytes]:
+    if obj is None:
+        return None
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def decompress_json(blob: Optional[bytes]) -> Any:
+    if blob is None:
+        return None
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def month_archive_path(jst_month: str) -> str:
+    """jst_month: 'YYYY-MM'"""
+    return os.path.abspath(os.path.join(AUDIO_ARCHIVE_DIR, f"{jst_month}.zip"))
+
+
+def member_name(recording_id: int, audio_file_path: str) -> str:
+    return f"{recording_id}_{os.path.basename(audio_file_path)}"
+
+
+def add_audio(archive_path: str, files: List[Tuple[int, str]]) -> List[str]:
+    """
+    音声ファイル [(recording_id, audio_file_path), ...] を月別 zip に追加し、メンバー名を返す (再実行時は既存メンバーをそのまま使う)
+    ★ 配信中 (/recording_audio) の zip をその場で書き換えない。複製した一時ファイルに追記・検証してから os.replace で差し替える
+    (読み出し側は差し替え前の zip か、追記し終えた zip のどちらかを丸ごと見る。中央ディレクトリの書きかけは見えない)
+    ★ 呼ぶたびに zip 全体を複製するので、1回の実行でその月の録音をまとめて渡すこと (小分けに呼ぶと複製の量が月の大きさの2乗で増える)
+    """
+    directory = os.path.dirname(archive_path)
+    os.makedirs(directory, exist_ok=True)
+    names = [member_name(rid, path) for rid, path in files]
+    # (一時ファイルは実行ごとに別名。同じ月を扱う別の実行と一時ファイルを書き潰し合わない)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(archive_path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        exists = os.path.exists(archive_path)
+        if exists:
+            shutil.copyfile(archive_path, tmp)
+        with zipfile.ZipFile(tmp, "a" if exists else "w") as zf:
+            existing = set(zf.namelist())
+            for name, (_, path) in zip(names, files):
+                if name not in existing:
+                    compression = zipfile.ZIP_STORED if os.path.splitext(path)[1].lower() in _STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                    zf.write(path, arcname=name, compress_type=compression)
+        # 書き込んだ内容を検証してから差し替え、元ファイルの削除に進む
+        with zipfile.ZipFile(tmp) as zf:
+            for name, (_, path) in zip(names, files):
+                if zf.getinfo(name).file_size != os.path.getsize(path):
+                    raise IOError(f"アーカイブ内のサイズが一致しません: {name}")
+        _replace(tmp, archive_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return names
+
+
+def _replace(src: str, dst: str) -> None:
+    # (Windows では配信中の zip を開いている間は差し替えられない。Range の1回の読み出しは短いので少し待って再試行する)
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(REPLACE_RETRY_SECONDS)
+
+
+def audio_member_size(archive_path: str, recording_id: int, audio_file_path: str) -> int:
+    with zipfile.ZipFile(archive_path) as zf:
+        return zf.getinfo(member_name(recording_id, audio_file_path)).file_size
+
+
+def open_audio(archive_path: str, recording_id: int, audio_file_path: str):
+    """アーカイブ内の音声をシーク可能なファイルオブジェクトとして開く (呼び出し側で close すること)"""
+    zf = zipfile.ZipFile(archive_path)
+    member = zf.open(member_name(recording_id, audio_file_path))
+    # ZipFile 本体も member と一緒に閉じられるようにする
+    original_close = member.close
+
+    def close():
+        original_close()
+        zf.close()
+
+    member.close = close
+    return member
+
+
+def extract_audio(archive_path: str, recording_id: int, audio_file_path: str, dest_path: str) -> str:
+    """再処理などで実ファイルが必要な場合に、アーカイブから dest_path に書き出す"""
+    with zipfile.ZipFile(archive_path) as zf, zf.open(member_name(recording_id, audio_file_path)) as src, open(dest_path, "wb") as dst:
+        while True:
+            chunk = src.read(1024 * 1024)
+            if not chunk:
+                break
+            dst.write(chunk)
+    return dest_path
@@ -0,0 +1,78 @@
+import copy
+from typing import Any, Dict, List, Optional
+
+from summary_drafts import user_transcript
+
+# --- 割当スナップショットの差分更新 (PATCH /recordings/{id}/assignments) ---
+# 割当画面の1回の編集ごとに、スナップショット全体 (数百KB) を送り直して recording_assignments を
+# 全削除・再作成していたのをやめ、行 (発話 / 割当グループ) 単位の変更だけを受け取って適用する。
+# スナップショットの行は画面が付けた "id" で識別する。変更の種類 (op):
+#   update … {"op": "update", "id": 行, "set": {項目: 値}}        項目を書き換える (id / type は変えられない)
+#   insert … {"op": "insert", "row": {...}, "after": 行 or None}  行 after の直後 (None なら先頭) に追加
+#   delete … {"op": "delete", "id": 行}
+#   move   … {"op": "move", "id": 行, "after": 行 or None}         行 after の直後 (None なら先頭) へ移動
+# 変更は先頭から順に適用する。どれか1つでも適用できなければ全体を拒否する (DeltaError)。
+# 同時編集は recordings.assignment_version で検出する (main.py。読んだ版と違えば 409)。
+
+MAX_CHANGES = 5000
+IMMUTABLE_FIELDS = ("id", "type")
+
+
+class DeltaError(ValueError):
+    pass
+
+
+def _index(rows: List[Dict[str, Any]], row_id: Any) -> int:
+    for i, row in enumerate(rows):
+        if row.get("id") == row_id:
+            return i
+    raise DeltaError(f"行がありません: {row_id}")
+
+
+def _insert_after(rows: List[Dict[str, Any]], row: Dict[str, Any], after: Optional[Any]) -> None:
+    rows.insert(0 if after is None else _index(rows, after) + 1, row)
+
+
+def apply_changes(snapshot: List[Dict[str, Any]], changes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """スナップショットに変更を順に適用した新しいリストを返す (元のリストは変えない)"""
+    if len(changes) > MAX_CHANGES:
+        raise DeltaError(f"変更が多すぎます ({len(changes)} 件)。全体を保存してください")
+    rows = copy.deepcopy(snapshot)
+    for change in changes:
+        op = change.get("op")
+        if op == "update":
+            values = change.get("set") or {}
+            if any(k in values for k in IMMUTABLE_FIELDS):
+                raise DeltaError(f"変更できない項目です: {', '.join(k for k in IMMUTABLE_FIELDS if k in values)}")
+            rows[_index(rows, change.get("id"))].update(values)
+        elif op == "insert":
+            row = change.get("row")
+            if not isinstance(row, dict) or row.get("id") is None:
+                raise DeltaError("追加する行に id がありません")
+            if any(r.get("id") == row["id"] for r in rows):
+                raise DeltaError(f"行が既にあります: {row['id']}")
+            _insert_after(rows, dict(row), change.get("after"))
+        elif op == "delete":
+            del rows[_index(rows, change.get("id"))]
+        elif op == "move":
+            if change.get("after") == change.get("id"):
+                raise DeltaError("自分自身の後ろには移動できません")
+            row = rows.pop(_index(rows, change.get("id")))
+            _insert_after(rows, row, change.get("after"))
+        else:
+            raise DeltaError(f"未知の変更です: {op}")
+    return rows
+
+
+def assigned_users(snapshot: List[Dict[str, Any]]) -> List[str]:
+    """スナップショットの割当グループの入居者 (出現順・重複なし)"""
+    users: List[str] = []
+    for row in snapshot:
+        if row.get("type") == "assignment" and row.get("userId") and row["userId"] not in users:
+            users.append(row["userId"])
+    return users
+
+
+def users_with_changed_transcript(old: List[Dict[str, Any]], new: List[Dict[str, Any]], users: List[str]) -> List[str]:
+    """割り当てた発話が変わった入居者 (要約を作り直す対象)。処理済みフラグなどの変更では作り直さない"""
+    return [u for u in users if user_transcript(old, u) != user_transcript(new, u)]
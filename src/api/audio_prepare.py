@@ -0,0 +1,176 @@
+import os
+import shutil
+import subprocess
+import time
+import wave
+from typing import Any, Dict, Optional
+
+from audio_probe import probe_duration
+from waveform_peaks import write_peaks
+
+# --- デコード段 (worker_pipeline.py のプロセスプールで実行) ---
+# ffmpeg によるデコード・16kHz モノラルへの変換・波形ピークの書き出しを、
+# 推論中のモデルとは別のプロセスで先に済ませておく。
+# 結果の波形はプロセス間で受け渡さず、変換済みの wav (ffmpeg を使わずに読める) に書き出してパスを返す。
+# ★ このモジュールは子プロセスで読み込まれるため、torch などの重いライブラリや db (DB接続) をインポートしないこと
+# LONG_RECORDING_SECONDS を超える録音は pydub に読み込まず、ffmpeg から生 PCM ファイルへ直接書き出す
+# (ワーカーは long_audio.py で memmap して窓ごとに処理する。メモリが録音の長さに比例しない)
+# 長さが分からない録音 (ffprobe が無い・解析できない) も、先に生 PCM へ書き出してから長さで振り分ける
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2              # 16bit
+WAV_CHUNK_SAMPLES = SAMPLE_RATE * 60   # PCM から wav に書き出す単位 (1分)
+LONG_RECORDING_SECONDS = float(os.environ.get("KOENO_LONG_RECORDING_SECONDS", "1800"))
+
+
+class AudioDecodeError(Exception):
+    """デコードの失敗。retryable=False はファイル欠損など、再試行しても直らないもの"""
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+    def __reduce__(self):
+        # (プロセス間で受け渡すときに retryable を落とさない)
+        return (AudioDecodeError, (str(self), self.retryable))
+
+
+def prepared_path_for(audio_file_path: str) -> str:
+    return audio_file_path + "_prepared.wav"
+
+
+def pcm_path_for(audio_file_path: str) -> str:
+    return audio_file_path + "_prepared.pcm"
+
+
+def decode_to_pcm(audio_file_path: str, pcm_path: str) -> None:
+    """ffmpeg で 16kHz モノラル 16bit の生 PCM (s16le) に変換してファイルに書き出す (音声全体をメモリに載せない)"""
+    exe = shutil.which("ffmpeg")
+    if not exe:
+        raise AudioDecodeError("ffmpeg が見つかりません")
+    out = subprocess.run(
+        [exe, "-v", "error", "-nostdin", "-y", "-i", audio_file_path, "-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), pcm_path],
+        capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        raise AudioDecodeError(f"音声ファイルロード失敗: {out.stderr.strip()[-500:]}")
+
+
+def decode_audio(audio_file_path: str):
+    import pydub  # (API サーバー側では使わないため遅延インポート)
+
+    # (pydub の .from_file() を使用)
+    audio = pydub.AudioSegment.from_file(audio_file_path)
+    # (Pyannote用に16kHz, モノラル, 16bit に変換)
+    return audio.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2)
+
+
+def prepare_audio(record_id: int, audio_file_path: str) -> Dict[str, Any]:
+    """
+    録音をデコードして変換済みの wav を書き出し、
+    {"wav_path", "audio_seconds", "decode_seconds"} を返す。
+    """
+    started = time.monotonic()
+    # (ファイルが存在しない場合は再試行しても無駄なので即 failed)
+    if not os.path.exists(audio_file_path):
+        raise AudioDecodeError(f"音声ファイルが見つかりません: {audio_file_path}", retryable=False)
+    duration = probe_duration(audio_file_path)
+    if duration is None:
+        # (長さが分からない録音を pydub に丸ごと読み込むと、長い録音でメモリが膨らむ)
+        return prepare_unknown_length(record_id, audio_file_path, started)
+    if duration > LONG_RECORDING_SECONDS:
+        return prepare_long_audio(record_id, audio_file_path, started)
+    try:
+        audio = decode_audio(audio_file_path)
+    except Exception as e:
+        raise AudioDecodeError(f"音声ファイルロード失敗: {e}")
+
+    # 波形ピークの事前計算 (レビュー画面のタイムライン用。元の時間軸で。失敗しても処理は続行)
+    try:
+        write_peaks(audio_file_path, audio.get_array_of_samples(), audio.frame_rate)
+    except Exception as e:
+        print(f"警告: ID {record_id} の波形ピーク生成に失敗 (続行します): {e}")
+
+    wav_path = prepared_path_for(audio_file_path)
+    try:
+        audio.export(wav_path, format="wav")
+    except Exception as e:
+        raise AudioDecodeError(f"一時ファイルの書き出しに失敗: {e}")
+    return {
+        "wav_path": wav_path,
+        "audio_seconds": len(audio) / 1000.0,
+        "decode_seconds": time.monotonic() - started,
+    }
+
+
+def _decode_pcm_file(audio_file_path: str) -> str:
+    pcm_path = pcm_path_for(audio_file_path)
+    try:
+        decode_to_pcm(audio_file_path, pcm_path)
+    except Exception:
+        if os.path.exists(pcm_path):
+            os.remove(pcm_path)
+        raise
+    return pcm_path
+
+
+def prepare_long_audio(record_id: int, audio_file_path: str, started: float, pcm_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    長い録音を生 PCM に書き出し、{"pcm_path", "sample_rate", "audio_seconds", "decode_seconds"} を返す。
+    (波形ピークも PCM を memmap して少しずつ計算する。pcm_path を渡した場合は書き出し済みのものを使う)
+    """
+    import long_audio
+
+    pcm_path = pcm_path or _decode_pcm_file(audio_file_path)
+    pcm = long_audio.open_pcm(pcm_path)
+    try:
+        write_peaks(audio_file_path, pcm, SAMPLE_RATE)
+    except Exception as e:
+        print(f"警告: ID {record_id} の波形ピーク生成に失敗 (続行します): {e}")
+    audio_seconds = len(pcm) / SAMPLE_RATE
+    del pcm
+    print(f"ID {record_id}: 長時間録音 ({audio_seconds / 60:.0f}分) のため、分割して処理します。")
+    return {
+        "pcm_path": pcm_path,
+        "sample_rate": SAMPLE_RATE,
+        "audio_seconds": audio_seconds,
+        "decode_seconds": time.monotonic() - started,
+    }
+
+
+def prepare_unknown_length(record_id: int, audio_file_path: str, started: float) -> Dict[str, Any]:
+    """
+    長さが分からない録音 (ffprobe が無い・解析できない) を処理する。
+    長い録音かもしれないので pydub に丸ごと読み込まず、まず ffmpeg で生 PCM に書き出してから長さで振り分ける。
+    LONG_RECORDING_SECONDS 以下なら PCM から wav を少しずつ書き出し、prepare_audio と同じ形で返す
+    """
+    import long_audio
+
+    pcm_path = _decode_pcm_file(audio_file_path)
+    audio_seconds = os.path.getsize(pcm_path) / (SAMPLE_WIDTH * SAMPLE_RATE)
+    if audio_seconds > LONG_RECORDING_SECONDS:
+        return prepare_long_audio(record_id, audio_file_path, started, pcm_path=pcm_path)
+
+    wav_path = prepared_path_for(audio_file_path)
+    pcm = long_audio.open_pcm(pcm_path)
+    try:
+        try:
+            write_peaks(audio_file_path, pcm, SAMPLE_RATE)
+        except Exception as e:
+            print(f"警告: ID {record_id} の波形ピーク生成に失敗 (続行します): {e}")
+        try:
+            with wave.open(wav_path, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(SAMPLE_WIDTH)
+                wav.setframerate(SAMPLE_RATE)
+                for i in range(0, len(pcm), WAV_CHUNK_SAMPLES):
+                    wav.writeframes(pcm[i:i + WAV_CHUNK_SAMPLES].tobytes())
+        except Exception as e:
+            raise AudioDecodeError(f"一時ファイルの書き出しに失敗: {e}")
+    finally:
+        del pcm
+        os.remove(pcm_path)
+    return {
+        "wav_path": wav_path,
+        "audio_seconds": audio_seconds,
+        "decode_seconds": time.monotonic() - started,
+    }
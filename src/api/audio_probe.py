@@ -0,0 +1,47 @@
+import shutil
+import subprocess
+from typing import Optional
+
+# --- 音声の長さの取得 (アップロード時) ---
+# スケジューラ (job_scheduler.py) が短いジョブを優先するために使う。
+# ffprobe (ffmpeg 同梱。ワーカーの pydub も利用) が無い・解析できない場合は None を返し、既定の見積もりで扱う。
+
+FFPROBE_TIMEOUT_SECONDS = 15
+
+
+def _ffprobe(args) -> Optional[str]:
+    exe = shutil.which("ffprobe")
+    if not exe:
+        return None
+    try:
+        out = subprocess.run([exe, "-v", "error", *args], capture_output=True, text=True, timeout=FFPROBE_TIMEOUT_SECONDS)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout if out.returncode == 0 else None
+
+
+def _to_seconds(value: str) -> Optional[float]:
+    try:
+        seconds = float(value)
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """音声ファイルの長さ (秒) を返す。取得できなければ None"""
+    out = _ffprobe(["-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path])
+    if out is None:
+        return None
+    seconds = _to_seconds(out.strip())
+    if seconds is not None:
+        return seconds
+    # MediaRecorder の WebM はヘッダーに長さが無い (N/A) ため、最後のパケットの時刻から求める
+    out = _ffprobe(["-select_streams", "a:0", "-show_entries", "packet=pts_time", "-of", "csv=p=0", path])
+    if not out:
+        return None
+    for line in reversed(out.split()):
+        seconds = _to_seconds(line.strip().rstrip(","))
+        if seconds is not None:
+            return seconds
+    return None
@@ -0,0 +1,100 @@
+import os
+import re
+from typing import Callable, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+# --- 音声ファイルの Range 配信 ---
+# <audio> 要素のシーク (スクラブ) は Range リクエストで行われるため、
+# 単一レンジの 206 Partial Content に対応する。複数レンジ指定は全体 (200) を返す。
+# ★ main.py の GZipMiddleware に圧縮させない。圧縮すると Content-Length・Content-Range がバイト位置と合わなくなり、
+# 206 が壊れる (Starlette の版によっては 206 や audio/* も圧縮する)。Content-Encoding を付けておけば
+# GZipMiddleware は版によらずそのまま通す
+
+CHUNK_SIZE = 64 * 1024
+
+AUDIO_MEDIA_TYPES = {
+    ".webm": "audio/webm",
+    ".ogg": "audio/ogg",
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+}
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def audio_media_type(path: str) -> str:
+    return AUDIO_MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Range ヘッダーを (start, end) (両端含む) に変換する。
+    ヘッダーが無い/解釈できない/複数レンジの場合は None (全体を返す)。
+    満たせない範囲の場合は 416 を送出する。
+    """
+    if not header:
+        return None
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None
+    first, last = m.group(1), m.group(2)
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # bytes=-N (末尾 N バイト)
+        length = int(last)
+        if length == 0:
+            raise HTTPException(416, headers={"Content-Range": f"bytes */{size}"})
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise HTTPException(416, headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+def _iter_file(opener: Callable, start: int, length: int) -> Iterator[bytes]:
+    with opener() as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def range_file_response(request: Request, path: str, media_type: Optional[str] = None) -> StreamingResponse:
+    stat = os.stat(path)
+    return range_response(request, stat.st_size, lambda: open(path, "rb"), f'"{int(stat.st_mtime)}-{stat.st_size}"', media_type or audio_media_type(path))
+
+
+def range_response(request: Request, size: int, opener: Callable, etag: str, media_type: str) -> StreamingResponse:
+    """opener() が返すシーク可能なファイルオブジェクト (通常ファイル・zipメンバー) を Range 配信する"""
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=3600",
+        "Content-Encoding": "identity",
+    }
+
+    byte_range = parse_range(request.headers.get("range"), size)
+    # If-Range が現在の版と一致しない場合は全体を返す
+    if_range = request.headers.get("if-range")
+    if byte_range is not None and if_range is not None and if_range != headers["ETag"]:
+        byte_range = None
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        # (同期ジェネレーターは StreamingResponse がスレッドプールで回す)
+        return StreamingResponse(_iter_file(opener, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_iter_file(opener, start, length), status_code=206, media_type=media_type, headers=headers)
@@ -0,0 +1,109 @@
+"""
+一覧APIのシリアライズ経路のベンチマーク (旧経路 vs 高速経路)
+
+  py .\\bench_serialization.py [行数]
+
+一時ディレクトリに care_events / caregivers を N 行作り、
+  旧: fetch_all → {**dict(r), ...} + ensure_utc_iso → Pydantic 検証 → JSON
+  新: fetch_all (SQL側でISO化) → rows_to_dicts → orjson
+の1行あたりのコストを比較する (本番の koeno_app.db には触れない)。
+"""
+
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import time
+from datetime import timezone
+from typing import List
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+REPEAT = 5
+
+# main.py は相対パス (./koeno_app.db) を使うため、一時ディレクトリに移動してからインポートする
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="koeno_bench_"))
+
+import sqlalchemy
+from pydantic import TypeAdapter
+
+from main import database, metadata, DATABASE_URL, care_events, caregivers, CareEventOutput, CaregiverInfo, ensure_utc_iso
+from fast_json import dumps, raw_json_column, rows_to_dicts, utc_iso_column
+
+
+async def seed():
+    engine = sqlalchemy.create_engine(DATABASE_URL)
+    metadata.create_all(engine)
+    base = datetime.datetime(2025, 1, 1, tzinfo=timezone.utc)
+    events = [
+        {
+            "user_id": "u1",
+            "event_timestamp": base + datetime.timedelta(seconds=i * 7, microseconds=i % 3),
+            "event_type": "care_touch",
+            "care_touch_data": {"place": "居室", "category": "食事", "tags": ["完食", "水分補給"], "conditions": ["スムーズ"], "note": f"メモ{i}", "timestamp": base.isoformat()},
+            "note_text": f"メモ{i}",
+            "recorded_by": "cg1",
+            "created_at": base,
+        }
+        for i in range(N_ROWS)
+    ]
+    people = [{"caregiver_id": f"cg{i}", "name": f"介護士{i}", "created_at": base + datetime.timedelta(minutes=i), "qr_token": f"tok{i}"} for i in range(N_ROWS)]
+    await database.execute_many(care_events.insert(), events)
+    await database.execute_many(caregivers.insert(), people)
+
+
+async def old_events() -> bytes:
+    rows = await database.fetch_all(care_events.select().order_by(care_events.c.event_timestamp.desc()))
+    data = [{**dict(r), "event_timestamp": ensure_utc_iso(r["event_timestamp"])} for r in rows]
+    return EVENTS_ADAPTER.dump_json(EVENTS_ADAPTER.validate_python(data))
+
+
+async def new_events() -> bytes:
+    q = sqlalchemy.select(
+        care_events.c.event_id, care_events.c.user_id, utc_iso_column(care_events.c.event_timestamp), care_events.c.event_type,
+        raw_json_column(care_events.c.care_touch_data), care_events.c.note_text, care_events.c.recorded_by,
+    ).order_by(care_events.c.event_timestamp.desc())
+    return dumps(rows_to_dicts(await database.fetch_all(q), ("care_touch_data",)))
+
+
+async def old_caregivers() -> bytes:
+    rows = await database.fetch_all(caregivers.select().order_by(caregivers.c.created_at.desc()))
+    data = [{**dict(r), "created_at": ensure_utc_iso(r["created_at"])} for r in rows]
+    return CAREGIVERS_ADAPTER.dump_json(CAREGIVERS_ADAPTER.validate_python(data))
+
+
+async def new_caregivers() -> bytes:
+    q = sqlalchemy.select(caregivers.c.caregiver_id, caregivers.c.name, utc_iso_column(caregivers.c.created_at), caregivers.c.qr_token).order_by(caregivers.c.created_at.desc())
+    return dumps(rows_to_dicts(await database.fetch_all(q)))
+
+
+EVENTS_ADAPTER = TypeAdapter(List[CareEventOutput])
+CAREGIVERS_ADAPTER = TypeAdapter(List[CaregiverInfo])
+
+
+async def measure(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+async def main():
+    await database.connect()
+    try:
+        await seed()
+        print(f"--- シリアライズ ベンチマーク ({N_ROWS} 行, {REPEAT} 回の最良値) ---")
+        for name, old, new in (("daily_events", old_events, new_events), ("admin/caregivers", old_caregivers, new_caregivers)):
+            t_old = await measure(old)
+            t_new = await measure(new)
+            print(f"{name:<18} 旧: {t_old * 1e6 / N_ROWS:7.2f} µs/行 ({t_old * 1000:7.1f} ms)"
+                  f"  新: {t_new * 1e6 / N_ROWS:7.2f} µs/行 ({t_new * 1000:7.1f} ms)  x{t_old / t_new:.1f}")
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
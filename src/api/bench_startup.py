@@ -0,0 +1,130 @@
+"""
+各エントリーポイントのインポート時間のベンチマーク
+
+  py .\\bench_startup.py [回数]
+  py .\\bench_startup.py --models [回数]
+
+それぞれのモジュールを新しい Python プロセスでインポートし、
+インポートにかかった時間 (最良値)・読み込まれたモジュール数・Web スタック (FastAPI / uvicorn) の有無を表示する。
+ワーカーや管理用スクリプトは db.py だけを使い、Web スタックを読み込まないことを確認する。
+(インポートのみで、DB への接続やモデルのロードは行わない。run_worker はモデルのロードを main() で行う)
+
+--models: AIワーカーの各モデルを新しいプロセスで読み込み、従来の読み込み (Hugging Face / whisper のキャッシュ) と
+          prepare_models.py の書き出しからの読み込み (メモリマップ) の時間を比べる。CPU で読み込む。
+          (2回目以降はOSのファイルキャッシュが効くため、最良値は「温まった」状態の時間になる。初回の値も表示する)
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+ARGS = [a for a in sys.argv[1:] if a != "--models"]
+MODELS = "--models" in sys.argv[1:]
+REPEAT = int(ARGS[0]) if ARGS else 3
+
+ENTRY_POINTS = [
+    ("main", "APIサーバー"),
+    ("db", "DB定義"),
+    ("run_worker", "AIワーカー"),
+    ("check_db", "DB確認"),
+    ("setup_initial_admin", "初回管理者"),
+    ("migrations", "マイグレーション"),
+    ("archive_job", "アーカイブ"),
+]
+
+WEB_STACK = ("fastapi", "starlette", "uvicorn")
+
+PROBE = (
+    "import sys, time\n"
+    "t = time.perf_counter()\n"
+    "import {module}\n"
+    "elapsed = time.perf_counter() - t\n"
+    "web = sorted({{m.split('.')[0] for m in sys.modules}} & set({web!r}))\n"
+    "print(elapsed, len(sys.modules), ','.join(web) or '-')\n"
+)
+
+MODEL_PROBE = (
+    "import time, torch, model_artifacts\n"
+    "t = time.perf_counter()\n"
+    "m = model_artifacts.{loader}({name!r}, torch.device('cpu'))\n"
+    "elapsed = time.perf_counter() - t\n"
+    "print(elapsed if m is not None else 'missing')\n"
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(module: str):
+    """(最良の秒数, モジュール数, Web スタック) を返す。インポートできなければ (None, エラー行, None)"""
+    env = {**os.environ, "PYTHONPATH": HERE + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    best = None
+    # (相対パスの koeno_app.db などを作らないよう、一時ディレクトリで実行する)
+    cwd = tempfile.mkdtemp(prefix="koeno_bench_")
+    for _ in range(REPEAT):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, web=WEB_STACK)], capture_output=True, text=True, cwd=cwd, env=env)
+        if out.returncode != 0:
+            lines = out.stderr.strip().splitlines()
+            return None, lines[-1] if lines else "?", None
+        elapsed, n_modules, web = out.stdout.strip().splitlines()[-1].split(" ")
+        best = float(elapsed) if best is None else min(best, float(elapsed))
+    return best, int(n_modules), web
+
+
+def measure_model(name: str, loader: str):
+    """(初回の秒数, 最良の秒数) を返す。書き出しが無ければ ('missing', None)、失敗すれば (None, エラー行)"""
+    env = {**os.environ, "PYTHONPATH": HERE + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    times = []
+    for _ in range(REPEAT):
+        # (相対パスの pretrained_models/ を使い回すため、カレントディレクトリはこのディレクトリのまま)
+        out = subprocess.run([sys.executable, "-c", MODEL_PROBE.format(loader=loader, name=name)], capture_output=True, text=True, cwd=HERE, env=env)
+        if out.returncode != 0:
+            lines = out.stderr.strip().splitlines()
+            return None, lines[-1] if lines else "?"
+        last = out.stdout.strip().splitlines()[-1]
+        if last == "missing":
+            return "missing", None
+        times.append(float(last))
+    return times[0], min(times)
+
+
+def main_models():
+    import model_artifacts
+
+    print(f"--- モデルの読み込み時間のベンチマーク (初回 / {REPEAT} 回の最良値、CPU) ---")
+    current = model_artifacts.current_artifact_dir() or "なし (py .\\prepare_models.py で作成)"
+    print(f"書き出し: {current}")
+    print(f"{'model':<18}{'source':>18}{'artifact':>18}  speedup")
+    for name in model_artifacts.MODEL_SOURCES:
+        cells = []
+        best = {}
+        for loader in ("load_from_source", "load_from_artifact"):
+            first, value = measure_model(name, loader)
+            if first is None:
+                cells.append(f"{'failed':>18}")
+                print(f"  ({name} {loader}: {value})")
+            elif first == "missing":
+                cells.append(f"{'-':>18}")
+            else:
+                best[loader] = value
+                cells.append(f"{first:7.2f}s /{value:6.2f}s")
+        speedup = f"x{best['load_from_source'] / best['load_from_artifact']:.1f}" if len(best) == 2 and best["load_from_artifact"] > 0 else "-"
+        print(f"{name:<18}{cells[0]}{cells[1]}  {speedup}")
+
+
+def main():
+    if MODELS:
+        main_models()
+        return
+    print(f"--- インポート時間のベンチマーク ({REPEAT} 回の最良値) ---")
+    print(f"{'module':<22}{'time':>8}{'modules':>9}  web stack")
+    for module, label in ENTRY_POINTS:
+        elapsed, n_modules, web = measure(module)
+        if elapsed is None:
+            print(f"{module:<22}{'failed':>8}  {n_modules}  ({label})")
+        else:
+            print(f"{module:<22}{elapsed * 1000:6.0f}ms{n_modules:>9}  {web:<26}({label})")
+
+
+if __name__ == "__main__":
+    main()
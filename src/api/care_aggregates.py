@@ -0,0 +1,90 @@
+import datetime
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# --- ケア記録 (care_events) の日別集計 ---
+# 月次ダッシュボードのために care_events を毎回読んで JSON を解析しなくて済むよう、
+# (入居者, JSTの日付, event_type, カテゴリ, 種別, 項目) ごとの件数を care_touch_daily に持つ。
+# save_event / delete_event で差分 (新しい件数 - 古い件数) だけを加減する。
+#   種別 (item_kind): event … イベント件数 (item は空) / tag … 実施内容 (完食・排尿 など)
+#                     condition … 状態 (拒否あり など) / place … 場所
+# カテゴリは care_touch_data.category (life_schema.json の label。例: 食事, 排泄)。
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+# (user_id, record_date, event_type, category, item_kind, item)
+AggregateKey = Tuple[str, str, str, str, str, str]
+
+
+def jst_date(ts: Any) -> str:
+    if isinstance(ts, str):
+        ts = datetime.datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return ts.astimezone(JST).date().isoformat()
+
+
+def event_counts(user_id: str, event_timestamp: Any, event_type: Optional[str], care_touch_data: Any) -> Counter:
+    """1件のイベントが集計表に寄与する件数を返す"""
+    counts: Counter = Counter()
+    if not user_id or event_timestamp is None:
+        return counts
+    data = care_touch_data if isinstance(care_touch_data, dict) else {}
+    base = (user_id, jst_date(event_timestamp), event_type or "care_touch", str(data.get("category") or ""))
+    counts[base + ("event", "")] += 1
+    for kind, field in (("tag", "tags"), ("condition", "conditions")):
+        values = data.get(field)
+        if isinstance(values, list):
+            for v in values:
+                counts[base + (kind, str(v))] += 1
+    if data.get("place"):
+        counts[base + ("place", str(data["place"]))] += 1
+    return counts
+
+
+def event_delta(old: Optional[Counter], new: Optional[Counter]) -> Dict[AggregateKey, int]:
+    """更新前後の件数の差分 (0 の項目は除く)"""
+    delta: Counter = Counter(new or {})
+    delta.subtract(old or {})
+    return {k: v for k, v in delta.items() if v}
+
+
+def upsert_statement(table, key: AggregateKey, delta: int):
+    """件数に delta を加える INSERT ... ON CONFLICT DO UPDATE (行が無ければ作る)"""
+    values = dict(zip(("user_id", "record_date", "event_type", "category", "item_kind", "item"), key), total=delta)
+    stmt = sqlite_insert(table).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.record_date, table.c.event_type, table.c.category, table.c.item_kind, table.c.item],
+        set_={"total": table.c.total + stmt.excluded.total},
+    )
+
+
+def summarize(rows: Iterable[Any]) -> Dict[str, Any]:
+    """
+    集計表の行を月次ダッシュボード用の形にする。
+    {"days": [{"date", "categories": {カテゴリ: {events, tags, conditions, places}}}], "totals": {カテゴリ: {...}}}
+    """
+    def empty():
+        return {"events": 0, "tags": {}, "conditions": {}, "places": {}}
+
+    def add(bucket, kind, item, count):
+        if kind == "event":
+            bucket["events"] += count
+        else:
+            group = bucket[kind + "s"]
+            group[item] = group.get(item, 0) + count
+
+    days: Dict[str, Dict[str, Any]] = {}
+    totals: Dict[str, Any] = {}
+    for r in rows:
+        if r.item_kind not in ("event", "tag", "condition", "place"):
+            continue
+        day = days.setdefault(r.record_date, {})
+        add(day.setdefault(r.category, empty()), r.item_kind, r.item, r.total)
+        add(totals.setdefault(r.category, empty()), r.item_kind, r.item, r.total)
+    return {
+        "days": [{"date": d, "categories": days[d]} for d in sorted(days)],
+        "totals": totals,
+    }
@@ -0,0 +1,120 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from care_aggregates import jst_date
+
+# --- care_touch_data の項目索引 ---
+# care_touch_data は JSON のままでは中身で絞り込めない (全件を読んで解析するしかない) ため、
+# 記録画面の定義 (web-v2/src/data/life_schema.json) に載っている項目だけを
+# 細い索引テーブル care_touch_index (1項目 = 1行) に取り出しておく。
+#   field: category (食事 など) / tag (完食 など。カテゴリの items) / condition (拒否あり など) / place (居室 など)
+#   category: その項目が属するカテゴリ (同じ tag 名が複数カテゴリにあるため。例: 拒否)
+# 定義に無い値 (自由入力など) は索引に入れない。
+
+LIFE_SCHEMA_PATH = os.environ.get(
+    "KOENO_LIFE_SCHEMA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "web-v2", "src", "data", "life_schema.json"),
+)
+
+INDEXED_FIELDS = ("category", "tag", "condition", "place")
+
+
+class LifeSchema:
+    """life_schema.json から、索引にする項目と取りうる値を読み出したもの"""
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.version = schema.get("version")
+        self.places: Set[str] = set(schema.get("places", []))
+        self.conditions: Set[str] = set(schema.get("conditions", []))
+        self.categories: Dict[str, Set[str]] = {}
+        self.category_ids: Dict[str, str] = {}
+        for c in schema.get("categories", []):
+            self.categories[c["label"]] = set(c.get("items", []))
+            self.category_ids[c["id"]] = c["label"]
+
+    def category_label(self, value: Any) -> Optional[str]:
+        """カテゴリは label (食事) で保存されるが、id (meal) でも受け付ける"""
+        if value in self.categories:
+            return value
+        return self.category_ids.get(value)
+
+    def allowed_values(self, field: str, category: Optional[str] = None) -> Set[str]:
+        if field == "category":
+            return set(self.categories)
+        if field == "condition":
+            return self.conditions
+        if field == "place":
+            return self.places
+        if field == "tag":
+            if category:
+                return self.categories.get(category, set())
+            return set().union(*self.categories.values()) if self.categories else set()
+        return set()
+
+
+_schema: Optional[LifeSchema] = None
+
+
+def load_schema() -> LifeSchema:
+    global _schema
+    if _schema is None:
+        with open(LIFE_SCHEMA_PATH, encoding="utf-8") as f:
+            _schema = LifeSchema(json.load(f))
+    return _schema
+
+
+def _entries(care_touch_data: Any) -> List[Dict[str, Any]]:
+    # (イベントは CareTouchRecord 1件。日報側はリストや {"events": [...]} で複数件持つ場合にも対応する)
+    if isinstance(care_touch_data, dict):
+        for key in ("events", "items", "records"):
+            if isinstance(care_touch_data.get(key), list):
+                return [e for e in care_touch_data[key] if isinstance(e, dict)]
+        return [care_touch_data]
+    if isinstance(care_touch_data, list):
+        return [e for e in care_touch_data if isinstance(e, dict)]
+    return []
+
+
+def extract_fields(care_touch_data: Any, schema: Optional[LifeSchema] = None) -> List[Dict[str, str]]:
+    """care_touch_data から索引にする {category, field, value} を重複なく取り出す"""
+    schema = schema or load_schema()
+    out = []
+    seen = set()
+
+    def add(category: str, field: str, value: Any):
+        if not isinstance(value, str) or value not in schema.allowed_values(field, category or None):
+            return
+        key = (category, field, value)
+        if key not in seen:
+            seen.add(key)
+            out.append({"category": category, "field": field, "value": value})
+
+    for entry in _entries(care_touch_data):
+        category = schema.category_label(entry.get("category")) or ""
+        if category:
+            add(category, "category", category)
+        for tag in entry.get("tags") or []:
+            add(category, "tag", tag)
+        for cond in entry.get("conditions") or []:
+            add(category, "condition", cond)
+        add(category, "place", entry.get("place"))
+    return out
+
+
+def index_rows(source: str, source_id: int, user_id: str, record_date: str, care_touch_data: Any) -> List[Dict[str, Any]]:
+    """care_touch_index に挿入する行 (source: event / record)"""
+    return [
+        {"source": source, "source_id": source_id, "user_id": user_id, "record_date": record_date, **f}
+        for f in extract_fields(care_touch_data)
+    ]
+
+
+def event_index_rows(event_id: int, user_id: str, event_timestamp: Any, care_touch_data: Any) -> List[Dict[str, Any]]:
+    if event_timestamp is None:
+        return []
+    return index_rows("event", event_id, user_id, jst_date(event_timestamp), care_touch_data)
+
+
+def record_index_rows(care_record_id: int, user_id: str, record_date: str, care_touch_data: Any) -> List[Dict[str, Any]]:
+    return index_rows("record", care_record_id, user_id, record_date, care_touch_data)
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from typing import Any, Dict
+
+import sqlalchemy
+
+from db import care_events, care_records, recording_assignments, recordings, sync_changes
+from fast_json import raw_json_column, rows_to_dicts, utc_iso_column
+
+# --- 端末の差分同期 (GET /sync/changes) ---
+# PWA のローカルストア (Dexie) が、前回受け取ったカーソル以降に作成・更新・削除された行だけを取りに来る。
+# 変更の記録は db.py のトリガーが sync_changes に1行ずつ残す (行ごとに最後の変更だけ。seq が行の版)。
+# ここでは seq > cursor の記録を seq 順に limit 件読み、各行の今の内容を実テーブルからまとめて引く。
+#   - 削除された行は墓標 (deleted: true, data なし) として返す
+#   - 同じ行が何度変わっても記録は1行なので、長く離れていた端末も最新の内容を1回受け取るだけで済む
+#   - SQLite は書き込みが1本ずつなので、seq はコミット順に増える (小さい seq が後から現れることはない)
+# カーソル 0 は初回 (全件)。サーバーの最新より大きいカーソル (DB を作り直した等) には reset: true を返し、
+# 端末はローカルの同期データを捨てて 0 から取り直す。
+# 録音 (recordings) と録音ごとの割当 (assignments) は録音した本人の分だけを返す (/recording_transcription と同じ)。
+# 他の人の分は読み飛ばす。墓標も、トリガーが記録した持ち主 (sync_changes.caregiver_id) で同じように絞る
+# (持ち主の分からない墓標は誰にも返さない。他の人の録音IDや削除時刻を漏らさないため)。
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+
+async def _load_care_events(database, keys):
+    q = sqlalchemy.select(
+        care_events.c.event_id, care_events.c.user_id, utc_iso_column(care_events.c.event_timestamp), care_events.c.event_type,
+        raw_json_column(care_events.c.care_touch_data), care_events.c.note_text, care_events.c.recorded_by, utc_iso_column(care_events.c.updated_at),
+    ).where(care_events.c.event_id.in_(keys))
+    return {r["event_id"]: r for r in rows_to_dicts(await database.fetch_all(q), ("care_touch_data",))}
+
+
+async def _load_care_records(database, keys):
+    q = sqlalchemy.select(
+        care_records.c.care_record_id, care_records.c.user_id, care_records.c.record_date, care_records.c.final_text,
+        raw_json_column(care_records.c.care_touch_data), care_records.c.last_updated_by, utc_iso_column(care_records.c.updated_at),
+    ).where(care_records.c.care_record_id.in_(keys))
+    return {r["care_record_id"]: r for r in rows_to_dicts(await database.fetch_all(q), ("care_touch_data",))}
+
+
+async def _load_recordings(database, keys):
+    q = sqlalchemy.select(
+        recordings.c.recording_id, recordings.c.caregiver_id, recordings.c.memo_text, recordings.c.ai_status,
+        utc_iso_column(recordings.c.created_at), utc_iso_column(recordings.c.updated_at),
+    ).where(recordings.c.recording_id.in_(keys))
+    return {r["recording_id"]: r for r in rows_to_dicts(await database.fetch_all(q))}
+
+
+async def _load_assignments(database, keys):
+    """録音ごとの割当 (入居者の一覧と割当の版)。スナップショット本体は大きいので含めない (必要なら /recording_transcription)"""
+    q = sqlalchemy.select(recordings.c.recording_id, recordings.c.caregiver_id, utc_iso_column(recordings.c.created_at), recordings.c.assignment_version).where(recordings.c.recording_id.in_(keys))
+    out = {r["recording_id"]: {**r, "user_ids": []} for r in rows_to_dicts(await database.fetch_all(q))}
+    users = sqlalchemy.select(recording_assignments.c.recording_id, recording_assignments.c.user_id).where(recording_assignments.c.recording_id.in_(keys)).order_by(recording_assignments.c.assignment_id)
+    for r in await database.fetch_all(users):
+        if r.recording_id in out:
+            out[r.recording_id]["user_ids"].append(r.user_id)
+    return out
+
+
+# 録音した本人 (caregiver_id) にだけ返すもの
+_OWNED_ENTITIES = ("recordings", "assignments")
+
+_LOADERS = {
+    "care_events": _load_care_events,
+    "care_records": _load_care_records,
+    "recordings": _load_recordings,
+    "assignments": _load_assignments,
+}
+
+
+async def latest_cursor(database) -> int:
+    return await database.fetch_val(sqlalchemy.select(sqlalchemy.func.coalesce(sqlalchemy.func.max(sync_changes.c.seq), 0)))
+
+
+async def fetch_changes(database, cursor: int, caller: str, limit: int = DEFAULT_LIMIT) -> Dict[str, Any]:
+    """
+    cursor より後の変更を最大 limit 件返す: {"cursor", "has_more", "reset", "changes": [{entity, id, version, deleted, data}]}
+    (呼び出し側の読み取りトランザクション内で呼ぶこと。記録と行の内容を同じスナップショットで読む)
+    """
+    latest = await latest_cursor(database)
+    if cursor > latest:
+        return {"cursor": 0, "has_more": True, "reset": True, "changes": []}
+
+    q = sqlalchemy.select(sync_changes.c.seq, sync_changes.c.entity, sync_changes.c.entity_key, sync_changes.c.deleted, sync_changes.c.caregiver_id).where(sync_changes.c.seq > cursor)
+    log = await database.fetch_all(q.order_by(sync_changes.c.seq).limit(limit + 1))
+    has_more = len(log) > limit
+    log = log[:limit]
+
+    keys = defaultdict(list)
+    for r in log:
+        if not r.deleted:
+            keys[r.entity].append(r.entity_key)
+    rows = {entity: await _LOADERS[entity](database, ids) for entity, ids in keys.items() if entity in _LOADERS}
+
+    changes = []
+    for r in log:
+        data = None if r.deleted else rows.get(r.entity, {}).get(r.entity_key)
+        if r.entity in _OWNED_ENTITIES and (data["caregiver_id"] if data is not None else r.caregiver_id) != caller:
+            continue
+        changes.append({"entity": r.entity, "id": r.entity_key, "version": r.seq, "deleted": data is None, "data": data})
+    # (読み飛ばした記録もカーソルは進める。次回は続きから)
+    return {"cursor": log[-1].seq if log else cursor, "has_more": has_more, "reset": False, "changes": changes}
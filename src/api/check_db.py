@@ -1,5 +1,5 @@
 import asyncio
-from main import database, recordings
+from db import database, recordings
 
 async def check_database():
     """
@@ -0,0 +1,181 @@
+"""
+[デコード用プロセスの停止の確認] 先読み中にデコード用プロセスが落ちても、ワーカーのパイプラインが止まらず全件を処理しきるか確認する (モデル不要)
+
+  py .\\check_decode_pool.py [--recordings 24] [--prefetch 4] [--crashes 3]
+
+DB の代わりにメモリ上のジョブ (FakeJobs) を worker_pipeline.WorkerPipeline に渡し、
+ダミーのデコード (少し待つだけ) とダミーの推論で録音を流す。
+途中の録音のデコードでプロセスごと落とし (os._exit)、先読み中のデコードをまとめて BrokenProcessPool にする。
+推論段はデコード結果を見る前に少し待つ (LateNotifyPipeline)。古いプールの録音の失敗を、作り直したプールに
+次のデコードが投げられた後で受け取る順序を毎回起こすため。
+確認すること:
+  - パイプラインが例外で止まらない (落ちたプールに投げても作り直して投げ直す。新しいプールに投げたデコードを取り消さない)
+  - 1回落ちるごとにプールを作り直すのは1回だけ (古いプールの録音の失敗が後から届いても、作り直したプールを止めない)
+  - 全件が completed になる (プールの停止で失敗・取り消しになった録音は再試行される)
+  - 同じ録音を2回書き戻していない
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import worker_pipeline
+
+DECODE_SECONDS = 0.2
+INFER_SECONDS = 0.05
+# (DB・ジョブ API の往復の代わり。取得の途中でプールが落ちる場合も起こるようにする)
+JOB_API_SECONDS = 0.01
+# 推論段がデコード結果を見る前に待つ時間 (JOB_API_SECONDS より長く)
+NOTIFY_LAG_SECONDS = 0.05
+TIMEOUT_SECONDS = 120
+
+
+def fake_decode(record_id: int, audio_file_path: str):
+    """(プロセスプールで実行) 印のファイルがある録音は、印を消してからプロセスごと落ちる"""
+    time.sleep(DECODE_SECONDS)
+    crash_marker = audio_file_path + ".crash"
+    if os.path.exists(crash_marker):
+        os.remove(crash_marker)
+        os._exit(1)
+    return {"audio_seconds": 1.0}
+
+
+async def fake_infer(record_id: int, prepared):
+    await asyncio.sleep(INFER_SECONDS)
+    return [{"speaker": "SPEAKER_00", "start": 0.0, "end": 1.0, "text": str(record_id)}], prepared["audio_seconds"]
+
+
+class LateNotifyPipeline(worker_pipeline.WorkerPipeline):
+    """
+    プールが落ちた通知が録音ごとに遅れて届く場合を再現する: 推論段は各録音のデコード結果を見る前に少し待つ。
+    その間に取得段が作り直したプールへ次のデコードを投げるので、古いプールの録音の失敗が後から届いても
+    新しいプールを止めない (新しいデコードを取り消さない) ことを確かめられる
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # デコードを投げたプール (1回落ちるごとに作り直すのは1回だけなので、落とした回数 + 1 個になるはず)
+        self.pools_used = []
+
+    async def _decoded(self, item):
+        if not any(p is item.pool for p in self.pools_used):
+            self.pools_used.append(item.pool)
+        await asyncio.sleep(NOTIFY_LAG_SECONDS)
+        return await super()._decoded(item)
+
+
+class FakeJobs:
+    """job_queue と同じ名前の関数を持つメモリ上のジョブ (リースの期限切れは扱わない)"""
+
+    HEARTBEAT_SECONDS = 60
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, paths):
+        self.pending = list(range(len(paths)))
+        self.paths = paths
+        self.attempts = {rid: 0 for rid in self.pending}
+        self.status = {rid: "pending" for rid in self.pending}
+        self.completed_count = {rid: 0 for rid in self.pending}
+
+    async def expire_exhausted(self):
+        return []
+
+    async def claim_job(self, worker_id: str):
+        await asyncio.sleep(JOB_API_SECONDS)
+        if not self.pending:
+            return None
+        rid = self.pending.pop(0)
+        self.attempts[rid] += 1
+        self.status[rid] = "processing"
+        return SimpleNamespace(recording_id=rid, audio_file_path=self.paths[rid], attempts=self.attempts[rid], transcription_tier=None)
+
+    async def heartbeat(self, record_id: int, worker_id: str) -> bool:
+        return True
+
+    async def complete_job(self, record_id: int, worker_id: str, result_data, audio_duration=None, processing_seconds=None) -> bool:
+        await asyncio.sleep(JOB_API_SECONDS)
+        self.status[record_id] = "completed"
+        self.completed_count[record_id] += 1
+        return True
+
+    async def fail_job(self, record_id: int, worker_id: str, error: str, retryable: bool = True):
+        await asyncio.sleep(JOB_API_SECONDS)
+        if retryable and self.attempts[record_id] < self.MAX_ATTEMPTS:
+            self.status[record_id] = "pending"
+            self.pending.append(record_id)
+        else:
+            self.status[record_id] = "failed"
+        return self.status[record_id]
+
+    def finished(self) -> bool:
+        return all(s in ("completed", "failed") for s in self.status.values())
+
+
+async def run_check(n: int, prefetch: int, crashes: int, workdir: str):
+    paths = []
+    for i in range(n):
+        path = os.path.join(workdir, f"check_{i:03d}.webm")
+        open(path, "wb").close()
+        paths.append(path)
+    # 先読みが溜まった後の録音を、間隔をあけて落とす
+    for k in range(crashes):
+        open(paths[min(n - 1, prefetch + 1 + k * (n // max(1, crashes)))] + ".crash", "wb").close()
+
+    jobs = FakeJobs(paths)
+    worker_pipeline.IDLE_POLL_SECONDS = 0.2
+    pipeline = LateNotifyPipeline("check-decode-pool", decode=fake_decode, infer=fake_infer, prefetch=prefetch, decode_processes=2, jobs=jobs)
+    task = asyncio.create_task(pipeline.run())
+    started = time.monotonic()
+    failures = []
+    while not jobs.finished() and time.monotonic() - started < TIMEOUT_SECONDS:
+        if task.done():
+            failures.append(f"パイプラインが止まりました: {task.exception()!r}" if not task.cancelled() else "パイプラインが取り消されました")
+            break
+        await asyncio.sleep(0.1)
+    elapsed = time.monotonic() - started
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+    for rid, status in jobs.status.items():
+        if status != "completed":
+            failures.append(f"ID {rid} が {status} のままです (試行 {jobs.attempts[rid]} 回)")
+        if jobs.completed_count[rid] > 1:
+            failures.append(f"ID {rid} を {jobs.completed_count[rid]} 回書き戻しました")
+    if len(pipeline.pools_used) != crashes + 1:
+        failures.append(f"デコード用プロセスプールを {len(pipeline.pools_used) - 1} 回作り直しました (落とした回数 {crashes})")
+    retried = sum(1 for a in jobs.attempts.values() if a > 1)
+    print(f"処理時間: {elapsed:.1f}秒 / 再試行された件数: {retried} / 使ったプール: {len(pipeline.pools_used)} 個")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="デコード用プロセスが落ちたときのパイプラインの動作確認")
+    parser.add_argument("--recordings", type=int, default=24)
+    parser.add_argument("--prefetch", type=int, default=4, help="先読みする件数")
+    parser.add_argument("--crashes", type=int, default=3, help="デコード用プロセスを落とす回数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="koeno_decode_pool_")
+    try:
+        failures = asyncio.run(run_check(args.recordings, args.prefetch, args.crashes, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print("--- 失敗 ---")
+        for f in failures:
+            print(f"  {f}")
+        sys.exit(1)
+    print("--- OK: デコード用プロセスが落ちても全件を処理しました ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+[長時間録音の窓の確認] long_audio.plan_windows が録音をむだなく窓に分けているか確認する (モデル不要)
+
+  py .\\check_long_audio.py [--max-seconds 14400] [--step 0.5]
+
+録音の長さを step 秒刻みで変えながら窓の計画を作り、次を確かめる:
+  - 窓は録音の先頭から終わりまで隙間なく覆う
+  - 隣の窓との重なりは OVERLAP_SECONDS ちょうど (最後の窓を前に引き戻して同じ区間を二度処理しない)
+  - 窓の長さは WINDOW_SECONDS + OVERLAP_SECONDS 以下 (最後の窓を前の窓に併合した場合も)
+  - 担当範囲 (core) は録音全体を重なりなく分ける
+  - 1190秒 (前の窓の終わりから20秒だけ残る長さ) は2窓 [0, 600], [570, 1190] になる
+"""
+
+import argparse
+import sys
+
+import long_audio
+
+EPSILON = 1e-6
+
+
+def check_plan(total: float, window: float, overlap: float) -> list:
+    errors = []
+    windows = long_audio.plan_windows(total, window, overlap)
+    if abs(windows[0].start) > EPSILON or abs(windows[-1].end - total) > EPSILON:
+        errors.append(f"録音の先頭・終わりを覆っていません: {windows}")
+    if abs(windows[0].core_start) > EPSILON or abs(windows[-1].core_end - total) > EPSILON:
+        errors.append(f"担当範囲が録音全体を覆っていません: {windows}")
+    for w in windows:
+        if w.end - w.start > window + overlap + EPSILON:
+            errors.append(f"窓が長すぎます: {w}")
+        if not (w.start - EPSILON <= w.core_start <= w.core_end <= w.end + EPSILON):
+            errors.append(f"担当範囲が窓の外にあります: {w}")
+    for prev, cur in zip(windows, windows[1:]):
+        if abs((prev.end - cur.start) - overlap) > EPSILON:
+            errors.append(f"窓の重なりが {overlap} 秒ではありません: {prev} → {cur}")
+        if abs(prev.core_end - cur.core_start) > EPSILON:
+            errors.append(f"担当範囲に隙間・重なりがあります: {prev} → {cur}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="長時間録音の窓の計画を確認する")
+    parser.add_argument("--max-seconds", type=float, default=4 * 3600, help="確かめる録音の長さの上限 (秒)")
+    parser.add_argument("--step", type=float, default=0.5, help="録音の長さの刻み (秒)")
+    args = parser.parse_args()
+
+    window, overlap = long_audio.WINDOW_SECONDS, long_audio.OVERLAP_SECONDS
+    failures = 0
+    total = args.step
+    while total <= args.max_seconds:
+        errors = check_plan(total, window, overlap)
+        if errors:
+            failures += 1
+            if failures <= 10:
+                print(f"NG {total}秒:")
+                for e in errors:
+                    print(f"  {e}")
+        total += args.step
+
+    expected = [(0.0, 600.0), (570.0, 1190.0)]
+    got = [(w.start, w.end) for w in long_audio.plan_windows(1190.0, 600.0, 30.0)]
+    if got != expected:
+        failures += 1
+        print(f"NG 1190秒: {got} (期待: {expected})")
+
+    if failures:
+        print(f"--- 失敗: {failures} 件 ---")
+        sys.exit(1)
+    print(f"--- OK: {args.step}〜{args.max_seconds} 秒の録音の窓の計画を確認しました ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+[ジョブ API の確認] API サーバーと複数の別プロセスのワーカーを起動し、ジョブ API だけで録音を処理しきれるか確認する
+
+  py .\\check_remote_workers.py [--recordings 24] [--workers 3]
+
+一時ディレクトリに API サーバー (uvicorn main:app) を起動し、ダミーの録音を登録してから、
+ワーカー (KOENO_JOB_SERVER を設定した remote_jobs.RemoteJobs + WorkerPipeline) を別プロセスで複数起動する。
+ワーカーはモデルを使わず、ダウンロードした音声のハッシュを結果として書き戻す (モデルのロード不要)。
+途中で1台目のワーカーを録音を抱えている最中に強制終了し、そのワーカーが抱えていた録音がリース切れの後に他のワーカーへ回ることも確かめる。
+確認すること:
+  - 全件が completed になる (強制終了したワーカーのリースも回収される)
+  - API サーバーが 5xx を返していない・未処理の例外 (Exception in ASGI application) を出していない
+    (最終状態だけでは、500 で捨てられて再処理された結果を見逃すため)
+  - 2回以上取得された録音は、強制終了したワーカーが抱えていたものだけ
+  - 結果のハッシュが登録した音声と一致する (ダウンロードが正しい)
+  - 同じ録音を2台が書き戻していない (取得はリースで1台だけ)
+  - 波形ピークがサーバー側に保存されている
+  - トークンが違うリクエストは 401
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOKEN = "check-remote-workers"
+LEASE_SECONDS = 4
+JOB_SECONDS = 0.3
+KILL_AFTER_SECONDS = 1.5
+KILLED_SETTLE_SECONDS = 0.5
+TIMEOUT_SECONDS = 120
+# uvicorn のアクセスログの行 ('"POST /jobs/3/complete HTTP/1.1" 500')
+ACCESS_LOG_5XX = re.compile(r'"[A-Z]+ (\S+) HTTP/[\d.]+" 5\d\d')
+
+
+# --- ワーカー側 (--worker で起動された子プロセス) ---
+
+def fake_decode(record_id: int, audio_file_path: str):
+    """(プロセスプールで実行) 音声を読んでハッシュを取り、波形ピークを書き出す"""
+    from waveform_peaks import write_peaks
+
+    with open(audio_file_path, "rb") as f:
+        data = f.read()
+    write_peaks(audio_file_path, [0, 1000, -1000] * 1000, 16000)
+    return {"digest": hashlib.sha256(data).hexdigest(), "audio_seconds": 1.0}
+
+
+async def fake_infer(record_id: int, prepared):
+    from status_bus import publish_status
+
+    publish_status(record_id, "processing", stage="transcription", progress=0.5)
+    await asyncio.sleep(JOB_SECONDS)
+    segment = {"speaker": "SPEAKER_00", "start": 0.0, "end": 1.0, "text": prepared["digest"], "worker": os.environ["CHECK_WORKER_NAME"]}
+    return [segment], prepared["audio_seconds"]
+
+
+async def run_fake_worker():
+    import remote_jobs
+    import worker_pipeline
+    from status_bus import set_publisher
+
+    worker_pipeline.IDLE_POLL_SECONDS = 0.5
+    jobs = remote_jobs.RemoteJobs(remote_jobs.JOB_SERVER, remote_jobs.WORKER_TOKEN)
+    set_publisher(jobs.publish)
+    progress_task = asyncio.create_task(jobs.progress_loop())
+    try:
+        pipeline = worker_pipeline.WorkerPipeline(f"{os.environ['CHECK_WORKER_NAME']}:{os.getpid()}", decode=fake_decode, infer=fake_infer, jobs=jobs, decode_processes=1)
+        await pipeline.run()
+    finally:
+        progress_task.cancel()
+
+
+# --- 親プロセス ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request_status(url: str, token: str) -> int:
+    req = urllib.request.Request(url, data=b'{"worker_id": "x"}', headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=5) as res:
+            return res.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def wait_for_server(base_url: str, server: subprocess.Popen) -> None:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("API サーバーが起動できませんでした")
+        try:
+            request_status(base_url + "/jobs/claim", "wrong-token")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("API サーバーの起動を待てませんでした")
+
+
+def seed_recordings(workdir: str, n: int):
+    """ダミーの録音を pending で登録し、{recording_id: sha256} を返す"""
+    import datetime
+
+    import sqlalchemy
+
+    from db import recordings
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(workdir, 'koeno_app.db')}")
+    upload_dir = os.path.join(workdir, "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    digests = {}
+    now = datetime.datetime.now(datetime.UTC)
+    with engine.begin() as conn:
+        for i in range(n):
+            data = os.urandom(4096 + i * 512)
+            path = os.path.join(upload_dir, f"check_{i:03d}.webm")
+            with open(path, "wb") as f:
+                f.write(data)
+            rid = conn.execute(recordings.insert().values(
+                caregiver_id="check", audio_file_path=path, memo_text="check", ai_status="pending",
+                created_at=now, updated_at=now, queued_at=now, audio_duration=1.0 + i,
+            )).inserted_primary_key[0]
+            digests[rid] = hashlib.sha256(data).hexdigest()
+    return engine, digests
+
+
+def fetch_rows(engine):
+    import sqlalchemy
+
+    from db import recordings
+
+    with engine.connect() as conn:
+        return conn.execute(sqlalchemy.select(
+            recordings.c.recording_id, recordings.c.ai_status, recordings.c.attempts,
+            recordings.c.transcription_result, recordings.c.audio_file_path,
+        )).fetchall()
+
+
+def rows_leased_by(engine, worker_name: str):
+    """worker_name のワーカーがリースを持っている録音ID"""
+    import sqlalchemy
+
+    from db import recordings
+
+    with engine.connect() as conn:
+        return set(conn.execute(sqlalchemy.select(recordings.c.recording_id).where(
+            (recordings.c.ai_status == "processing") & recordings.c.lease_owner.startswith(worker_name + ":")
+        )).scalars())
+
+
+def server_errors(log_path: str) -> list:
+    """API サーバーのログから、未処理の例外と 5xx の応答を拾う"""
+    errors = []
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if "Exception in ASGI application" in line:
+                errors.append("API サーバーで未処理の例外が発生しました")
+            m = ACCESS_LOG_5XX.search(line)
+            if m:
+                errors.append(f"API サーバーが 5xx を返しました: {line.strip()}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ジョブ API と複数ワーカーの動作確認")
+    parser.add_argument("--recordings", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        asyncio.run(run_fake_worker())
+        return
+
+    from waveform_peaks import peaks_path_for
+
+    workdir = tempfile.mkdtemp(prefix="koeno_remote_")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "PYTHONPATH": HERE + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "KOENO_WORKER_TOKENS": TOKEN,
+        "KOENO_JOB_LEASE_SECONDS": str(LEASE_SECONDS),
+        "KOENO_JOB_HEARTBEAT_SECONDS": "1",
+        "KOENO_STATUS_BUS_PORT": str(free_port()),
+    }
+    # (アクセスログで 5xx を拾うため info。標準出力・標準エラーともファイルに残す)
+    server_log_path = os.path.join(workdir, "server.log")
+    server_log = open(server_log_path, "w", encoding="utf-8")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "info"], cwd=workdir, env={**env, "PYTHONUNBUFFERED": "1"}, stdout=server_log, stderr=subprocess.STDOUT)
+    workers = []
+    logs = []
+    failures = []
+    try:
+        wait_for_server(base_url, server)
+        print(f"--- API サーバー起動 ({base_url}, 作業ディレクトリ {workdir}) ---")
+        if request_status(base_url + "/jobs/claim", "wrong-token") != 401:
+            failures.append("誤ったトークンが 401 になりません")
+
+        engine, digests = seed_recordings(workdir, args.recordings)
+        print(f"録音 {len(digests)} 件を登録しました。ワーカー {args.workers} 台を起動します...")
+        for i in range(args.workers):
+            name = f"check-worker-{i}"
+            log_path = os.path.join(workdir, f"{name}.log")
+            logs.append(log_path)
+            worker_env = {
+                **env,
+                "KOENO_JOB_SERVER": base_url,
+                "KOENO_WORKER_TOKEN": TOKEN,
+                "KOENO_WORKER_DOWNLOAD_DIR": os.path.join(workdir, name),   # (別マシンのつもりでダウンロード先を分ける)
+                "CHECK_WORKER_NAME": name,
+                "PYTHONUNBUFFERED": "1",
+            }
+            with open(log_path, "w", encoding="utf-8") as log:
+                workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker"], cwd=workdir, env=worker_env, stdout=log, stderr=subprocess.STDOUT))
+
+        time.sleep(KILL_AFTER_SECONDS)
+        killed_rows = set()
+        if args.workers > 1:
+            # (録音を抱えている最中に止める)
+            deadline = time.monotonic() + TIMEOUT_SECONDS
+            while not rows_leased_by(engine, "check-worker-0") and time.monotonic() < deadline:
+                time.sleep(0.05)
+            workers[0].send_signal(signal.SIGKILL if hasattr(signal, "SIGKILL") else signal.SIGTERM)
+            workers[0].wait(timeout=10)
+            # (止めた後、送りかけの取得リクエストをサーバーが処理し終えるのを待ってから読むので、これ以上増えない。
+            #  リースはまだ切れていない)
+            time.sleep(KILLED_SETTLE_SECONDS)
+            killed_rows = rows_leased_by(engine, "check-worker-0")
+            print(f"check-worker-0 を強制終了しました (抱えていた録音 {sorted(killed_rows)} はリース切れの後に他のワーカーが引き継ぐはず)")
+            if not killed_rows:
+                failures.append("強制終了したワーカーが録音を抱えていませんでした (引き継ぎを確かめられません)")
+
+        started = time.monotonic()
+        while time.monotonic() - started < TIMEOUT_SECONDS:
+            rows = fetch_rows(engine)
+            done = sum(1 for r in rows if r.ai_status in ("completed", "failed"))
+            if done == len(rows):
+                break
+            time.sleep(0.5)
+        elapsed = time.monotonic() - started
+
+        rows = fetch_rows(engine)
+        per_worker = {}
+        for r in rows:
+            if r.ai_status != "completed":
+                failures.append(f"ID {r.recording_id} が {r.ai_status} のままです")
+                continue
+            segment = r.transcription_result[0]
+            per_worker[segment["worker"]] = per_worker.get(segment["worker"], 0) + 1
+            if segment["text"] != digests[r.recording_id]:
+                failures.append(f"ID {r.recording_id} の音声のハッシュが一致しません")
+            if not os.path.exists(peaks_path_for(r.audio_file_path)):
+                failures.append(f"ID {r.recording_id} の波形ピークがサーバーにありません")
+
+        # 同じ録音の completed を2台が書いていないこと (ワーカーのログから)
+        completed_by = {}
+        for log_path in logs:
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("DB更新: ID ") and "completed" in line:
+                        rid = int(line.split()[2])
+                        completed_by.setdefault(rid, []).append(os.path.basename(log_path))
+        for rid, names in completed_by.items():
+            if len(names) > 1:
+                failures.append(f"ID {rid} を複数のワーカーが書き戻しました: {names}")
+
+        reclaimed = sum(1 for r in rows if (r.attempts or 0) > 1)
+        for r in rows:
+            if (r.attempts or 0) > 1 and r.recording_id not in killed_rows:
+                failures.append(f"ID {r.recording_id} が {r.attempts} 回取得されました (強制終了したワーカーの録音ではありません)")
+        print(f"処理時間: {elapsed:.1f}秒 / ワーカーごとの件数: {per_worker} / リース切れで再取得された件数: {reclaimed}")
+    finally:
+        for p in workers:
+            if p.poll() is None:
+                p.terminate()
+        for p in workers:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        server.terminate()
+        server.wait(timeout=10)
+        server_log.close()
+    failures.extend(server_errors(server_log_path))
+
+    if failures:
+        print("--- 失敗 ---")
+        for f in failures:
+            print(f"  {f}")
+        print(f"(ログ: {workdir})")
+        sys.exit(1)
+    print("--- OK: ジョブ API だけで全件を処理しました ---")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import contextlib
+import datetime
+
+import databases
+import sqlalchemy
+
+# --- DB 接続とテーブル定義 ---
+# API サーバー (main.py)・ワーカー・管理用スクリプトが共有する。
+# FastAPI / uvicorn を読み込まずにインポートできるよう、ここには DB に関するものだけを置くこと
+# (ワーカーや CLI が main をインポートすると Web アプリ一式が構築され、起動が遅くメモリも余計に使う)。
+
+# --- 設定 ---
+DATABASE_URL = "sqlite:///./koeno_app.db"
+# 他の接続 (API の別リクエスト・ワーカー・管理用スクリプト) が書き込み中なら、エラーにせずこの秒数まで待つ
+BUSY_TIMEOUT_SECONDS = 30
+database = databases.Database(DATABASE_URL, timeout=BUSY_TIMEOUT_SECONDS)
+metadata = sqlalchemy.MetaData()
+
+
+@contextlib.asynccontextmanager
+async def immediate_transaction():
+    """
+    書き込みロックを最初に取るトランザクション (BEGIN IMMEDIATE)。読んでから書く処理に使う。
+    ★ database.transaction() の BEGIN は読み取りから始まり、後の書き込みで他の接続とぶつかると
+    busy timeout を待たずに "database is locked" になる。IMMEDIATE ならロックの取得を timeout まで待つ
+    (中で database.transaction() を入れ子にしないこと)
+    """
+    async with database.connection() as conn:
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            await conn.execute("ROLLBACK")
+            raise
+        await conn.execute("COMMIT")
+
+# --- テーブル定義 ---
+
+# 1. 介護士マスタ
+caregivers = sqlalchemy.Table(
+    "caregivers", metadata,
+    sqlalchemy.Column("caregiver_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String, nullable=True),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC), nullable=True),
+    sqlalchemy.Column("qr_token", sqlalchemy.String, nullable=True),
+)
+
+# 2. 管理者テーブル
+administrators = sqlalchemy.Table(
+    "administrators", metadata,
+    sqlalchemy.Column("admin_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("caregiver_id", sqlalchemy.String, sqlalchemy.ForeignKey("caregivers.caregiver_id"), unique=True),
+    sqlalchemy.Column("role", sqlalchemy.String, default="owner"),
+    sqlalchemy.Column("granted_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC))
+)
+
+# 3. 録音データ
+recordings = sqlalchemy.Table(
+    "recordings", metadata,
+    sqlalchemy.Column("recording_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("caregiver_id", sqlalchemy.String, index=True),
+    sqlalchemy.Column("audio_file_path", sqlalchemy.String),
+    sqlalchemy.Column("memo_text", sqlalchemy.Text),
+    sqlalchemy.Column("ai_status", sqlalchemy.String, default="pending", index=True),
+    sqlalchemy.Column("transcription_result", sqlalchemy.JSON),
+    sqlalchemy.Column("assignment_snapshot", sqlalchemy.JSON, nullable=True),
+    sqlalchemy.Column("summary_drafts", sqlalchemy.JSON, nullable=True),
+    sqlalchemy.Column("assignment_version", sqlalchemy.Integer, nullable=False, server_default="0"), # 割当の保存ごとに +1 (差分更新の同時編集検出)
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime),
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime, nullable=True), # ETag/Last-Modified 用の行バージョン
+    sqlalchemy.Column("archived_at", sqlalchemy.DateTime, nullable=True), # アーカイブ済みなら日時 (JSONは recording_archive へ移動)
+    sqlalchemy.Column("audio_archive", sqlalchemy.String, nullable=True), # 月別アーカイブ (zip) のパス
+    # --- ワーカーのジョブリース (job_queue.py) ---
+    sqlalchemy.Column("lease_owner", sqlalchemy.String, nullable=True), # 処理中のワーカーID (host:pid)
+    sqlalchemy.Column("lease_expires_at", sqlalchemy.DateTime, nullable=True), # ハートビートで延長。過ぎたら再取得可能
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("next_attempt_at", sqlalchemy.DateTime, nullable=True), # 失敗後の再試行時刻 (バックオフ)
+    sqlalchemy.Column("last_error", sqlalchemy.Text, nullable=True),
+    # --- スケジューリング (job_scheduler.py) ---
+    sqlalchemy.Column("audio_duration", sqlalchemy.Float, nullable=True), # 音声の長さ (秒)。アップロード時に ffprobe で取得
+    sqlalchemy.Column("queued_at", sqlalchemy.DateTime, nullable=True), # 待ち行列に入った日時 (エージングの基準。再試行でも変えない)
+    sqlalchemy.Column("started_at", sqlalchemy.DateTime, nullable=True, index=True), # 最後にリースを取得した日時 (処理速度の実績・公平性の集計で範囲検索)
+    sqlalchemy.Column("processing_seconds", sqlalchemy.Float, nullable=True), # 処理にかかった秒数 (完了予想の実績)
+    sqlalchemy.Column("priority", sqlalchemy.Integer, nullable=False, server_default="0"), # 大きいほど先に処理する (高精度の依頼は 1)
+    # --- 文字起こしの段階 (transcription_tiers.py) ---
+    sqlalchemy.Column("transcription_tier", sqlalchemy.String, nullable=True), # None (速い) / accurate
+    # --- 要約草案の生成 (summary_queue.py) ---
+    sqlalchemy.Column("summary_status", sqlalchemy.String, nullable=True, index=True), # None / pending / ready
+)
+
+# 4. 日報
+care_records = sqlalchemy.Table(
+    "care_records", metadata,
+    sqlalchemy.Column("care_record_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("user_id", sqlalchemy.String, index=True),
+    sqlalchemy.Column("record_date", sqlalchemy.String, index=True),
+    sqlalchemy.Column("final_text", sqlalchemy.Text),
+    sqlalchemy.Column("care_touch_data", sqlalchemy.JSON, nullable=True),
+    sqlalchemy.Column("last_updated_by", sqlalchemy.String),
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC))
+)
+
+# 5. 録音の紐づけ管理
+recording_assignments = sqlalchemy.Table(
+    "recording_assignments", metadata,
+    sqlalchemy.Column("assignment_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("recording_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("recordings.recording_id"), index=True),
+    sqlalchemy.Column("user_id", sqlalchemy.String, index=True),
+    sqlalchemy.Column("assigned_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC)),
+    sqlalchemy.Column("assigned_by", sqlalchemy.String)
+)
+
+# 6. ケアイベント
+care_events = sqlalchemy.Table(
+    "care_events", metadata,
+    sqlalchemy.Column("event_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("user_id", sqlalchemy.String, index=True),
+    sqlalchemy.Column("event_timestamp", sqlalchemy.DateTime, index=True),
+    sqlalchemy.Column("event_type", sqlalchemy.String, default="care_touch"),
+    sqlalchemy.Column("care_touch_data", sqlalchemy.JSON, nullable=True),
+    sqlalchemy.Column("note_text", sqlalchemy.Text, nullable=True),
+    sqlalchemy.Column("recorded_by", sqlalchemy.String),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC)),
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime, nullable=True), # ETag/Last-Modified 用の行バージョン
+)
+
+# 7. アーカイブ済み録音の冷えたJSON (zlib 圧縮)。recordings の行を小さく保つための別テーブル
+recording_archive = sqlalchemy.Table(
+    "recording_archive", metadata,
+    sqlalchemy.Column("recording_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("recordings.recording_id"), primary_key=True),
+    sqlalchemy.Column("transcription_result_z", sqlalchemy.LargeBinary, nullable=True),
+    sqlalchemy.Column("assignment_snapshot_z", sqlalchemy.LargeBinary, nullable=True),
+    sqlalchemy.Column("archived_at", sqlalchemy.DateTime),
+)
+
+# 8. ケアイベントの日別集計 (care_aggregates.py)。save_event / delete_event で差分更新する
+care_touch_daily = sqlalchemy.Table(
+    "care_touch_daily", metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("record_date", sqlalchemy.String, primary_key=True), # JST の日付
+    sqlalchemy.Column("event_type", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("category", sqlalchemy.String, primary_key=True), # care_touch_data.category (食事 など。無ければ空)
+    sqlalchemy.Column("item_kind", sqlalchemy.String, primary_key=True), # event / tag / condition / place
+    sqlalchemy.Column("item", sqlalchemy.String, primary_key=True), # 項目 (item_kind=event では空)
+    sqlalchemy.Column("total", sqlalchemy.Integer, nullable=False, default=0),
+)
+
+# 9. care_touch_data の項目索引 (care_touch_index.py)。life_schema.json に定義された項目だけを1項目1行で持つ
+care_touch_index = sqlalchemy.Table(
+    "care_touch_index", metadata,
+    sqlalchemy.Column("source", sqlalchemy.String, primary_key=True), # event (care_events) / record (care_records)
+    sqlalchemy.Column("source_id", sqlalchemy.Integer, primary_key=True), # event_id / care_record_id
+    sqlalchemy.Column("category", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("field", sqlalchemy.String, primary_key=True), # category / tag / condition / place
+    sqlalchemy.Column("value", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("user_id", sqlalchemy.String),
+    sqlalchemy.Column("record_date", sqlalchemy.String), # JST の日付
+    sqlalchemy.Index("ix_care_touch_index_lookup", "source", "field", "value", "record_date"),
+)
+
+# 10. 要約草案のキャッシュ (summary_drafts.py)。同じ発話・プロンプト版・モデル・入居者なら LLM を呼ばずに使い回す
+summary_cache = sqlalchemy.Table(
+    "summary_cache", metadata,
+    sqlalchemy.Column("cache_key", sqlalchemy.String, primary_key=True), # sha256(プロンプト版|モデル|入居者|発話のハッシュ)
+    sqlalchemy.Column("user_id", sqlalchemy.String, index=True),
+    sqlalchemy.Column("prompt_version", sqlalchemy.String),
+    sqlalchemy.Column("model_id", sqlalchemy.String),
+    sqlalchemy.Column("summary_text", sqlalchemy.Text),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime),
+)
+
+# 11. 変更フィード (change_feed.py / GET /sync/changes)。同期対象の行ごとに最後の変更だけを1行で持つ
+# 行が変わるたびにトリガーが行を入れ替え、新しい seq (AUTOINCREMENT なので再利用されない) を振る。
+# seq がその行の版 兼 端末の同期カーソル。deleted=1 の行は削除の墓標 (tombstone)
+sync_changes = sqlalchemy.Table(
+    "sync_changes", metadata,
+    sqlalchemy.Column("seq", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("entity", sqlalchemy.String, nullable=False), # care_events / care_records / recordings / assignments
+    sqlalchemy.Column("entity_key", sqlalchemy.Integer, nullable=False), # event_id / care_record_id / recording_id
+    sqlalchemy.Column("deleted", sqlalchemy.Boolean, nullable=False, server_default="0"),
+    sqlalchemy.Column("changed_at", sqlalchemy.DateTime),
+    # 録音した本人 (recordings / assignments のみ)。墓標には行の内容が無いため、誰に返すかをここで判定する
+    sqlalchemy.Column("caregiver_id", sqlalchemy.String, nullable=True),
+    sqlalchemy.UniqueConstraint("entity", "entity_key", name="uq_sync_changes_entity"),
+    sqlite_autoincrement=True,
+)
+
+
+def _sync_trigger(name: str, timing: str, table: str, entity: str, key: str, deleted: int, when: str = "", owner: str = "NULL") -> str:
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {timing} ON {table}{' WHEN ' + when if when else ''} BEGIN "
+        f"INSERT OR REPLACE INTO sync_changes (entity, entity_key, deleted, changed_at, caregiver_id) VALUES ('{entity}', {key}, {deleted}, CURRENT_TIMESTAMP, {owner}); END"
+    )
+
+
+# (割当の行は録音の持ち主を持たないので、録音から引く)
+_ASSIGNMENT_OWNER = "(SELECT caregiver_id FROM recordings WHERE recording_id = {row}.recording_id)"
+
+
+# (API・ワーカー・管理用スクリプトのどこから書き換えても記録されるよう、アプリ側ではなくトリガーで記録する)
+# recordings はリースやハートビートでも更新されるため、ai_status と割当の版が変わったときだけ記録する
+SYNC_TRIGGERS = [
+    _sync_trigger("sync_care_events_ins", "INSERT", "care_events", "care_events", "NEW.event_id", 0),
+    _sync_trigger("sync_care_events_upd", "UPDATE", "care_events", "care_events", "NEW.event_id", 0),
+    _sync_trigger("sync_care_events_del", "DELETE", "care_events", "care_events", "OLD.event_id", 1),
+    _sync_trigger("sync_care_records_ins", "INSERT", "care_records", "care_records", "NEW.care_record_id", 0),
+    _sync_trigger("sync_care_records_upd", "UPDATE", "care_records", "care_records", "NEW.care_record_id", 0),
+    _sync_trigger("sync_care_records_del", "DELETE", "care_records", "care_records", "OLD.care_record_id", 1),
+    _sync_trigger("sync_recordings_ins", "INSERT", "recordings", "recordings", "NEW.recording_id", 0, owner="NEW.caregiver_id"),
+    _sync_trigger("sync_recordings_upd", "UPDATE OF ai_status", "recordings", "recordings", "NEW.recording_id", 0, "OLD.ai_status IS NOT NEW.ai_status", owner="NEW.caregiver_id"),
+    _sync_trigger("sync_recordings_del", "DELETE", "recordings", "recordings", "OLD.recording_id", 1, owner="OLD.caregiver_id"),
+    _sync_trigger("sync_assignments_ver", "UPDATE OF assignment_version", "recordings", "assignments", "NEW.recording_id", 0, "OLD.assignment_version IS NOT NEW.assignment_version", owner="NEW.caregiver_id"),
+    _sync_trigger("sync_assignments_del", "DELETE", "recordings", "assignments", "OLD.recording_id", 1, owner="OLD.caregiver_id"),
+    _sync_trigger("sync_assignments_ins", "INSERT", "recording_assignments", "assignments", "NEW.recording_id", 0, owner=_ASSIGNMENT_OWNER.format(row="NEW")),
+    # (録音ごと消した場合は、上の墓標を消さないよう録音が残っているときだけ記録する)
+    _sync_trigger("sync_assignments_rm", "DELETE", "recording_assignments", "assignments", "OLD.recording_id", 0,
+                  "EXISTS (SELECT 1 FROM recordings WHERE recording_id = OLD.recording_id)", owner=_ASSIGNMENT_OWNER.format(row="OLD")),
+]
+
+
+def _trigger_name(ddl: str) -> str:
+    return ddl.split()[5]
+
+
+def install_sync_triggers(conn, replace: bool = False) -> None:
+    """replace: 既存のトリガーを作り直す (トリガーの定義を変えたマイグレーション用)"""
+    for ddl in SYNC_TRIGGERS:
+        if replace:
+            conn.execute(sqlalchemy.text(f"DROP TRIGGER IF EXISTS {_trigger_name(ddl)}"))
+        conn.execute(sqlalchemy.text(ddl))
+
+
+# 新規DB (create_all) でも、全テーブルを作った後にトリガーを作る
+sqlalchemy.event.listen(metadata, "after_create", lambda target, connection, **kw: install_sync_triggers(connection))
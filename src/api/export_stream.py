@@ -0,0 +1,60 @@
+import csv
+import io
+from typing import Any, AsyncIterator, Callable, Dict, List, Sequence
+
+from fast_json import dumps
+
+# --- 監査・月次報告向けのストリーミング出力 ---
+# 期間内の行をキーセット方式 (WHERE key > 前ページ最後の key ORDER BY key LIMIT n) でページングし、
+# 1ページずつ CSV / JSONL に変換して送り出す。OFFSET を使わないので後ろのページでも遅くならず、
+# メモリに載るのは常に1ページ分だけ (1日分でも1年分でも同じ)。
+
+EXPORT_PAGE_SIZE = 500
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
+
+
+async def keyset_pages(database, make_query: Callable[[Any], Any], key: str, page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[Any]]:
+    """
+    make_query(after) は「key > after (after が None なら先頭から)」で key 昇順に page_size 件を返す SELECT を作ること。
+    """
+    after = None
+    while True:
+        rows = await database.fetch_all(make_query(after).limit(page_size))
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        after = rows[-1][key]
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return dumps(value).decode("utf-8")
+    return "" if value is None else value
+
+
+async def stream_export(pages: AsyncIterator[List[Any]], columns: Sequence[str], fmt: str, to_dict: Callable[[Any], Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """ページ列を CSV (Excel で開けるよう BOM 付き) または JSONL のバイト列にして順に返す"""
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\r\n")
+        writer.writerow(columns)
+        yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+        async for rows in pages:
+            buf.seek(0)
+            buf.truncate()
+            for r in rows:
+                d = to_dict(r)
+                writer.writerow([_csv_value(d.get(c)) for c in columns])
+            yield buf.getvalue().encode("utf-8")
+    else:
+        async for rows in pages:
+            lines = []
+            for r in rows:
+                d = to_dict(r)
+                lines.append(dumps({c: d.get(c) for c in columns}))
+            yield b"\n".join(lines) + b"\n"
@@ -0,0 +1,74 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+import sqlalchemy
+from fastapi import Response
+
+# --- 一覧APIの高速シリアライズ経路 ---
+# 一覧系エンドポイントは行ごとに dict コピー + ensure_utc_iso + Pydantic 再検証を行っていたため、
+# 行数に比例してCPUを消費していた。ここでは
+#   1. 日時のISO文字列化を SQL (SQLite の replace) に寄せて一括で行い、
+#   2. 行をそのまま orjson (無ければ標準json) でバイト列にする。
+# Response を直接返すため、FastAPI の response_model による再検証は走らない
+# (response_model は OpenAPI ドキュメント用に残す)。
+
+try:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(raw: Any) -> Any:
+        return orjson.loads(raw)
+
+except ImportError:  # orjson 未インストール環境 (標準jsonで代替)
+    import json
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(raw: Any) -> Any:
+        return json.loads(raw)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def utc_iso_column(column, label: Optional[str] = None):
+    """
+    DateTime カラムを 'Z' 付きUTC ISO文字列として SELECT する式を返す。
+    SQLAlchemy は SQLite に 'YYYY-MM-DD HH:MM:SS.ffffff' (UTC, Naive) で保存するので、
+    区切り文字の置換だけで ensure_utc_iso と同じ文字列になる (NULL は NULL のまま)。
+    """
+    replaced = sqlalchemy.func.replace(column, " ", "T", type_=sqlalchemy.String)
+    trimmed = sqlalchemy.func.replace(replaced, ".000000", "", type_=sqlalchemy.String)
+    return trimmed.concat("Z").label(label or column.name)
+
+
+def raw_json_column(column, label: Optional[str] = None):
+    """JSON カラムを文字列のまま SELECT する (デコードは loads でまとめて行う)"""
+    return sqlalchemy.type_coerce(column, sqlalchemy.Text).label(label or column.name)
+
+
+def rows_to_dicts(rows: Iterable[Any], json_fields: Iterable[str] = ()) -> List[Dict[str, Any]]:
+    """databases の Record をそのまま dict 化し、JSON カラムだけ loads する"""
+    json_fields = tuple(json_fields)
+    out = []
+    keys = None
+    for r in rows:
+        if keys is None:
+            keys = tuple(str(k) for k in r.keys())  # カラム名 (quoted_name) の解決は先頭行で一度だけ
+        d = dict(zip(keys, r.values()))
+        for f in json_fields:
+            v = d[f]
+            if v is not None:
+                d[f] = loads(v)
+        out.append(d)
+    return out
+
+
+def fast_json_response(content: Any, headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    return FastJSONResponse(content=content, headers=headers)
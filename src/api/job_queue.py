@@ -0,0 +1,187 @@
+import datetime
+import os
+import socket
+from typing import Optional
+
+import sqlalchemy
+
+from db import database, immediate_transaction, recordings
+from job_scheduler import load_queue, plan_queue
+
+# --- 録音処理ジョブのリース管理 ---
+# ワーカーは recordings の行を「リース」(期限付きの占有) として取得し、処理中は定期的に延長する。
+# ワーカーが落ちて延長が止まると、期限切れの行は他のワーカー (または再起動後の自分) が再取得する。
+#  - attempts: 取得した回数。MAX_ATTEMPTS に達した行は再取得せず failed にする
+#  - next_attempt_at: 失敗後の再試行を指数バックオフで遅らせる
+#  - どの行を取るかは job_scheduler.py の順序 (優先度 + 短いジョブ優先 + エージング + 介護士ごとの公平性) に従う
+#  - 取得した行の transcription_tier (transcription_tiers.py) も返し、ワーカーはその段階のモデルで処理する
+#  - 完了/失敗の書き込みは lease_owner が自分の場合だけ行う (期限切れ後に他のワーカーが
+#    取り直した行を、遅れて戻ってきた古いワーカーが上書きしないため)
+#  - 取得・延長・完了は条件付き UPDATE ... RETURNING の1文で行い、更新できた行があるかで判定する
+#    (読んでから書くと、他の接続の書き込みとぶつかったときに busy timeout を待たずに "database is locked" になる)。
+#    読んでから書く必要がある取得・失敗は BEGIN IMMEDIATE (db.immediate_transaction) で書き込みロックを先に取る
+
+LEASE_SECONDS = int(os.environ.get("KOENO_JOB_LEASE_SECONDS", "300"))
+HEARTBEAT_SECONDS = int(os.environ.get("KOENO_JOB_HEARTBEAT_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.environ.get("KOENO_JOB_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 3600
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC)
+
+
+def backoff_seconds(attempts: int) -> int:
+    return min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+
+
+def _lease_expired(now: datetime.datetime):
+    # (リース導入前のワーカーが残した processing 行は lease_expires_at が NULL なので、期限切れ扱いで回収する)
+    return (recordings.c.ai_status == "processing") & (
+        recordings.c.lease_expires_at.is_(None) | (recordings.c.lease_expires_at < now)
+    )
+
+
+def _is_ready(row, now: datetime.datetime) -> bool:
+    """(plan_queue の結果のうち、今すぐ取れるもの。_claimable と同じ条件を Python 側で判定する)"""
+    if (row.attempts or 0) >= MAX_ATTEMPTS:
+        return False
+    if row.ai_status == "processing" or row.next_attempt_at is None:
+        return True
+    return row.next_attempt_at.replace(tzinfo=datetime.UTC) <= now
+
+
+def _claimable(now: datetime.datetime):
+    ready = (recordings.c.ai_status == "pending") & (
+        recordings.c.next_attempt_at.is_(None) | (recordings.c.next_attempt_at <= now)
+    )
+    return (ready | _lease_expired(now)) & (sqlalchemy.func.coalesce(recordings.c.attempts, 0) < MAX_ATTEMPTS)
+
+
+async def expire_exhausted() -> list:
+    """期限切れのまま試行回数を使い切った行を failed にし、その recording_id を返す"""
+    now = _now()
+    cond = _lease_expired(now) & (sqlalchemy.func.coalesce(recordings.c.attempts, 0) >= MAX_ATTEMPTS)
+    rows = await database.fetch_all(
+        recordings.update()
+        .where(cond)
+        .values(ai_status="failed", lease_owner=None, lease_expires_at=None,
+                last_error="リース期限切れ (試行回数の上限に到達)", updated_at=now)
+        .returning(recordings.c.recording_id)
+    )
+    return [r.recording_id for r in rows]
+
+
+_CLAIMED_COLUMNS = (
+    recordings.c.recording_id, recordings.c.audio_file_path, recordings.c.attempts,
+    recordings.c.lease_owner, recordings.c.lease_expires_at, recordings.c.transcription_tier,
+)
+
+
+async def claim_job(worker_id: str):
+    """
+    処理可能な録音を1件リースして返す (無ければ None)。
+    スケジューラの順序で候補を選んだ後、書き込みロックを取ってから候補ごとに条件付き UPDATE ... RETURNING を1文ずつ試す。
+    行が返ってきた候補がこのワーカーのもの (取れる条件はロックを取った後の時刻で判定する)。
+    """
+    state = await load_queue(database, recordings, _now())
+    planned_at = _now()
+    candidates = [r for r in plan_queue(state["queued"], state["usage"], planned_at) if _is_ready(r, planned_at)][:5]
+    if not candidates:
+        return None
+    async with immediate_transaction():
+        now = _now()
+        lease_expires_at = now + datetime.timedelta(seconds=LEASE_SECONDS)
+        for c in candidates:
+            row = await database.fetch_one(
+                recordings.update()
+                .where((recordings.c.recording_id == c.recording_id) & _claimable(now))
+                .values(
+                    ai_status="processing",
+                    lease_owner=worker_id,
+                    lease_expires_at=lease_expires_at,
+                    attempts=sqlalchemy.func.coalesce(recordings.c.attempts, 0) + 1,
+                    next_attempt_at=None,
+                    started_at=now,
+                    updated_at=now,
+                )
+                .returning(*_CLAIMED_COLUMNS)
+            )
+            if row is not None:
+                return row
+    return None
+
+
+async def heartbeat(record_id: int, worker_id: str) -> bool:
+    """リースを延長する。既に他のワーカーに取られていれば False"""
+    now = _now()
+    row = await database.fetch_one(
+        recordings.update()
+        .where(_owned(record_id, worker_id) & (recordings.c.ai_status == "processing"))
+        .values(lease_expires_at=now + datetime.timedelta(seconds=LEASE_SECONDS))
+        .returning(recordings.c.recording_id)
+    )
+    return row is not None
+
+
+def _owned(record_id: int, worker_id: str):
+    return (recordings.c.recording_id == record_id) & (recordings.c.lease_owner == worker_id)
+
+
+async def complete_job(record_id: int, worker_id: str, result_data: dict, audio_duration: Optional[float] = None, processing_seconds: Optional[float] = None) -> bool:
+    """
+    結果を書き込んでリースを解放する。リースを失っていた場合は何もせず False
+    (audio_duration / processing_seconds は完了予想の実績として残す)
+    """
+    row = await database.fetch_one(
+        recordings.update().where(_owned(record_id, worker_id)).values(
+            ai_status="completed",
+            transcription_result=result_data,
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error=None,
+            processing_seconds=processing_seconds,
+            priority=0,  # (高精度の依頼で上げた優先度は処理し終えたら戻す)
+            updated_at=_now(),
+            **({"audio_duration": audio_duration} if audio_duration else {}),
+        ).returning(recordings.c.recording_id)
+    )
+    return row is not None
+
+
+async def fail_job(record_id: int, worker_id: str, error: str, retryable: bool = True) -> Optional[str]:
+    """
+    失敗を記録してリースを解放し、新しい ai_status を返す (リースを失っていた場合は None)。
+    再試行可能で回数が残っていれば pending に戻し、バックオフ後に再取得されるようにする。
+    (試行回数からバックオフを決めるため読んでから書く。書き込みロックを先に取る)
+    """
+    async with immediate_transaction():
+        row = await database.fetch_one(
+            sqlalchemy.select(recordings.c.attempts).where(_owned(record_id, worker_id))
+        )
+        if row is None:
+            return None
+        attempts = row.attempts or 0
+        now = _now()
+        if retryable and attempts < MAX_ATTEMPTS:
+            status = "pending"
+            next_attempt_at = now + datetime.timedelta(seconds=backoff_seconds(attempts))
+        else:
+            status = "failed"
+            next_attempt_at = None
+        await database.execute(
+            recordings.update().where(_owned(record_id, worker_id)).values(
+                ai_status=status,
+                lease_owner=None,
+                lease_expires_at=None,
+                next_attempt_at=next_attempt_at,
+                last_error=error[:1000],
+                updated_at=now,
+            )
+        )
+    return status
@@ -0,0 +1,191 @@
+import datetime
+import heapq
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import sqlalchemy
+
+# --- 文字起こしジョブの実行順序 (スケジューラ) ---
+# 待ち行列 (pending と、リース切れの processing) を次の規則で並べる。
+#  0. 優先度 (priority) の高いものから。高精度で処理し直す依頼 (transcription_tiers.py) は通常の録音より先に処理する。
+#     同じ優先度の中は以下の規則で並べる
+#  1. 短いジョブ優先 (SJF): アップロード時に調べた音声の長さ (audio_duration) が短いものから
+#  2. エージング: 待った秒数 × AGING_RATE だけ長さを割り引く。長い録音も待てば必ず先頭に来る
+#  3. 介護士ごとの公平性: 直近 FAIR_SHARE_WINDOW_SECONDS 秒に処理を始めた音声の合計秒数と、
+#     1件あたり FAIR_SHARE_TURN_SECONDS をその介護士のジョブに上乗せする。一人の一括同期が続いても、
+#     他の介護士のジョブが1件ずつ割り込むラウンドロビンに近い順序になる
+# 同じ並びを API 側の順番待ち・完了予想 (queue_position / eta_seconds) にも使う。
+# (DB接続とテーブルは呼び出し側から渡す。main.py と run_worker.py の両方から使うため)
+
+DEFAULT_DURATION_SECONDS = 60.0   # 長さ不明 (ffprobe 失敗など) の録音の見積もり
+AGING_RATE = float(os.environ.get("KOENO_SCHED_AGING_RATE", "1.0"))
+FAIR_SHARE_WINDOW_SECONDS = int(os.environ.get("KOENO_SCHED_FAIR_WINDOW_SECONDS", "1800"))
+FAIR_SHARE_WEIGHT = float(os.environ.get("KOENO_SCHED_FAIR_WEIGHT", "1.0"))
+FAIR_SHARE_TURN_SECONDS = 60.0    # 1件処理するごとの上乗せ (短い録音ばかりでも順番を回すため)
+DEFAULT_REALTIME_FACTOR = 0.5     # 処理時間 / 音声の長さ (実績が無いときの既定値)
+RTF_SAMPLE_SIZE = 20
+
+
+def estimated_duration(row) -> float:
+    return row.audio_duration if row.audio_duration else DEFAULT_DURATION_SECONDS
+
+
+def _utc(dt: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    if dt is None:
+        return None
+    return dt.replace(tzinfo=datetime.UTC) if dt.tzinfo is None else dt
+
+
+def _wait_seconds(row, now: datetime.datetime) -> float:
+    queued_at = _utc(row.queued_at or row.created_at)
+    return max((now - queued_at).total_seconds(), 0.0) if queued_at else 0.0
+
+
+def job_score(row, now: datetime.datetime) -> float:
+    """小さいほど先に処理する (公平性の上乗せ前)"""
+    return estimated_duration(row) - AGING_RATE * _wait_seconds(row, now)
+
+
+def _priority(row) -> int:
+    return getattr(row, "priority", None) or 0
+
+
+def is_lease_active(row, now: datetime.datetime) -> bool:
+    expires = _utc(row.lease_expires_at)
+    return row.ai_status == "processing" and expires is not None and expires >= now
+
+
+def plan_queue(queued: List[Any], usage: Dict[str, float], now: datetime.datetime) -> List[Any]:
+    """
+    待ち行列を処理予定の順に並べて返す。
+    usage: 介護士ごとの直近の使用量 (秒。公平性の上乗せ分)。選ぶたびに加算して次の選択に反映する。
+    (エージングは全ジョブに等しく効くので、シミュレーション中の時間経過は順序に影響しない)
+    優先度は介護士ごとの先頭と、介護士の間の選択の両方で公平性より先に比べる。
+    """
+    per_caregiver: Dict[str, List[Tuple[float, int, Any]]] = defaultdict(list)
+    for row in queued:
+        per_caregiver[row.caregiver_id].append((-_priority(row), job_score(row, now), row.recording_id, row))
+    heap = []
+    for cid, jobs in per_caregiver.items():
+        jobs.sort(key=lambda j: (j[0], j[1], j[2]))
+        jobs.reverse()  # 末尾から pop する
+        rank, score, rid, _ = jobs[-1]
+        heapq.heappush(heap, (rank, score + FAIR_SHARE_WEIGHT * usage.get(cid, 0.0), rid, cid))
+
+    used = dict(usage)
+    order = []
+    while heap:
+        _, _, _, cid = heapq.heappop(heap)
+        jobs = per_caregiver[cid]
+        _, _, _, row = jobs.pop()
+        order.append(row)
+        used[cid] = used.get(cid, 0.0) + estimated_duration(row) + FAIR_SHARE_TURN_SECONDS
+        if jobs:
+            rank, score, rid, _ = jobs[-1]
+            heapq.heappush(heap, (rank, score + FAIR_SHARE_WEIGHT * used[cid], rid, cid))
+    return order
+
+
+async def realtime_factor(database, recordings) -> float:
+    """直近の実績から 処理時間 / 音声の長さ の平均を求める (実績が無ければ既定値)"""
+    samples = await database.fetch_all(
+        sqlalchemy.select(recordings.c.audio_duration, recordings.c.processing_seconds)
+        .where(
+            (recordings.c.ai_status == "completed")
+            & (recordings.c.audio_duration > 0)
+            & recordings.c.processing_seconds.isnot(None)
+            # (高精度の処理は遅いので、通常の録音の完了予想には使わない)
+            & recordings.c.transcription_tier.is_(None)
+        )
+        .order_by(recordings.c.started_at.desc())
+        .limit(RTF_SAMPLE_SIZE)
+    )
+    if not samples:
+        return DEFAULT_REALTIME_FACTOR
+    return sum(s.processing_seconds / s.audio_duration for s in samples) / len(samples)
+
+
+async def queue_load(database, recordings, now: datetime.datetime) -> Dict[str, Any]:
+    """
+    待ち行列の件数と、今のワーカー数ですべて処理し終えるまでの予想秒数 (アップロードの受け入れ判定用)。
+    load_queue と違い行を読まず集計だけを行う。
+    """
+    active_lease = (recordings.c.ai_status == "processing") & (recordings.c.lease_expires_at >= now)
+    row = await database.fetch_one(
+        sqlalchemy.select(
+            sqlalchemy.func.count().label("depth"),
+            sqlalchemy.func.sum(sqlalchemy.func.coalesce(recordings.c.audio_duration, DEFAULT_DURATION_SECONDS)).label("seconds"),
+            sqlalchemy.func.count(sqlalchemy.distinct(sqlalchemy.case((active_lease, recordings.c.lease_owner)))).label("workers"),
+        ).where(recordings.c.ai_status.in_(["pending", "processing"]))
+    )
+    rtf = await realtime_factor(database, recordings)
+    workers = max(row.workers or 0, 1)
+    return {
+        "depth": row.depth or 0,
+        "audio_seconds": float(row.seconds or 0.0),
+        "rtf": rtf,
+        "workers": workers,
+        "drain_seconds": float(row.seconds or 0.0) * rtf / workers,
+    }
+
+
+async def load_queue(database, recordings, now: datetime.datetime) -> Dict[str, Any]:
+    """スケジューリングに必要な状態 (待ち行列・処理中・公平性の使用量・処理速度の実績) を読む"""
+    rows = await database.fetch_all(
+        sqlalchemy.select(
+            recordings.c.recording_id, recordings.c.caregiver_id, recordings.c.ai_status,
+            recordings.c.audio_duration, recordings.c.queued_at, recordings.c.created_at,
+            recordings.c.started_at, recordings.c.lease_owner, recordings.c.lease_expires_at,
+            recordings.c.next_attempt_at, recordings.c.attempts, recordings.c.priority,
+        ).where(recordings.c.ai_status.in_(["pending", "processing"]))
+    )
+    queued, in_flight = [], []
+    for r in rows:
+        (in_flight if is_lease_active(r, now) else queued).append(r)
+
+    window_start = now - datetime.timedelta(seconds=FAIR_SHARE_WINDOW_SECONDS)
+    usage_rows = await database.fetch_all(
+        sqlalchemy.select(
+            recordings.c.caregiver_id,
+            sqlalchemy.func.sum(sqlalchemy.func.coalesce(recordings.c.audio_duration, DEFAULT_DURATION_SECONDS)).label("seconds"),
+            sqlalchemy.func.count().label("jobs"),
+        )
+        .where(recordings.c.started_at >= window_start)
+        .group_by(recordings.c.caregiver_id)
+    )
+    usage = {r.caregiver_id: float(r.seconds or 0.0) + FAIR_SHARE_TURN_SECONDS * r.jobs for r in usage_rows}
+
+    rtf = await realtime_factor(database, recordings)
+
+    workers = max(len({r.lease_owner for r in in_flight}), 1)
+    return {"queued": queued, "in_flight": in_flight, "usage": usage, "rtf": rtf, "workers": workers}
+
+
+def estimate_positions(state: Dict[str, Any], now: datetime.datetime) -> Dict[int, Dict[str, Any]]:
+    """
+    録音IDごとの {queue_position, eta_seconds} を返す。
+    queue_position は処理中なら 0、待ち行列なら 1 始まり。eta_seconds は完了までの予想秒数。
+    ワーカー数分の空き時刻を持ち、予定順に最も早く空くワーカーへ割り当てて見積もる。
+    """
+    rtf = state["rtf"]
+    result: Dict[int, Dict[str, Any]] = {}
+    free_at = []
+    for r in state["in_flight"]:
+        started = _utc(r.started_at) or now
+        remaining = max(estimated_duration(r) * rtf - (now - started).total_seconds(), 0.0)
+        result[r.recording_id] = {"queue_position": 0, "eta_seconds": round(remaining)}
+        free_at.append(remaining)
+    free_at.sort()
+    free_at = free_at[:state["workers"]] + [0.0] * max(state["workers"] - len(free_at), 0)
+    heapq.heapify(free_at)
+
+    for position, r in enumerate(plan_queue(state["queued"], state["usage"], now), start=1):
+        start = heapq.heappop(free_at)
+        not_before = _utc(r.next_attempt_at)
+        if not_before is not None:
+            start = max(start, (not_before - now).total_seconds())
+        finish = start + estimated_duration(r) * rtf
+        heapq.heappush(free_at, finish)
+        result[r.recording_id] = {"queue_position": position, "eta_seconds": round(finish)}
+    return result
@@ -0,0 +1,78 @@
+"""
+[ワーカーの起動] worker_layout.json の配置どおりに run_worker.py を複数起動する
+
+  py .\\launch_workers.py [--layout worker_layout.json]
+
+配置 (tune_workers.py が作る) のプロセス数だけ run_worker.py を起動し、
+それぞれに枠番号 (KOENO_WORKER_SLOT) と OpenMP / MKL のスレッド数を環境変数で渡す。
+CPU の固定と torch のスレッド数の設定は、各ワーカーが起動時に行う (worker_layout.apply_configured_layout)。
+配置ファイルが無ければ、torch の既定のまま1プロセスで起動する。
+ワーカーが異常終了した場合は RESTART_DELAY_SECONDS 後に同じ枠で起動し直す。Ctrl+C で全ワーカーを止める。
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import worker_layout
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESTART_DELAY_SECONDS = 10
+POLL_SECONDS = 1
+
+
+def start_worker(slot: int, layout) -> subprocess.Popen:
+    env = {**os.environ}
+    if layout is not None:
+        env.update(worker_layout.thread_env(layout))
+        env[worker_layout.SLOT_ENV] = str(slot)
+    return subprocess.Popen([sys.executable, os.path.join(HERE, "run_worker.py")], env=env, cwd=os.getcwd())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="配置ファイルどおりにワーカーを起動する")
+    parser.add_argument("--layout", default=worker_layout.LAYOUT_FILE, help="配置ファイル")
+    args = parser.parse_args()
+
+    # (各ワーカーも同じファイルを読むよう、環境変数で渡す)
+    os.environ["KOENO_WORKER_LAYOUT"] = os.path.abspath(args.layout)
+    layout = worker_layout.load_layout(args.layout)
+    if layout is None:
+        print(f"配置ファイル ({args.layout}) が無いため、1プロセスで起動します (py .\\tune_workers.py で作成できます)")
+        processes = 1
+    else:
+        processes = layout["processes"]
+        print(f"--- 配置: {processes}プロセス × {layout['intra_op_threads']}スレッド (inter-op {layout['inter_op_threads']}), CPU {layout['slots']} ---")
+
+    workers = {slot: start_worker(slot, layout) for slot in range(processes)}
+    restart_at = {}
+    try:
+        while True:
+            time.sleep(POLL_SECONDS)
+            for slot, proc in list(workers.items()):
+                code = proc.poll()
+                if code is None:
+                    continue
+                if slot not in restart_at:
+                    print(f"ワーカー (枠 {slot}) が終了しました (終了コード {code})。{RESTART_DELAY_SECONDS}秒後に起動し直します...")
+                    restart_at[slot] = time.monotonic() + RESTART_DELAY_SECONDS
+                elif time.monotonic() >= restart_at[slot]:
+                    del restart_at[slot]
+                    workers[slot] = start_worker(slot, layout)
+    except KeyboardInterrupt:
+        print("\nワーカーを停止します...")
+    finally:
+        for proc in workers.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in workers.values():
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
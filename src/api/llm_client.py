@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import re
+import urllib.request
+from typing import List
+
+# --- 要約用 LLM クライアント (差し替え可能) ---
+# summary_queue.py から使う。KOENO_LLM_BACKEND で切り替える。
+#   mock   … ネットワークを使わない決定的な要約 (既定。開発・検証用)
+#   gemini … Gemini API (KOENO_GEMINI_API_KEY / KOENO_GEMINI_MODEL が必要)
+# どのクライアントも summarize_batch(プロンプトのリスト) → 要約のリスト (同じ順序) を返す。
+# max_batch 件までを1回の呼び出しにまとめてよい。
+
+LLM_BACKEND = os.environ.get("KOENO_LLM_BACKEND", "mock")
+LLM_TIMEOUT_SECONDS = 60
+
+
+class LLMClient:
+    model_id = "base"
+    max_batch = 1
+
+    async def summarize_batch(self, prompts: List[str]) -> List[str]:
+        raise NotImplementedError
+
+
+class MockLLMClient(LLMClient):
+    """発話の先頭数件を箇条書きにするだけの、ローカルで完結する要約"""
+    model_id = "mock-1"
+    max_batch = 16
+    MAX_LINES = 3
+    MAX_CHARS = 60
+
+    async def summarize_batch(self, prompts: List[str]) -> List[str]:
+        return [self._summarize(p) for p in prompts]
+
+    def _summarize(self, prompt: str) -> str:
+        # (プロンプトの「# 会話」以降が発話。1行 = 「話者: 本文」)
+        body = prompt.split("# 会話", 1)[-1]
+        lines = []
+        for line in body.splitlines():
+            text = line.split(": ", 1)[-1].strip()
+            if text:
+                lines.append("・" + text[:self.MAX_CHARS])
+            if len(lines) >= self.MAX_LINES:
+                break
+        return "\n".join(lines)
+
+
+class GeminiLLMClient(LLMClient):
+    """
+    Gemini API (generateContent)。max_batch 件のプロンプトを1回のリクエストにまとめ、JSON 配列で受け取る。
+    配列の件数が合わない場合は1件ずつ呼び直す。
+    """
+    max_batch = 8
+    BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models/"
+
+    def __init__(self, api_key: str, model_id: str):
+        self.api_key = api_key
+        self.model_id = model_id
+
+    def _generate(self, text: str) -> str:
+        body = json.dumps({"contents": [{"role": "user", "parts": [{"text": text}]}]}).encode("utf-8")
+        req = urllib.request.Request(
+            f"{self.BASE_URL}{self.model_id}:generateContent?key={self.api_key}",
+            data=body, headers={"Content-Type": "application/json"}, method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=LLM_TIMEOUT_SECONDS) as res:
+            data = json.loads(res.read().decode("utf-8"))
+        return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+
+    async def summarize_batch(self, prompts: List[str]) -> List[str]:
+        if len(prompts) == 1:
+            return [await asyncio.to_thread(self._generate, prompts[0])]
+        combined = (
+            f"以下の {len(prompts)} 件の依頼をそれぞれ独立に処理し、"
+            f"回答だけを要素とする JSON 文字列配列 (長さ {len(prompts)}、同じ順序) で出力してください。\n\n"
+            + "\n\n".join(f"=== 依頼 {i + 1} ===\n{p}" for i, p in enumerate(prompts))
+        )
+        raw = await asyncio.to_thread(self._generate, combined)
+        match = re.search(r"\[.*\]", raw, re.S)
+        try:
+            results = json.loads(match.group(0)) if match else None
+        except ValueError:
+            results = None
+        if isinstance(results, list) and len(results) == len(prompts) and all(isinstance(r, str) for r in results):
+            return results
+        return [await asyncio.to_thread(self._generate, p) for p in prompts]
+
+
+def make_client(backend: str = LLM_BACKEND) -> LLMClient:
+    if backend == "gemini":
+        api_key = os.environ.get("KOENO_GEMINI_API_KEY")
+        model_id = os.environ.get("KOENO_GEMINI_MODEL")
+        if not api_key or not model_id:
+            raise RuntimeError("KOENO_GEMINI_API_KEY と KOENO_GEMINI_MODEL を設定してください")
+        return GeminiLLMClient(api_key, model_id)
+    if backend == "mock":
+        return MockLLMClient()
+    raise ValueError(f"未知の LLM バックエンドです: {backend}")
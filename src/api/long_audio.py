@@ -0,0 +1,146 @@
+import os
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# --- 長時間録音の分割処理 ---
+# 止め忘れた数時間の録音を pydub で丸ごと読み込むと、ワーカーのメモリが録音の長さに比例して膨らむ。
+# 長い録音はデコード段 (audio_prepare.py) で 16kHz モノラル 16bit の生 PCM ファイルに書き出し、
+# ここで memmap して一定の長さの窓ごとにモデルへ渡す (メモリは窓1つぶんで頭打ちになる)。
+#   窓の重なり: 窓の端で発話が切れないよう OVERLAP_SECONDS だけ重ねる。
+#               重なりの中央を境界とし、各窓は「開始時刻が自分の担当範囲 (core) にある」セグメントだけを採る。
+#   話者の対応: pyannote の話者ラベルは窓ごとに独立なので、話者ごとの声の埋め込み (ECAPA) の
+#               コサイン類似度で窓をまたいで同じ話者をつなぎ、録音全体で通しのラベルを付け直す。
+
+WINDOW_SECONDS = float(os.environ.get("KOENO_LONG_WINDOW_SECONDS", "600"))
+OVERLAP_SECONDS = 30.0
+SPEAKER_MATCH_THRESHOLD = 0.55   # これ以上似ていれば同じ話者とみなす (コサイン類似度)
+MIN_EMBEDDING_SECONDS = 1.0      # 発話がこれより短い話者は埋め込みを作らない (照合せず新しい話者とする)
+MAX_EMBEDDING_SECONDS = 30.0     # 埋め込みに使う発話の上限 (窓ごと・話者ごと)
+
+UNKNOWN_SPEAKER = "UNKNOWN"
+
+
+class Window(NamedTuple):
+    start: float       # 窓の範囲 (秒)
+    end: float
+    core_start: float  # この窓が結果を採る範囲 (隣の窓との重なりの中央で区切る)
+    core_end: float
+
+
+def open_pcm(pcm_path: str):
+    """16bit モノラルの生 PCM を読み取り専用で memmap する (読んだ部分だけがページインされる)"""
+    import numpy as np
+
+    if os.path.getsize(pcm_path) == 0:
+        return np.zeros(0, dtype=np.int16)
+    return np.memmap(pcm_path, dtype=np.int16, mode="r")
+
+
+def close_pcm(pcm: Any):
+    """
+    open_pcm の memmap を閉じる (PCM の一時ファイルを消す前に)
+    ★ Windows では対応付けたままのファイルを消せない。例外のトレースバックが memmap を参照していると
+    del だけでは解放されないので、明示的に閉じる (閉じた後は pcm とその切り出しを読まないこと)
+    """
+    mm = getattr(pcm, "_mmap", None)
+    if mm is not None:
+        mm.close()
+
+
+def plan_windows(total_seconds: float, window: float = WINDOW_SECONDS, overlap: float = OVERLAP_SECONDS) -> List[Window]:
+    if total_seconds <= window:
+        return [Window(0.0, total_seconds, 0.0, total_seconds)]
+    starts = [0.0]
+    while starts[-1] + window < total_seconds:
+        starts.append(starts[-1] + window - overlap)
+    # 前の窓の終わりより先が重なり (overlap) 以下しか残らない場合は、最後の窓を作らず前の窓を録音の終わりまで延ばす
+    # (短すぎる窓を作らず、同じ区間を二度処理しない。延ばした窓も window + overlap 秒まで)
+    if len(starts) > 1 and total_seconds - (starts[-2] + window) <= overlap:
+        starts.pop()
+    windows = []
+    for i, start in enumerate(starts):
+        end = total_seconds if i == len(starts) - 1 else start + window
+        core_start = 0.0 if i == 0 else (start + windows[-1].end) / 2
+        windows.append(Window(start, end, core_start, total_seconds))
+        if i > 0:
+            windows[-2] = windows[-2]._replace(core_end=core_start)
+    return windows
+
+
+def window_samples(pcm: Any, window: Window, sample_rate: int):
+    """窓の範囲を float32 (-1.0〜1.0) にしたコピーを返す (memmap 全体は読み込まない)"""
+    import numpy as np
+
+    first = int(round(window.start * sample_rate))
+    last = int(round(window.end * sample_rate))
+    return np.asarray(pcm[first:last], dtype=np.float32) / 32768.0
+
+
+def take_core_segments(segments: List[Dict[str, Any]], window: Window) -> List[Dict[str, Any]]:
+    """窓内の時刻のセグメントを録音全体の時刻に直し、開始時刻が担当範囲にあるものだけを返す"""
+    out = []
+    for seg in segments:
+        start = round(seg["start"] + window.start, 2)
+        if not (window.core_start <= start < window.core_end):
+            continue
+        out.append({**seg, "start": start, "end": round(seg["end"] + window.start, 2)})
+    return out
+
+
+def _normalize(vec):
+    import numpy as np
+
+    vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else None
+
+
+class SpeakerLinker:
+    """窓ごとの話者ラベルを、声の埋め込みで録音全体の通しラベル (SPEAKER_00, ...) に対応付ける"""
+
+    def __init__(self, threshold: float = SPEAKER_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self.centroids: List[Any] = []   # 通しラベル i の埋め込みの平均 (正規化済み)
+        self.counts: List[int] = []
+
+    def _new_speaker(self, emb: Optional[Any]) -> int:
+        self.centroids.append(emb)
+        self.counts.append(1)
+        return len(self.centroids) - 1
+
+    def link(self, embeddings: Dict[str, Optional[Any]]) -> Dict[str, str]:
+        """{窓の話者ラベル: 埋め込み (無ければ None)} → {窓の話者ラベル: 通しラベル}"""
+        import numpy as np
+
+        local = {label: _normalize(emb) if emb is not None else None for label, emb in embeddings.items()}
+        # 類似度の高い組から1対1で対応付ける (同じ窓の2人を同じ話者にしない)
+        pairs = []
+        for label, emb in local.items():
+            if emb is None:
+                continue
+            for i, centroid in enumerate(self.centroids):
+                if centroid is not None:
+                    pairs.append((float(np.dot(emb, centroid)), label, i))
+        mapping: Dict[str, int] = {}
+        used = set()
+        for sim, label, i in sorted(pairs, key=lambda p: p[0], reverse=True):
+            if sim < self.threshold:
+                break
+            if label in mapping or i in used:
+                continue
+            mapping[label] = i
+            used.add(i)
+            # 重心を更新する (その話者の声の変化に追従)
+            n = self.counts[i]
+            self.centroids[i] = _normalize(self.centroids[i] * n + local[label])
+            self.counts[i] = n + 1
+        for label in sorted(local):
+            if label not in mapping:
+                mapping[label] = self._new_speaker(local[label])
+        return {label: f"SPEAKER_{i:02d}" for label, i in mapping.items()}
+
+
+def relabel(segments: List[Dict[str, Any]], mapping: Dict[str, str]) -> List[Dict[str, Any]]:
+    for seg in segments:
+        if seg.get("speaker") != UNKNOWN_SPEAKER:
+            seg["speaker"] = mapping.get(seg.get("speaker"), seg.get("speaker"))
+    return segments
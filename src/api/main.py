@@ -1,90 +1,47 @@
 import os
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Body, Depends, Header, Query, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Body, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from contextlib import asynccontextmanager
-from typing import List, Dict, Any, Optional
-import databases
+from typing import Iterable, List, Dict, Any, Optional
 import sqlalchemy
 from pydantic import BaseModel
 import datetime
 from datetime import timezone
 import uuid
+import asyncio
+import hmac
+import json
+import time
 
-# --- 設定 ---
-DATABASE_URL = "sqlite:///./koeno_app.db"
-database = databases.Database(DATABASE_URL)
-metadata = sqlalchemy.MetaData()
+from http_cache import build_etag, is_not_modified, not_modified_response, set_validators, to_utc
+from fast_json import FastJSONResponse, fast_json_response, raw_json_column, rows_to_dicts, utc_iso_column
+from status_bus import StatusBroker, make_event
+from audio_stream import audio_media_type, range_file_response, range_response
+import archive_store
+import care_aggregates
+import care_touch_index as touch_index
+from audio_probe import probe_duration
+from job_scheduler import estimate_positions, load_queue
+from admission import UploadAdmission
+from export_stream import EXPORT_FORMATS, keyset_pages, stream_export
+from summary_drafts import user_transcript
+from assignment_delta import DeltaError, apply_changes, assigned_users, users_with_changed_transcript
+import change_feed
+import job_queue
+import summary_queue
+import transcription_tiers
+from waveform_peaks import peaks_path_for, save_peaks
 
-# --- テーブル定義 ---
-
-# 1. 介護士マスタ
-caregivers = sqlalchemy.Table(
-    "caregivers", metadata,
-    sqlalchemy.Column("caregiver_id", sqlalchemy.String, primary_key=True),
-    sqlalchemy.Column("name", sqlalchemy.String, nullable=True),
-    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC), nullable=True),
-    sqlalchemy.Column("qr_token", sqlalchemy.String, nullable=True),
-)
-
-# 2. 管理者テーブル
-administrators = sqlalchemy.Table(
-    "administrators", metadata,
-    sqlalchemy.Column("admin_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
-    sqlalchemy.Column("caregiver_id", sqlalchemy.String, sqlalchemy.ForeignKey("caregivers.caregiver_id"), unique=True),
-    sqlalchemy.Column("role", sqlalchemy.String, default="owner"),
-    sqlalchemy.Column("granted_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC))
-)
-
-# 3. 録音データ
-recordings = sqlalchemy.Table(
-    "recordings", metadata,
-    sqlalchemy.Column("recording_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
-    sqlalchemy.Column("caregiver_id", sqlalchemy.String, index=True),
-    sqlalchemy.Column("audio_file_path", sqlalchemy.String),
-    sqlalchemy.Column("memo_text", sqlalchemy.Text),
-    sqlalchemy.Column("ai_status", sqlalchemy.String, default="pending", index=True),
-    sqlalchemy.Column("transcription_result", sqlalchemy.JSON),
-    sqlalchemy.Column("assignment_snapshot", sqlalchemy.JSON, nullable=True),
-    sqlalchemy.Column("summary_drafts", sqlalchemy.JSON, nullable=True),
-    sqlalchemy.Column("created_at", sqlalchemy.DateTime),
-)
-
-# 4. 日報
-care_records = sqlalchemy.Table(
-    "care_records", metadata,
-    sqlalchemy.Column("care_record_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
-    sqlalchemy.Column("user_id", sqlalchemy.String, index=True),
-    sqlalchemy.Column("record_date", sqlalchemy.String, index=True),
-    sqlalchemy.Column("final_text", sqlalchemy.Text),
-    sqlalchemy.Column("care_touch_data", sqlalchemy.JSON, nullable=True),
-    sqlalchemy.Column("last_updated_by", sqlalchemy.String),
-    sqlalchemy.Column("updated_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC))
-)
-
-# 5. 録音の紐づけ管理
-recording_assignments = sqlalchemy.Table(
-    "recording_assignments", metadata,
-    sqlalchemy.Column("assignment_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
-    sqlalchemy.Column("recording_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("recordings.recording_id"), index=True),
-    sqlalchemy.Column("user_id", sqlalchemy.String, index=True),
-    sqlalchemy.Column("assigned_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC)),
-    sqlalchemy.Column("assigned_by", sqlalchemy.String)
-)
-
-# 6. ケアイベント
-care_events = sqlalchemy.Table(
-    "care_events", metadata,
-    sqlalchemy.Column("event_id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
-    sqlalchemy.Column("user_id", sqlalchemy.String, index=True),
-    sqlalchemy.Column("event_timestamp", sqlalchemy.DateTime, index=True),
-    sqlalchemy.Column("event_type", sqlalchemy.String, default="care_touch"),
-    sqlalchemy.Column("care_touch_data", sqlalchemy.JSON, nullable=True),
-    sqlalchemy.Column("note_text", sqlalchemy.Text, nullable=True),
-    sqlalchemy.Column("recorded_by", sqlalchemy.String),
-    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.datetime.now(datetime.UTC)),
+# --- DB 接続とテーブル定義 (db.py。ワーカー・CLI と共有) ---
+from db import (
+    DATABASE_URL, database, metadata,
+    caregivers, administrators, recordings, care_records, recording_assignments, care_events,
+    recording_archive, care_touch_daily, care_touch_index, summary_cache,
+    immediate_transaction,
 )
 
 # --- Pydanticモデル ---
@@ -138,6 +95,16 @@ class TranscriptionResponse(BaseModel):
     ai_status: str
     transcription_data: Optional[Any]
     summary_drafts: Optional[Dict[str, str]] = None
+    assignment_version: int = 0 # 差分更新 (PATCH /recordings/{id}/assignments) の base_version に渡す
+    transcription_tier: str = transcription_tiers.FAST # fast / accurate (POST /recordings/{id}/upgrade_transcription で高精度)
+    queue_position: Optional[int] = None # pending/processing の間のみ (処理中は 0)
+    eta_seconds: Optional[int] = None    # 完了までの予想秒数
+
+class QueueStatus(BaseModel):
+    recording_id: int
+    ai_status: str
+    queue_position: int
+    eta_seconds: int
 
 class AssignmentInput(BaseModel):
     recording_id: int
@@ -145,6 +112,19 @@ class AssignmentInput(BaseModel):
     assignment_snapshot: List[Dict[str, Any]]
     summary_drafts: Dict[str, str]
 
+class AssignmentChange(BaseModel):
+    op: str # update / insert / delete / move (assignment_delta.py)
+    id: Optional[str] = None
+    set: Optional[Dict[str, Any]] = None
+    row: Optional[Dict[str, Any]] = None
+    after: Optional[str] = None
+
+class AssignmentPatchInput(BaseModel):
+    base_version: int
+    changes: List[AssignmentChange]
+    user_ids: Optional[List[str]] = None # 省略時はスナップショットの割当グループから決める
+    summary_drafts: Dict[str, Optional[str]] = {} # 変更した草案だけ (None で削除)
+
 class AssignedRecording(BaseModel):
     recording_id: int
     caregiver_id: str
@@ -152,6 +132,7 @@ class AssignedRecording(BaseModel):
     created_at: str # ★ strに変更
     assignment_snapshot: Optional[Any] = None
     summary_drafts: Optional[Dict[str, str]] = None
+    assignment_version: int = 0
 
 class CareEventInput(BaseModel):
     user_id: str
@@ -170,6 +151,52 @@ class CareEventOutput(BaseModel):
     note_text: Optional[str] = None
     recorded_by: Optional[str] = None
 
+class DayView(BaseModel):
+    care_record: CareRecordDetail
+    daily_events: List[CareEventOutput]
+    assigned_recordings: List[AssignedRecording]
+
+class CareTouchCounts(BaseModel):
+    events: int
+    tags: Dict[str, int]
+    conditions: Dict[str, int]
+    places: Dict[str, int]
+
+class CareTouchDay(BaseModel):
+    date: str
+    categories: Dict[str, CareTouchCounts]
+
+class CareTouchSearchResult(BaseModel):
+    items: List[Dict[str, Any]]
+    next_after_id: Optional[int] = None # 続きを取る場合に after_id に渡す
+
+class CareTouchMonthly(BaseModel):
+    user_id: str
+    month: str
+    days: List[CareTouchDay]
+    totals: Dict[str, CareTouchCounts]
+
+# (ワーカー用ジョブ API)
+class JobClaimInput(BaseModel):
+    worker_id: str
+
+class JobProgressInput(BaseModel):
+    worker_id: str
+    stage: Optional[str] = None
+    progress: Optional[float] = None
+
+class JobCompleteInput(BaseModel):
+    worker_id: str
+    result: Any
+    audio_duration: Optional[float] = None
+    processing_seconds: Optional[float] = None
+    peaks: Optional[Dict[str, Any]] = None # ワーカー側で作った波形ピーク (audiowaveform JSON形式)
+
+class JobFailInput(BaseModel):
+    worker_id: str
+    error: str
+    retryable: bool = True
+
 # --- ユーティリティ: タイムゾーン付与 & 文字列化 ---
 def ensure_utc_iso(dt: Any) -> Optional[str]:
     """SQLiteから取得したNaiveなdatetimeを、必ず 'Z' 付きのUTC ISO文字列に変換する"""
@@ -184,28 +211,63 @@ def ensure_utc_iso(dt: Any) -> Optional[str]:
     # isoformat() は +00:00 を返すが、ブラウザ互換性のため Z に置換するのが無難
     return dt.isoformat().replace("+00:00", "Z")
 
+# --- ai_status のプッシュ配信 (SSE) ---
+async def _recording_owner(recording_id: Any) -> Optional[str]:
+    res = await database.fetch_one(sqlalchemy.select(recordings.c.caregiver_id).where(recordings.c.recording_id == recording_id))
+    return res.caregiver_id if res else None
+
+status_broker = StatusBroker(_recording_owner)
+UPLOAD_DIR = "uploads"
+upload_admission = UploadAdmission(database, recordings, UPLOAD_DIR)
+
+# 別マシンのワーカー用のトークン (カンマ区切り)。未設定ならジョブ API は無効
+WORKER_TOKENS = [t.strip() for t in os.environ.get("KOENO_WORKER_TOKENS", "").split(",") if t.strip()]
+
+# SSE の keep-alive 間隔 (秒)。プロキシ (Caddy/ngrok) のアイドル切断を防ぐ
+SSE_HEARTBEAT_SECONDS = 15
+
 # --- ライフサイクル管理 ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    engine = sqlalchemy.create_engine(DATABASE_URL)
-    metadata.create_all(engine)
+    # スキーマを最新版に揃える (最新版なら schema_version を読むだけで終わる)
+    from migrations import upgrade
+    upgrade()
     await database.connect()
     print("--- データベース接続完了 ---")
+    await status_broker.start()
     yield
+    status_broker.stop()
     await database.disconnect()
     print("データベース接続を切断しました。")
 
 # --- アプリ定義 ---
 app = FastAPI(lifespan=lifespan)
 
+# ★ アップロードの受け入れ制御 (admission.py)。本文を受け取る前に判定し、断るアップロードでディスクを使わない
+# (後から登録したミドルウェアほど外側になる。CORS と strip_api_prefix より内側で動くよう最初に登録する)
+@app.middleware("http")
+async def upload_admission_control(request: Request, call_next):
+    if request.method == "POST" and request.url.path == "/upload_recording":
+        length = request.headers.get("content-length")
+        decision = await upload_admission.check(int(length) if length and length.isdigit() else None)
+        if not decision.admit:
+            print(f"アップロードを一時的に拒否しました ({decision.reason}, Retry-After {decision.retry_after}秒): {decision.stats}")
+            body = {"detail": "Server busy", **decision.to_dict()}
+            return FastJSONResponse(status_code=503, content=body, headers={"Retry-After": str(decision.retry_after)})
+    return await call_next(request)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Retry-After"],
 )
 
+# 大きなJSON (文字起こし・スナップショット) は gzip 圧縮して返す
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 @app.middleware("http")
 async def strip_api_prefix(request: Request, call_next):
     if request.url.path.startswith("/api/"):
@@ -224,7 +286,7 @@ async def upload_recording(
     memo_text: str = Form(...),
     created_at_iso: str = Form(...) 
 ):
-    upload_dir = "uploads"
+    upload_dir = UPLOAD_DIR
     os.makedirs(upload_dir, exist_ok=True)
     try:
         client_created_at = datetime.datetime.fromisoformat(created_at_iso)
@@ -235,18 +297,27 @@ async def upload_recording(
     
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     safe_id = caregiver_id.replace(":", "_")
-    filename = os.path.join(upload_dir, f"{safe_id}_{timestamp}_{audio_blob.filename}")
+    # (同一秒の一括同期でファイル名が衝突しないよう短いランダム値を付与。アーカイブ時の削除対象を一意にする)
+    filename = os.path.join(upload_dir, f"{safe_id}_{timestamp}_{uuid.uuid4().hex[:8]}_{audio_blob.filename}")
     with open(filename, "wb") as f:
         f.write(await audio_blob.read())
+    # ★ スケジューラが短い録音を優先できるよう、長さを先に調べておく (ffprobe は別スレッドで)
+    audio_duration = await asyncio.to_thread(probe_duration, filename)
 
+    now = datetime.datetime.now(timezone.utc)
     query = recordings.insert().values(
         caregiver_id=caregiver_id,
         audio_file_path=os.path.abspath(filename),
         memo_text=memo_text,
         ai_status="pending",
-        created_at=created_at_utc
+        created_at=created_at_utc,
+        updated_at=now,
+        audio_duration=audio_duration,
+        queued_at=now,
     )
     last_id = await database.execute(query)
+    upload_admission.admitted()
+    await status_broker.dispatch({"recording_id": last_id, "ai_status": "pending", "stage": None, "progress": None})
     return {"recording_id": last_id, "ai_status": "pending", "message": "Accepted"}
 
 # 2. 認証 (ID入力)
@@ -271,29 +342,45 @@ async def get_dates(user_id: str = Query(...)):
     q = sqlalchemy.select(care_records.c.record_date).where(care_records.c.user_id == user_id).distinct()
     return {"dates": [r.record_date for r in await database.fetch_all(q)]}
 
-@app.get("/care_record_detail", response_model=CareRecordDetail)
-async def get_detail(user_id: str = Query(...), record_date: str = Query(...)):
-    q = care_records.select().where((care_records.c.user_id == user_id) & (care_records.c.record_date == record_date)).order_by(care_records.c.updated_at.desc()).limit(1)
+async def fetch_care_record_detail(user_id: str, record_date: str) -> Dict[str, Any]:
+    q = sqlalchemy.select(
+        care_records.c.user_id, care_records.c.record_date, care_records.c.final_text, care_records.c.care_touch_data,
+        care_records.c.last_updated_by, care_records.c.updated_at,
+    ).where((care_records.c.user_id == user_id) & (care_records.c.record_date == record_date)).order_by(care_records.c.updated_at.desc()).limit(1)
     res = await database.fetch_one(q)
     if not res: 
-        return CareRecordDetail(user_id=user_id, record_date=record_date, final_text="", care_touch_data=None)
+        return CareRecordDetail(user_id=user_id, record_date=record_date, final_text="", care_touch_data=None).model_dump()
     # ★ 日時変換
-    data = dict(res)
+    data = rows_to_dicts([res])[0]
     if data.get("updated_at"):
         data["updated_at"] = ensure_utc_iso(data["updated_at"])
     return data
 
+@app.get("/care_record_detail", response_model=CareRecordDetail)
+async def get_detail(user_id: str = Query(...), record_date: str = Query(...)):
+    return await fetch_care_record_detail(user_id, record_date)
+
 @app.post("/save_care_record", status_code=201)
 async def save_record(inp: CareRecordInput = Body(...), caller: str = Header(..., alias="X-Caller-ID")):
     q_check = care_records.select().where((care_records.c.user_id == inp.user_id) & (care_records.c.record_date == inp.record_date))
     exists = await database.fetch_one(q_check)
     now = datetime.datetime.now(datetime.UTC)
     if exists:
-        await database.execute(care_records.update().where(care_records.c.care_record_id == exists.care_record_id).values(final_text=inp.final_text, care_touch_data=inp.care_touch_data, last_updated_by=caller, updated_at=now))
+        async with database.transaction():
+            await database.execute(care_records.update().where(care_records.c.care_record_id == exists.care_record_id).values(final_text=inp.final_text, care_touch_data=inp.care_touch_data, last_updated_by=caller, updated_at=now))
+            await replace_care_touch_index("record", exists.care_record_id, touch_index.record_index_rows(exists.care_record_id, inp.user_id, inp.record_date, inp.care_touch_data))
         return {"status": "updated"}
-    await database.execute(care_records.insert().values(user_id=inp.user_id, record_date=inp.record_date, final_text=inp.final_text, care_touch_data=inp.care_touch_data, last_updated_by=caller, updated_at=now))
+    async with database.transaction():
+        record_id = await database.execute(care_records.insert().values(user_id=inp.user_id, record_date=inp.record_date, final_text=inp.final_text, care_touch_data=inp.care_touch_data, last_updated_by=caller, updated_at=now))
+        await replace_care_touch_index("record", record_id, touch_index.record_index_rows(record_id, inp.user_id, inp.record_date, inp.care_touch_data))
     return {"status": "created"}
 
+async def replace_care_touch_index(source: str, source_id: int, rows: List[Dict[str, Any]]):
+    """索引 (care_touch_index) の該当行を入れ替える (呼び出し側のトランザクション内で)"""
+    await database.execute(care_touch_index.delete().where((care_touch_index.c.source == source) & (care_touch_index.c.source_id == source_id)))
+    if rows:
+        await database.execute_many(care_touch_index.insert(), rows)
+
 # 4. 録音管理
 @app.get("/unassigned_recordings", response_model=List[UnassignedRecording])
 async def get_unassigned(caregiver_id: str = Query(...), record_date: str = Query(...)):
@@ -302,29 +389,192 @@ async def get_unassigned(caregiver_id: str = Query(...), record_date: str = Quer
     q = recordings.select().where((recordings.c.caregiver_id == caregiver_id) & (jst_date == record_date))
     if assigned_ids: q = q.where(sqlalchemy.not_(recordings.c.recording_id.in_(assigned_ids)))
     
+    # ★ 高速経路: 必要なカラムだけを取得し、日時はSQL側でISO文字列化する
+    q = q.with_only_columns(recordings.c.recording_id, recordings.c.caregiver_id, recordings.c.memo_text, recordings.c.ai_status, utc_iso_column(recordings.c.created_at))
     rows = await database.fetch_all(q.order_by(recordings.c.created_at.desc()))
-    # ★ 修正: 強制的にISO文字列化
-    return [
-        {**dict(r), "created_at": ensure_utc_iso(r["created_at"])} for r in rows
-    ]
+    return fast_json_response(rows_to_dicts(rows))
 
-@app.get("/assigned_recordings", response_model=List[AssignedRecording])
-async def get_assigned(user_id: str = Query(...), record_date: str = Query(...)):
+def _assigned_source(user_id: str, record_date: str):
     jst_date = sqlalchemy.func.date(sqlalchemy.func.datetime(recordings.c.created_at, '+9 hours'))
     j = sqlalchemy.join(recording_assignments, recordings, recording_assignments.c.recording_id == recordings.c.recording_id)
-    q = sqlalchemy.select(recordings.c.recording_id, recordings.c.caregiver_id, recordings.c.memo_text, recordings.c.created_at, recordings.c.assignment_snapshot, recordings.c.summary_drafts).select_from(j).where((recording_assignments.c.user_id == user_id) & (jst_date == record_date)).order_by(recordings.c.created_at.asc())
-    
-    rows = await database.fetch_all(q)
-    # ★ 修正: 強制的にISO文字列化
-    return [
-        {**dict(r), "created_at": ensure_utc_iso(r["created_at"])} for r in rows
-    ]
+    cond = (recording_assignments.c.user_id == user_id) & (jst_date == record_date)
+    return j, cond
+
+async def fetch_assigned_version(user_id: str, record_date: str):
+    """条件付きGET用: 本体を読まずに (件数, 最終更新, 最大割当ID) を集計する"""
+    j, cond = _assigned_source(user_id, record_date)
+    v = await database.fetch_one(sqlalchemy.select(
+        sqlalchemy.func.count().label("n"),
+        sqlalchemy.func.max(recordings.c.updated_at).label("last"),
+        sqlalchemy.func.max(recording_assignments.c.assignment_id).label("max_id"),
+    ).select_from(j).where(cond))
+    last_modified = to_utc(v["last"])
+    return ("assigned", user_id, record_date, v["n"], last_modified, v["max_id"]), last_modified
+
+async def fetch_assigned_rows(user_id: str, record_date: str) -> List[Dict[str, Any]]:
+    # ★ 高速経路: 日時はSQL側でISO文字列化、JSONカラムは生文字列で取得してまとめてデコード
+    j, cond = _assigned_source(user_id, record_date)
+    # アーカイブ済みの録音はスナップショットが recording_archive 側にあるので外部結合で取る
+    j = j.outerjoin(recording_archive, recording_archive.c.recording_id == recordings.c.recording_id)
+    q = sqlalchemy.select(recordings.c.recording_id, recordings.c.caregiver_id, recordings.c.memo_text, utc_iso_column(recordings.c.created_at), raw_json_column(recordings.c.assignment_snapshot), raw_json_column(recordings.c.summary_drafts), recordings.c.assignment_version, recording_archive.c.assignment_snapshot_z).select_from(j).where(cond).order_by(recordings.c.created_at.asc())
+    rows = rows_to_dicts(await database.fetch_all(q), ("assignment_snapshot", "summary_drafts"))
+    for row in rows:
+        archived = row.pop("assignment_snapshot_z")
+        if row["assignment_snapshot"] is None and archived is not None:
+            row["assignment_snapshot"] = archive_store.decompress_json(archived)
+    return rows
+
+@app.get("/assigned_recordings", response_model=List[AssignedRecording])
+async def get_assigned(request: Request, user_id: str = Query(...), record_date: str = Query(...)):
+    version, last_modified = await fetch_assigned_version(user_id, record_date)
+    etag = build_etag(*version)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+
+    response = fast_json_response(await fetch_assigned_rows(user_id, record_date))
+    set_validators(response, etag, last_modified)
+    return response
 
 @app.get("/recording_transcription/{recording_id}", response_model=TranscriptionResponse)
-async def get_transcription(recording_id: int, caller: str = Header(..., alias="X-Caller-ID")):
+async def get_transcription(recording_id: int, request: Request, response: Response, caller: str = Header(..., alias="X-Caller-ID")):
+    # ★ 条件付きGET: まず軽いカラムだけで権限と版数を確認し、変化がなければJSON本体は読まない
+    head = await database.fetch_one(sqlalchemy.select(recordings.c.caregiver_id, recordings.c.ai_status, recordings.c.created_at, recordings.c.updated_at).where(recordings.c.recording_id == recording_id))
+    if not head or head.caregiver_id != caller: raise HTTPException(403, "Access denied")
+    last_modified = to_utc(head.updated_at or head.created_at)
+    queue_info = {}
+    if head.ai_status in ("pending", "processing"):
+        # 順番待ち・完了予想は行を更新せずに変わるため、ETag に含める
+        queue_info = (await fetch_queue_positions([recording_id])).get(recording_id, {})
+    etag = build_etag("transcription", recording_id, head.ai_status, last_modified, queue_info.get("queue_position"), queue_info.get("eta_seconds"))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+
     res = await database.fetch_one(recordings.select().where(recordings.c.recording_id == recording_id))
-    if not res or res.caregiver_id != caller: raise HTTPException(403, "Access denied")
-    return {"recording_id": res.recording_id, "ai_status": res.ai_status, "transcription_data": res.assignment_snapshot or res.transcription_result, "summary_drafts": res.summary_drafts or {}}
+    if not res: raise HTTPException(403, "Access denied")
+    snapshot, transcription = res.assignment_snapshot, res.transcription_result
+    if res.archived_at and snapshot is None and transcription is None:
+        # アーカイブ済み: 圧縮した側テーブルから透過的に復元する
+        cold = await database.fetch_one(recording_archive.select().where(recording_archive.c.recording_id == recording_id))
+        if cold:
+            snapshot = archive_store.decompress_json(cold.assignment_snapshot_z)
+            transcription = archive_store.decompress_json(cold.transcription_result_z)
+    return {"recording_id": res.recording_id, "ai_status": res.ai_status, "transcription_data": snapshot or transcription, "summary_drafts": res.summary_drafts or {}, "assignment_version": res.assignment_version, "transcription_tier": transcription_tiers.normalize(res.transcription_tier), **queue_info}
+
+# ★ 順番待ち・完了予想は待ち行列全体を読んで計算するため、QUEUE_POSITIONS_CACHE_SECONDS 秒だけ使い回す
+# (処理待ちの録音のポーリング (条件付きGET) が、304 を返すだけの場合も毎回スケジューラを回さないため)
+# 見積もりは未完了の録音を全件含むので、呼び出し側が渡した未完了の録音 (required_ids) が無ければ
+# 使い回した後に登録された録音。その場合は待たずに計算し直す (アップロード直後の録音が一覧から消えないように)
+QUEUE_POSITIONS_CACHE_SECONDS = 5.0
+_queue_positions: Dict[str, Any] = {"value": None, "loaded_at": 0.0}
+_queue_positions_lock = asyncio.Lock()
+
+async def fetch_queue_positions(required_ids: Iterable[int] = ()) -> Dict[int, Dict[str, Any]]:
+    async with _queue_positions_lock:
+        cached = _queue_positions["value"]
+        if cached is None or time.monotonic() - _queue_positions["loaded_at"] > QUEUE_POSITIONS_CACHE_SECONDS or any(rid not in cached for rid in required_ids):
+            now = datetime.datetime.now(timezone.utc)
+            _queue_positions["value"] = estimate_positions(await load_queue(database, recordings, now), now)
+            _queue_positions["loaded_at"] = time.monotonic()
+        return _queue_positions["value"]
+
+@app.get("/recording_queue", response_model=List[QueueStatus])
+async def get_recording_queue(caller: str = Header(..., alias="X-Caller-ID")):
+    """自分の未完了の録音の順番待ち (処理中は 0) と完了までの予想秒数を返す"""
+    rows = await database.fetch_all(sqlalchemy.select(recordings.c.recording_id, recordings.c.ai_status).where((recordings.c.caregiver_id == caller) & recordings.c.ai_status.in_(["pending", "processing"])).order_by(recordings.c.recording_id))
+    if not rows:
+        return []
+    positions = await fetch_queue_positions([r.recording_id for r in rows])
+    return [{"recording_id": r.recording_id, "ai_status": r.ai_status, **positions[r.recording_id]} for r in rows if r.recording_id in positions]
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/recording_events")
+async def recording_events(request: Request, caregiver_id: Optional[str] = Query(None), caller: Optional[str] = Header(None, alias="X-Caller-ID")):
+    """
+    介護士の録音の ai_status / 進捗を Server-Sent Events で配信する。
+    (EventSource はヘッダーを付けられないため、caregiver_id クエリでも受け付ける)
+    """
+    cid = caller or caregiver_id
+    if not cid or not await database.fetch_one(caregivers.select().where(caregivers.c.caregiver_id == cid)):
+        raise HTTPException(403, "Access denied")
+
+    queue = status_broker.subscribe(cid)
+
+    async def stream():
+        try:
+            # 接続直後に未完了の録音の現状を送り、切断中の取りこぼしを埋める
+            rows = await database.fetch_all(sqlalchemy.select(recordings.c.recording_id, recordings.c.ai_status).where((recordings.c.caregiver_id == cid) & recordings.c.ai_status.in_(["pending", "processing"])))
+            yield _sse("snapshot", [{"recording_id": r.recording_id, "ai_status": r.ai_status} for r in rows])
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse("status", event)
+        finally:
+            status_broker.unsubscribe(cid, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def _fetch_owned_audio(recording_id: int, caller: Optional[str]):
+    # get_transcription と同じく、録音した本人 (caregiver_id) のみアクセス可
+    res = await database.fetch_one(sqlalchemy.select(recordings.c.caregiver_id, recordings.c.audio_file_path, recordings.c.audio_archive).where(recordings.c.recording_id == recording_id))
+    if not res or not caller or res.caregiver_id != caller: raise HTTPException(403, "Access denied")
+    if not res.audio_file_path: raise HTTPException(404, "Audio not found")
+    return res
+
+@app.get("/recording_audio/{recording_id}")
+async def get_recording_audio(recording_id: int, request: Request, caregiver_id: Optional[str] = Query(None), caller: Optional[str] = Header(None, alias="X-Caller-ID")):
+    """録音音声を Range 対応で配信する (<audio> はヘッダーを付けられないため caregiver_id クエリも受け付ける)"""
+    res = await _fetch_owned_audio(recording_id, caller or caregiver_id)
+    return _audio_response(request, recording_id, res)
+
+def _audio_response(request: Request, recording_id: int, res):
+    if res.audio_archive:
+        # アーカイブ済み: 月別 zip のメンバーをそのまま Range 配信する
+        try:
+            size = archive_store.audio_member_size(res.audio_archive, recording_id, res.audio_file_path)
+        except (OSError, KeyError):
+            raise HTTPException(404, "Audio not found")
+        opener = lambda: archive_store.open_audio(res.audio_archive, recording_id, res.audio_file_path)
+        return range_response(request, size, opener, f'"a{recording_id}-{size}"', audio_media_type(res.audio_file_path))
+    if not os.path.exists(res.audio_file_path): raise HTTPException(404, "Audio not found")
+    return range_file_response(request, res.audio_file_path)
+
+@app.get("/recording_peaks/{recording_id}")
+async def get_recording_peaks(recording_id: int, caregiver_id: Optional[str] = Query(None), caller: Optional[str] = Header(None, alias="X-Caller-ID")):
+    """ワーカーが事前計算した波形ピーク (audiowaveform JSON形式) を返す (アーカイブ後も元の場所に残る)"""
+    path = peaks_path_for((await _fetch_owned_audio(recording_id, caller or caregiver_id)).audio_file_path)
+    if not os.path.exists(path): raise HTTPException(404, "Peaks not ready")
+    return FileResponse(path, media_type="application/json")
+
+# ★ 高精度での再処理 (transcription_tiers.py): この録音だけ大きいモデル + ビームサーチで文字起こしし直す
+# 優先度を上げて待ち行列に入れ直す (他の録音より先に処理される)。処理中・割当済み・アーカイブ済みの録音は 409
+# 高精度で処理済み・待ち中の録音にもう一度依頼しても何もしない (失敗した場合だけ入れ直す)
+@app.post("/recordings/{recording_id}/upgrade_transcription")
+async def upgrade_transcription(recording_id: int, caller: str = Header(..., alias="X-Caller-ID")):
+    now = datetime.datetime.now(datetime.UTC)
+    tier = sqlalchemy.func.coalesce(recordings.c.transcription_tier, transcription_tiers.FAST)
+    upgradable = (recordings.c.ai_status == "failed") | (recordings.c.ai_status.in_(["pending", "completed"]) & (tier != transcription_tiers.ACCURATE))
+    async with database.transaction():
+        # 先に条件付き UPDATE で書き込みロックを取る (ワーカーの取得と取り合わない。断る場合はロールバックする)
+        await database.execute(recordings.update().where((recordings.c.recording_id == recording_id) & upgradable).values(
+            transcription_tier=transcription_tiers.ACCURATE, priority=transcription_tiers.UPGRADE_PRIORITY,
+            ai_status="pending", attempts=0, next_attempt_at=None, last_error=None, queued_at=now, updated_at=now,
+        ))
+        queued = bool(await database.fetch_val("SELECT changes()"))
+        res = await database.fetch_one(sqlalchemy.select(recordings.c.caregiver_id, recordings.c.ai_status, recordings.c.transcription_tier, recordings.c.assignment_snapshot, recordings.c.archived_at).where(recordings.c.recording_id == recording_id))
+        if not res or res.caregiver_id != caller: raise HTTPException(403, "Access denied")
+        if res.archived_at: raise HTTPException(409, "Recording archived")
+        # (割当済みの録音は画面がスナップショットを表示するため、文字起こしを作り直しても反映されない)
+        if res.assignment_snapshot: raise HTTPException(409, "Already assigned")
+        if not queued and res.ai_status == "processing": raise HTTPException(409, "Recording is processing")
+    if queued:
+        await status_broker.dispatch(make_event(recording_id, "pending"))
+    return {"recording_id": recording_id, "ai_status": res.ai_status, "transcription_tier": transcription_tiers.normalize(res.transcription_tier), "queued": queued}
 
 @app.post("/save_assignments", status_code=201)
 async def save_assign(inp: AssignmentInput = Body(...), caller: str = Header(..., alias="X-Caller-ID")):
@@ -333,8 +583,60 @@ async def save_assign(inp: AssignmentInput = Body(...), caller: str = Header(...
         if inp.user_ids:
             vals = [{"recording_id": inp.recording_id, "user_id": u, "assigned_at": datetime.datetime.now(datetime.UTC), "assigned_by": caller} for u in inp.user_ids]
             await database.execute_many(recording_assignments.insert(), vals)
-        await database.execute(recordings.update().where(recordings.c.recording_id == inp.recording_id).values(assignment_snapshot=inp.assignment_snapshot, summary_drafts=inp.summary_drafts))
-    return {"status": "success"}
+        # ★ サーバーが作った草案は残し、画面から送られた草案で上書きする (割当から外れた入居者の分は捨てる)
+        existing = await database.fetch_val(sqlalchemy.select(recordings.c.summary_drafts).where(recordings.c.recording_id == inp.recording_id)) or {}
+        drafts = {u: t for u, t in {**existing, **inp.summary_drafts}.items() if u in inp.user_ids}
+        # 割当が変わったら要約を作り直す (ワーカーが拾う)。人が書いた草案は上書きされない
+        summary_status = "pending" if inp.user_ids else None
+        await database.execute(recordings.update().where(recordings.c.recording_id == inp.recording_id).values(assignment_snapshot=inp.assignment_snapshot, summary_drafts=drafts, summary_status=summary_status, assignment_version=recordings.c.assignment_version + 1, updated_at=datetime.datetime.now(datetime.UTC)))
+        version = await database.fetch_val(sqlalchemy.select(recordings.c.assignment_version).where(recordings.c.recording_id == inp.recording_id))
+    return {"status": "success", "assignment_version": version}
+
+# ★ 差分更新: 変更した行だけを送り、recording_assignments も増減した入居者の行だけを書き換える (assignment_delta.py)
+# base_version が今の版と違えば (他の端末が先に保存した) 409 と今の版を返す。画面は読み直してから編集し直す
+@app.patch("/recordings/{recording_id}/assignments")
+async def patch_assignments(recording_id: int, inp: AssignmentPatchInput = Body(...), caller: str = Header(..., alias="X-Caller-ID")):
+    now = datetime.datetime.now(datetime.UTC)
+    async with database.transaction():
+        # 版を先に進める (条件付き UPDATE で書き込みロックを取り、コミットまで他の保存を待たせる)
+        await database.execute(recordings.update().where((recordings.c.recording_id == recording_id) & (recordings.c.assignment_version == inp.base_version)).values(assignment_version=inp.base_version + 1, updated_at=now))
+        bumped = await database.fetch_val("SELECT changes()")
+        res = await database.fetch_one(sqlalchemy.select(recordings.c.assignment_version, recordings.c.assignment_snapshot, recordings.c.summary_drafts, recordings.c.summary_status, recordings.c.archived_at).where(recordings.c.recording_id == recording_id))
+        if not res: raise HTTPException(404, "Recording not found")
+        if not bumped:
+            return FastJSONResponse(status_code=409, content={"detail": "Version conflict", "assignment_version": res.assignment_version})
+        snapshot = res.assignment_snapshot
+        if snapshot is None and res.archived_at:
+            cold = await database.fetch_val(sqlalchemy.select(recording_archive.c.assignment_snapshot_z).where(recording_archive.c.recording_id == recording_id))
+            snapshot = archive_store.decompress_json(cold) if cold is not None else None
+        if not isinstance(snapshot, list):
+            # まだ一度も割り当てていない録音は差分の元が無い。/save_assignments で全体を保存する
+            raise HTTPException(409, "No assignment snapshot")
+        try:
+            new_snapshot = apply_changes(snapshot, [c.model_dump(exclude_none=True) for c in inp.changes])
+        except DeltaError as e:
+            raise HTTPException(422, str(e))
+        user_ids = inp.user_ids if inp.user_ids is not None else assigned_users(new_snapshot)
+
+        # recording_assignments は増えた・減った入居者の行だけを書き換える (残る行の assigned_at は変えない)
+        current = {r.user_id for r in await database.fetch_all(sqlalchemy.select(recording_assignments.c.user_id).where(recording_assignments.c.recording_id == recording_id))}
+        removed = current - set(user_ids)
+        added = [u for u in user_ids if u not in current]
+        if removed:
+            await database.execute(recording_assignments.delete().where((recording_assignments.c.recording_id == recording_id) & recording_assignments.c.user_id.in_(removed)))
+        if added:
+            await database.execute_many(recording_assignments.insert(), [{"recording_id": recording_id, "user_id": u, "assigned_at": now, "assigned_by": caller} for u in added])
+
+        merged = {**(res.summary_drafts or {}), **inp.summary_drafts}
+        drafts = {u: t for u, t in merged.items() if t is not None and u in user_ids}
+        # 割り当てた発話が変わった入居者がいれば要約を作り直す (処理済みフラグだけの変更では作り直さない)
+        summary_status = res.summary_status
+        if not user_ids:
+            summary_status = None
+        elif added or users_with_changed_transcript(snapshot, new_snapshot, user_ids):
+            summary_status = "pending"
+        await database.execute(recordings.update().where(recordings.c.recording_id == recording_id).values(assignment_snapshot=new_snapshot, summary_drafts=drafts, summary_status=summary_status))
+    return {"status": "success", "assignment_version": inp.base_version + 1, "user_ids": user_ids, "summary_status": summary_status}
 
 # 5. 時系列イベントAPI
 @app.post("/save_event", status_code=201)
@@ -344,10 +646,15 @@ async def save_event(inp: CareEventInput = Body(...), caller: str = Header(...,
     except:
         ts = datetime.datetime.now(timezone.utc)
 
-    if inp.event_id is not None:
-        query_check = care_events.select().where(care_events.c.event_id == inp.event_id)
-        existing = await database.fetch_one(query_check)
+    new_counts = care_aggregates.event_counts(inp.user_id, ts, inp.event_type, inp.care_touch_data)
+    # ★ 更新前の行を読んでから差分を集計表に書くので、読む前に書き込みロックを取る (BEGIN IMMEDIATE)。
+    # 読んだ後に他の保存・削除が同じイベントを書き換えると、古い行との差分で集計がずれるため
+    async with immediate_transaction():
+        existing = None
+        if inp.event_id is not None:
+            existing = await database.fetch_one(care_events.select().where(care_events.c.event_id == inp.event_id))
         if existing:
+            old_counts = care_aggregates.event_counts(existing.user_id, existing.event_timestamp, existing.event_type, existing.care_touch_data)
             query_update = (
                 care_events.update()
                 .where(care_events.c.event_id == inp.event_id)
@@ -357,45 +664,179 @@ async def save_event(inp: CareEventInput = Body(...), caller: str = Header(...,
                     event_type=inp.event_type,
                     care_touch_data=inp.care_touch_data,
                     note_text=inp.note_text,
-                    recorded_by=caller
+                    recorded_by=caller,
+                    updated_at=datetime.datetime.now(timezone.utc)
                 )
             )
             await database.execute(query_update)
+            await apply_care_touch_delta(old_counts, new_counts)
+            await replace_care_touch_index("event", inp.event_id, touch_index.event_index_rows(inp.event_id, inp.user_id, ts, inp.care_touch_data))
             return {"status": "updated", "event_id": inp.event_id}
 
-    query = care_events.insert().values(
-        user_id=inp.user_id, 
-        event_timestamp=ts, 
-        event_type=inp.event_type, 
-        care_touch_data=inp.care_touch_data, 
-        note_text=inp.note_text, 
-        recorded_by=caller, 
-        created_at=datetime.datetime.now(timezone.utc)
-    )
-    last_id = await database.execute(query)
+        query = care_events.insert().values(
+            user_id=inp.user_id, 
+            event_timestamp=ts, 
+            event_type=inp.event_type, 
+            care_touch_data=inp.care_touch_data, 
+            note_text=inp.note_text, 
+            recorded_by=caller, 
+            created_at=datetime.datetime.now(timezone.utc),
+            updated_at=datetime.datetime.now(timezone.utc)
+        )
+        last_id = await database.execute(query)
+        await apply_care_touch_delta(None, new_counts)
+        await replace_care_touch_index("event", last_id, touch_index.event_index_rows(last_id, inp.user_id, ts, inp.care_touch_data))
     return {"status": "created", "event_id": last_id}
 
 @app.delete("/care_events/{event_id}", status_code=204)
 async def delete_event(event_id: int, caller: str = Header(..., alias="X-Caller-ID")):
     query = care_events.delete().where(care_events.c.event_id == event_id)
-    await database.execute(query)
+    async with immediate_transaction():
+        existing = await database.fetch_one(sqlalchemy.select(care_events.c.user_id, care_events.c.event_timestamp, care_events.c.event_type, care_events.c.care_touch_data).where(care_events.c.event_id == event_id))
+        await database.execute(query)
+        if existing:
+            await apply_care_touch_delta(care_aggregates.event_counts(existing.user_id, existing.event_timestamp, existing.event_type, existing.care_touch_data), None)
+        await replace_care_touch_index("event", event_id, [])
     return
 
-@app.get("/daily_events", response_model=List[CareEventOutput])
-async def get_daily_events(user_id: str = Query(...), date: str = Query(...)):
+async def apply_care_touch_delta(old_counts, new_counts):
+    """日別集計 (care_touch_daily) に更新前後の差分だけを反映する (呼び出し側のトランザクション内で)"""
+    delta = care_aggregates.event_delta(old_counts, new_counts)
+    for key, d in delta.items():
+        await database.execute(care_aggregates.upsert_statement(care_touch_daily, key, d))
+    if any(d < 0 for d in delta.values()):
+        await database.execute(care_touch_daily.delete().where((care_touch_daily.c.user_id.in_({k[0] for k in delta})) & (care_touch_daily.c.total <= 0)))
+
+@app.get("/care_touch_summary", response_model=CareTouchMonthly)
+async def get_care_touch_summary(user_id: str = Query(...), month: str = Query(..., description="YYYY-MM (JST)"), event_type: Optional[str] = Query(None)):
+    """入居者の月次ダッシュボード用集計 (日別・カテゴリ別の件数)。care_events は読まずに集計表だけを引く"""
+    try:
+        datetime.date.fromisoformat(month + "-01")
+    except ValueError:
+        raise HTTPException(400, "month は YYYY-MM で指定してください")
+    cond = (care_touch_daily.c.user_id == user_id) & (care_touch_daily.c.record_date >= month + "-01") & (care_touch_daily.c.record_date <= month + "-31")
+    if event_type: cond = cond & (care_touch_daily.c.event_type == event_type)
+    rows = await database.fetch_all(sqlalchemy.select(care_touch_daily.c.record_date, care_touch_daily.c.category, care_touch_daily.c.item_kind, care_touch_daily.c.item, care_touch_daily.c.total).where(cond))
+    return fast_json_response({"user_id": user_id, "month": month, **care_aggregates.summarize(rows)})
+
+SEARCH_PAGE_SIZE = 200
+
+def _parse_search_filter(raw: str, category: Optional[str]):
+    """'field:value' を検証して (field, value) にする (life_schema.json に無い項目・値は 400)"""
+    schema = touch_index.load_schema()
+    field, sep, value = raw.partition(":")
+    if not sep or field not in touch_index.INDEXED_FIELDS:
+        raise HTTPException(400, f"filter は field:value 形式で、field は {', '.join(touch_index.INDEXED_FIELDS)} のいずれかです: {raw}")
+    if field == "category":
+        value = schema.category_label(value) or value
+    if value not in schema.allowed_values(field, category):
+        raise HTTPException(400, f"life_schema.json に定義されていない値です: {raw}")
+    return field, value
+
+@app.get("/care_touch_search", response_model=CareTouchSearchResult)
+async def care_touch_search(
+    filter: List[str] = Query(..., description="field:value (複数指定はすべてに一致するもの)"),
+    source: str = Query("event", description="event (ケアイベント) / record (日報)"),
+    category: Optional[str] = Query(None, description="tag / condition / place をこのカテゴリ内に限定する"),
+    user_id: Optional[str] = Query(None),
+    start: Optional[str] = Query(None, description="JST の日付 YYYY-MM-DD (含む)"),
+    end: Optional[str] = Query(None, description="JST の日付 YYYY-MM-DD (含む)"),
+    after_id: Optional[int] = Query(None),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=1000),
+):
+    """
+    care_touch_data の中身 (例: condition:ムセ込み, tag:バイタル) で絞り込む。
+    JSON を解析せず、索引テーブルの (source, field, value, record_date) インデックスだけで対象IDを求める。
+    """
+    if source not in ("event", "record"): raise HTTPException(400, "source は event または record です")
+    if category is not None:
+        category = touch_index.load_schema().category_label(category)
+        if category is None: raise HTTPException(400, "life_schema.json に定義されていないカテゴリです")
+    filters = [_parse_search_filter(f, category) for f in filter]
+
+    ids = None
+    for field, value in filters:
+        idx = care_touch_index.alias()
+        cond = (idx.c.source == source) & (idx.c.field == field) & (idx.c.value == value)
+        if category and field != "category": cond = cond & (idx.c.category == category)
+        if user_id: cond = cond & (idx.c.user_id == user_id)
+        if start: cond = cond & (idx.c.record_date >= start)
+        if end: cond = cond & (idx.c.record_date <= end)
+        if after_id is not None: cond = cond & (idx.c.source_id > after_id)
+        q = sqlalchemy.select(idx.c.source_id).where(cond)
+        ids = q if ids is None else q.where(idx.c.source_id.in_(ids))
+    ids = ids.distinct().order_by(sqlalchemy.literal_column("source_id")).limit(limit)
+
+    if source == "event":
+        q = sqlalchemy.select(
+            care_events.c.event_id, care_events.c.user_id, utc_iso_column(care_events.c.event_timestamp), care_events.c.event_type,
+            raw_json_column(care_events.c.care_touch_data), care_events.c.note_text, care_events.c.recorded_by,
+        ).where(care_events.c.event_id.in_(ids)).order_by(care_events.c.event_id)
+        key = "event_id"
+    else:
+        q = sqlalchemy.select(
+            care_records.c.care_record_id, care_records.c.user_id, care_records.c.record_date, care_records.c.final_text,
+            raw_json_column(care_records.c.care_touch_data), care_records.c.last_updated_by,
+        ).where(care_records.c.care_record_id.in_(ids)).order_by(care_records.c.care_record_id)
+        key = "care_record_id"
+    items = rows_to_dicts(await database.fetch_all(q), ("care_touch_data",))
+    next_after_id = items[-1][key] if len(items) == limit else None
+    return fast_json_response({"items": items, "next_after_id": next_after_id})
+
+def _events_cond(user_id: str, date: str):
     jst_date = sqlalchemy.func.date(sqlalchemy.func.datetime(care_events.c.event_timestamp, '+9 hours'))
-    q = care_events.select().where((care_events.c.user_id == user_id) & (jst_date == date)).order_by(care_events.c.event_timestamp.desc())
-    
-    rows = await database.fetch_all(q)
-    
-    # ★ 修正: 強制的にISO文字列化（"Z"付き）
-    return [
-        {
-            **dict(r), 
-            "event_timestamp": ensure_utc_iso(r["event_timestamp"])
-        } 
-        for r in rows
-    ]
+    return (care_events.c.user_id == user_id) & (jst_date == date)
+
+async def fetch_events_version(user_id: str, date: str):
+    """条件付きGET用: 件数・最終更新・最大IDで版数を作る (削除は件数、再作成は最大IDで検知)"""
+    v = await database.fetch_one(sqlalchemy.select(
+        sqlalchemy.func.count().label("n"),
+        sqlalchemy.func.max(sqlalchemy.func.coalesce(care_events.c.updated_at, care_events.c.created_at)).label("last"),
+        sqlalchemy.func.max(care_events.c.event_id).label("max_id"),
+    ).where(_events_cond(user_id, date)))
+    last_modified = to_utc(v["last"])
+    return ("events", user_id, date, v["n"], last_modified, v["max_id"]), last_modified
+
+async def fetch_event_rows(user_id: str, date: str) -> List[Dict[str, Any]]:
+    # ★ 高速経路: 日時はSQL側で "Z" 付きISO文字列化、care_touch_data は生JSONをまとめてデコード
+    q = sqlalchemy.select(
+        care_events.c.event_id, care_events.c.user_id, utc_iso_column(care_events.c.event_timestamp), care_events.c.event_type,
+        raw_json_column(care_events.c.care_touch_data), care_events.c.note_text, care_events.c.recorded_by,
+    ).where(_events_cond(user_id, date)).order_by(care_events.c.event_timestamp.desc())
+    return rows_to_dicts(await database.fetch_all(q), ("care_touch_data",))
+
+@app.get("/daily_events", response_model=List[CareEventOutput])
+async def get_daily_events(request: Request, user_id: str = Query(...), date: str = Query(...)):
+    version, last_modified = await fetch_events_version(user_id, date)
+    etag = build_etag(*version)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+
+    response = fast_json_response(await fetch_event_rows(user_id, date))
+    set_validators(response, etag, last_modified)
+    return response
+
+# 入居者1日分の画面表示用 (日報・イベント・割当済み録音を1往復で返す)
+@app.get("/day_view", response_model=DayView)
+async def get_day_view(request: Request, user_id: str = Query(...), record_date: str = Query(...)):
+    # 1つの読み取りトランザクション (同一接続) で取得し、3つの結果を同じスナップショットに揃える
+    async with database.transaction():
+        care_record = await fetch_care_record_detail(user_id, record_date)
+        events_version, events_last = await fetch_events_version(user_id, record_date)
+        assigned_version, assigned_last = await fetch_assigned_version(user_id, record_date)
+
+        record_last = to_utc(care_record.get("updated_at"))
+        last_modified = max((t for t in (record_last, events_last, assigned_last) if t is not None), default=None)
+        etag = build_etag("day", record_last, *events_version, *assigned_version)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        daily_events = await fetch_event_rows(user_id, record_date)
+        assigned = await fetch_assigned_rows(user_id, record_date)
+
+    response = fast_json_response({"care_record": care_record, "daily_events": daily_events, "assigned_recordings": assigned})
+    set_validators(response, etag, last_modified)
+    return response
 
 # 6. 管理者機能
 async def verify_admin(caller: str = Header(None, alias="X-Caller-ID")):
@@ -405,11 +846,10 @@ async def verify_admin(caller: str = Header(None, alias="X-Caller-ID")):
 
 @app.get("/admin/caregivers", response_model=List[CaregiverInfo])
 async def ad_list(a: str = Depends(verify_admin)):
-    rows = await database.fetch_all(caregivers.select().order_by(caregivers.c.created_at.desc()))
-    # ★ 修正: 強制的にISO文字列化
-    return [
-        {**dict(r), "created_at": ensure_utc_iso(r["created_at"])} for r in rows
-    ]
+    # ★ 高速経路: 日時はSQL側でISO文字列化し、Pydantic を経由せずにエンコードする
+    q = sqlalchemy.select(caregivers.c.caregiver_id, caregivers.c.name, utc_iso_column(caregivers.c.created_at), caregivers.c.qr_token).order_by(caregivers.c.created_at.desc())
+    rows = await database.fetch_all(q)
+    return fast_json_response(rows_to_dicts(rows))
 
 @app.post("/admin/caregivers", response_model=CaregiverInfo)
 async def ad_add(i: CaregiverInput = Body(...), a: str = Depends(verify_admin)):
@@ -435,6 +875,164 @@ async def ad_reset_qr(cid: str, a: str = Depends(verify_admin)):
     # ★ 修正
     return {**dict(res), "created_at": ensure_utc_iso(res["created_at"])}
 
+@app.get("/admin/upload_admission")
+async def ad_upload_admission(a: str = Depends(verify_admin)):
+    """アップロードの受け入れ状況 (待ち行列の件数・処理し終えるまでの予想秒数・空き容量) を返す"""
+    return (await upload_admission.check()).to_dict()
+
+# --- 監査・月次報告向けエクスポート (管理者のみ) ---
+# GET /admin/export/{care_records|care_events|transcripts}?start=YYYY-MM-DD&end=YYYY-MM-DD&format=csv|jsonl
+# 期間は JST の日付 (両端含む)。キーセット方式でページングしながら送り出すため、期間の長さでメモリは増えない。
+def _export_range(start: str, end: str):
+    try:
+        start_date, end_date = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    except ValueError:
+        raise HTTPException(400, "start / end は YYYY-MM-DD で指定してください")
+    if end_date < start_date: raise HTTPException(400, "end は start 以降の日付にしてください")
+    # JST の日付範囲 → 保存値 (UTC) の半開区間 [start_utc, end_utc)
+    jst_offset = datetime.timedelta(hours=9)
+    start_utc = datetime.datetime.combine(start_date, datetime.time()) - jst_offset
+    end_utc = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time()) - jst_offset
+    return start_date.isoformat(), end_date.isoformat(), start_utc, end_utc
+
+def _export_care_records(start: str, end: str, start_utc, end_utc):
+    columns = ["care_record_id", "user_id", "record_date", "final_text", "care_touch_data", "last_updated_by", "updated_at"]
+    def make_query(after):
+        q = sqlalchemy.select(care_records.c.care_record_id, care_records.c.user_id, care_records.c.record_date, care_records.c.final_text, raw_json_column(care_records.c.care_touch_data), care_records.c.last_updated_by, utc_iso_column(care_records.c.updated_at)).where((care_records.c.record_date >= start) & (care_records.c.record_date <= end))
+        if after is not None: q = q.where(care_records.c.care_record_id > after)
+        return q.order_by(care_records.c.care_record_id)
+    return "care_record_id", make_query, columns, lambda r: rows_to_dicts([r], ("care_touch_data",))[0]
+
+def _export_care_events(start: str, end: str, start_utc, end_utc):
+    columns = ["event_id", "user_id", "event_timestamp", "event_type", "care_touch_data", "note_text", "recorded_by", "created_at", "updated_at"]
+    def make_query(after):
+        q = sqlalchemy.select(care_events.c.event_id, care_events.c.user_id, utc_iso_column(care_events.c.event_timestamp), care_events.c.event_type, raw_json_column(care_events.c.care_touch_data), care_events.c.note_text, care_events.c.recorded_by, utc_iso_column(care_events.c.created_at), utc_iso_column(care_events.c.updated_at)).where((care_events.c.event_timestamp >= start_utc) & (care_events.c.event_timestamp < end_utc))
+        if after is not None: q = q.where(care_events.c.event_id > after)
+        return q.order_by(care_events.c.event_id)
+    return "event_id", make_query, columns, lambda r: rows_to_dicts([r], ("care_touch_data",))[0]
+
+def _export_transcripts(start: str, end: str, start_utc, end_utc):
+    columns = ["assignment_id", "recording_id", "user_id", "caregiver_id", "recorded_at", "record_date", "memo_text", "assigned_by", "transcript_text"]
+    jst_date = sqlalchemy.func.date(sqlalchemy.func.datetime(recordings.c.created_at, '+9 hours')).label("record_date")
+    j = sqlalchemy.join(recording_assignments, recordings, recording_assignments.c.recording_id == recordings.c.recording_id).outerjoin(recording_archive, recording_archive.c.recording_id == recordings.c.recording_id)
+    def make_query(after):
+        q = sqlalchemy.select(recording_assignments.c.assignment_id, recordings.c.recording_id, recording_assignments.c.user_id, recordings.c.caregiver_id, utc_iso_column(recordings.c.created_at, "recorded_at"), jst_date, recordings.c.memo_text, recording_assignments.c.assigned_by, raw_json_column(recordings.c.assignment_snapshot), raw_json_column(recordings.c.transcription_result), recording_archive.c.assignment_snapshot_z, recording_archive.c.transcription_result_z).select_from(j).where((recordings.c.created_at >= start_utc) & (recordings.c.created_at < end_utc))
+        if after is not None: q = q.where(recording_assignments.c.assignment_id > after)
+        return q.order_by(recording_assignments.c.assignment_id)
+    def to_dict(r):
+        d = rows_to_dicts([r], ("assignment_snapshot", "transcription_result"))[0]
+        # アーカイブ済みの録音は圧縮した側テーブルから復元する
+        snapshot = d.pop("assignment_snapshot")
+        if snapshot is None: snapshot = archive_store.decompress_json(d["assignment_snapshot_z"])
+        transcription = d.pop("transcription_result")
+        if not snapshot and transcription is None: transcription = archive_store.decompress_json(d["transcription_result_z"])
+        d["transcript_text"] = user_transcript(snapshot or transcription, d["user_id"])
+        return d
+    return "assignment_id", make_query, columns, to_dict
+
+EXPORT_DATASETS = {
+    "care_records": _export_care_records,
+    "care_events": _export_care_events,
+    "transcripts": _export_transcripts,
+}
+
+@app.get("/admin/export/{dataset}")
+async def ad_export(dataset: str, start: str = Query(...), end: str = Query(...), format: str = Query("csv"), a: str = Depends(verify_admin)):
+    if dataset not in EXPORT_DATASETS: raise HTTPException(404, "Unknown dataset")
+    if format not in EXPORT_FORMATS: raise HTTPException(400, "format は csv または jsonl を指定してください")
+    start, end, start_utc, end_utc = _export_range(start, end)
+    key, make_query, columns, to_dict = EXPORT_DATASETS[dataset](start, end, start_utc, end_utc)
+    filename = f"{dataset}_{start}_{end}.{format}"
+    return StreamingResponse(
+        stream_export(keyset_pages(database, make_query, key), columns, format, to_dict),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+# 7. ワーカー用ジョブ API (別マシンのワーカーが DB を開かずに録音を処理する。remote_jobs.py)
+# POST /jobs/claim → GET /jobs/{id}/audio → (POST /jobs/{id}/heartbeat, /progress) → POST /jobs/{id}/complete または /fail
+# 取得・延長・完了は job_queue.py のリースをそのまま使う (取得は条件付き UPDATE で1ワーカーだけが成功する)。
+# リースを失ったワーカーの延長・書き込みは 409 で断る。認証は Authorization: Bearer <KOENO_WORKER_TOKENS のいずれか>
+async def verify_worker(authorization: Optional[str] = Header(None)):
+    if not WORKER_TOKENS: raise HTTPException(404)
+    token = authorization[7:] if authorization and authorization.startswith("Bearer ") else ""
+    # (トークンの比較は一致までの時間で推測されないよう compare_digest で)
+    if not any(hmac.compare_digest(token.encode(), t.encode()) for t in WORKER_TOKENS):
+        raise HTTPException(401, "Invalid worker token", headers={"WWW-Authenticate": "Bearer"})
+
+async def _leased_job(recording_id: int, worker_id: str):
+    res = await database.fetch_one(sqlalchemy.select(recordings.c.lease_owner, recordings.c.ai_status, recordings.c.audio_file_path, recordings.c.audio_archive).where(recordings.c.recording_id == recording_id))
+    if not res: raise HTTPException(404, "Recording not found")
+    if res.lease_owner != worker_id or res.ai_status != "processing": raise HTTPException(409, "Lease lost")
+    return res
+
+@app.post("/jobs/claim", dependencies=[Depends(verify_worker)])
+async def job_claim(inp: JobClaimInput = Body(...)):
+    for record_id in await job_queue.expire_exhausted():
+        await status_broker.dispatch(make_event(record_id, "failed"))
+    job = await job_queue.claim_job(inp.worker_id)
+    if job is None: return Response(status_code=204)
+    await status_broker.dispatch(make_event(job.recording_id, "processing"))
+    return {
+        "recording_id": job.recording_id,
+        "attempts": job.attempts,
+        "lease_expires_at": ensure_utc_iso(job.lease_expires_at),
+        "filename": os.path.basename(job.audio_file_path or ""),
+        "transcription_tier": transcription_tiers.normalize(job.transcription_tier),
+        "heartbeat_seconds": job_queue.HEARTBEAT_SECONDS,
+        "max_attempts": job_queue.MAX_ATTEMPTS,
+    }
+
+@app.get("/jobs/{recording_id}/audio", dependencies=[Depends(verify_worker)])
+async def job_audio(recording_id: int, request: Request, worker_id: str = Header(..., alias="X-Worker-ID")):
+    """リース中の録音の音声 (Range 対応。途中で切れたダウンロードを続きから取れる)"""
+    res = await _leased_job(recording_id, worker_id)
+    if not res.audio_file_path: raise HTTPException(404, "Audio not found")
+    return _audio_response(request, recording_id, res)
+
+@app.post("/jobs/{recording_id}/heartbeat", dependencies=[Depends(verify_worker)])
+async def job_heartbeat(recording_id: int, inp: JobClaimInput = Body(...)):
+    if not await job_queue.heartbeat(recording_id, inp.worker_id): raise HTTPException(409, "Lease lost")
+    return {"ok": True}
+
+@app.post("/jobs/{recording_id}/progress", status_code=204, dependencies=[Depends(verify_worker)])
+async def job_progress(recording_id: int, inp: JobProgressInput = Body(...)):
+    """処理中の段階と進捗を SSE 購読者へ配る (DBには書かない)"""
+    await _leased_job(recording_id, inp.worker_id)
+    await status_broker.dispatch(make_event(recording_id, "processing", inp.stage, inp.progress))
+
+@app.post("/jobs/{recording_id}/complete", dependencies=[Depends(verify_worker)])
+async def job_complete(recording_id: int, inp: JobCompleteInput = Body(...)):
+    res = await _leased_job(recording_id, inp.worker_id)
+    if not await job_queue.complete_job(recording_id, inp.worker_id, inp.result, audio_duration=inp.audio_duration, processing_seconds=inp.processing_seconds):
+        raise HTTPException(409, "Lease lost")
+    if inp.peaks and res.audio_file_path:
+        try:
+            save_peaks(res.audio_file_path, inp.peaks)
+        except OSError as e:
+            print(f"警告: ID {recording_id} の波形ピークを保存できませんでした: {e}")
+    await status_broker.dispatch(make_event(recording_id, "completed", progress=1.0))
+    # 割当済みの録音を再処理した場合は要約草案も作り直す (ローカルのワーカーと同じ)
+    await summary_queue.mark_pending(recording_id)
+    return {"ok": True}
+
+@app.post("/jobs/{recording_id}/fail", dependencies=[Depends(verify_worker)])
+async def job_fail(recording_id: int, inp: JobFailInput = Body(...)):
+    status = await job_queue.fail_job(recording_id, inp.worker_id, inp.error, retryable=inp.retryable)
+    if status is None: raise HTTPException(409, "Lease lost")
+    await status_broker.dispatch(make_event(recording_id, status))
+    return {"ai_status": status}
+
+# 8. 端末の差分同期 (PWA のローカルストアが、前回のカーソル以降の変更だけを取る。change_feed.py)
+@app.get("/sync/changes")
+async def get_sync_changes(cursor: int = Query(0, ge=0), limit: int = Query(change_feed.DEFAULT_LIMIT, ge=1, le=change_feed.MAX_LIMIT), caller: str = Header(..., alias="X-Caller-ID")):
+    if not await database.fetch_one(caregivers.select().where(caregivers.c.caregiver_id == caller)):
+        raise HTTPException(403, "Access denied")
+    # 変更の記録と行の内容を同じスナップショットで読む
+    async with database.transaction():
+        feed = await change_feed.fetch_changes(database, cursor, caller, limit)
+    return fast_json_response(feed)
+
 # --- フロントエンド配信 ---
 FRONTEND_DIR = os.path.join(os.path.dirname(__file__), "../web-v2/dist")
 if os.path.exists(FRONTEND_DIR):
@@ -0,0 +1,405 @@
+import datetime
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+
+import sqlalchemy
+from sqlalchemy.inspection import inspect
+
+from db import metadata, DATABASE_URL, care_events, care_records, recording_archive, care_touch_daily, care_touch_index, summary_cache, sync_changes, install_sync_triggers
+import care_aggregates
+import care_touch_index as touch_index
+
+# --- バージョン管理付きマイグレーション ---
+# 旧 migrate_db_v3.py 〜 migrate_db_v7.py を1か所にまとめ、schema_version テーブルで適用済みの版を管理する。
+#  - 最新版のDBでは起動時に schema_version を1回読むだけで終わる (カラム検査や create_all をしない)
+#  - 既存データの埋め戻し (backfill) は小さなバッチで executemany し、バッチごとにコミットする。
+#    WHERE 句が「未処理の行」を選ぶので、途中で止めても再実行で続きから再開できる。
+#
+# 使い方:
+#   py .\migrations.py          … 最新版まで適用
+#   py .\migrations.py status   … 現在の版を表示
+#   py .\migrations.py rebuild_aggregates … ケアイベントの日別集計を作り直す (API の稼働中でもよい。入居者ごとに入れ替える)
+#   py .\migrations.py rebuild_index      … care_touch_data の項目索引を作り直す (life_schema.json の変更後など。API の稼働中でもよい)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+# 旧スクリプト導入前 (v2 以前) のDBは、この版から順に適用する
+LEGACY_BASELINE_VERSION = 2
+
+BACKFILL_BATCH_SIZE = 500
+# バッチ間で書き込みロックを手放す時間 (秒)。API の書き込みを待たせないため
+BACKFILL_PAUSE_SECONDS = 0.05
+
+_MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        _MIGRATIONS.append((version, description, fn))
+        _MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def latest_version() -> int:
+    return _MIGRATIONS[-1][0] if _MIGRATIONS else LEGACY_BASELINE_VERSION
+
+
+def make_engine():
+    # busy_timeout: API 側の書き込み中はエラーにせず待つ
+    return sqlalchemy.create_engine(DATABASE_URL, connect_args={"timeout": 30})
+
+
+# --- ヘルパー ---
+def add_column_if_missing(engine, table: str, column: str, ddl_type: str) -> None:
+    columns = [col['name'] for col in inspect(engine).get_columns(table)]
+    if column in columns:
+        print(f"[MIGRATE] '{table}.{column}' は既に存在します。（スキップ）")
+        return
+    print(f"[MIGRATE] '{table}' にカラム '{column}' ({ddl_type}) を追加します...")
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def create_table_if_missing(engine, table: sqlalchemy.Table) -> None:
+    if inspect(engine).has_table(table.name):
+        print(f"[MIGRATE] テーブル '{table.name}' は既に存在します。（スキップ）")
+        return
+    print(f"[MIGRATE] テーブル '{table.name}' を作成します...")
+    table.create(engine, checkfirst=True)
+
+
+def backfill_in_batches(engine, select_sql: str, update_sql: str, make_params: Callable[[sqlalchemy.Row], dict], batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    select_sql で未処理の行を batch_size 件ずつ取り出し、make_params で作った値を
+    update_sql に executemany する。バッチごとにコミットするので、長時間ロックを握らない。
+    select_sql は「まだ埋まっていない行」だけを返し、:limit を受け取ること。
+    """
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(sqlalchemy.text(select_sql), {"limit": batch_size}).fetchall()
+            if not rows:
+                break
+            conn.execute(sqlalchemy.text(update_sql), [make_params(r) for r in rows])
+        total += len(rows)
+        print(f"[MIGRATE] ... {total} 行を更新")
+        if len(rows) < batch_size:
+            break
+        time.sleep(BACKFILL_PAUSE_SECONDS)
+    return total
+
+
+def backfill_sql_in_batches(engine, table: str, set_sql: str, where_sql: str, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Python 側で値を作る必要のない埋め戻し (SET 式だけで済むもの) を rowid 単位のバッチで行う"""
+    return backfill_in_batches(
+        engine,
+        f"SELECT rowid AS rid FROM {table} WHERE {where_sql} LIMIT :limit",
+        f"UPDATE {table} SET {set_sql} WHERE rowid = :rid",
+        lambda r: {"rid": r.rid},
+        batch_size,
+    )
+
+
+# --- 版の管理 ---
+_schema_version = sqlalchemy.Table(
+    SCHEMA_VERSION_TABLE, sqlalchemy.MetaData(),
+    sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("description", sqlalchemy.String),
+    sqlalchemy.Column("applied_at", sqlalchemy.DateTime),
+)
+
+
+def current_version(engine) -> Optional[int]:
+    """適用済みの最新版を返す。schema_version が無い場合は None"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(sqlalchemy.select(sqlalchemy.func.max(_schema_version.c.version))).scalar()
+    except sqlalchemy.exc.OperationalError:
+        return None
+
+
+def _stamp(engine, version: int, description: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(_schema_version.insert().values(version=version, description=description, applied_at=datetime.datetime.now(datetime.UTC)))
+
+
+def upgrade(engine=None, target: Optional[int] = None) -> int:
+    """
+    DBを target (省略時は最新) まで上げ、適用後の版を返す。
+    最新版のDBでは schema_version を読むだけで戻る。
+    """
+    engine = engine or make_engine()
+    target = target or latest_version()
+
+    version = current_version(engine)
+    if version is not None and version >= target:
+        return version
+
+    if version is None:
+        _schema_version.create(engine, checkfirst=True)
+        if not inspect(engine).has_table("recordings"):
+            # 新規DB: 最新の定義で一括作成し、最新版として記録する
+            print("[MIGRATE] 新規データベースです。最新のテーブル定義で作成します...")
+            metadata.create_all(engine)
+            _stamp(engine, latest_version(), "initial schema")
+            return latest_version()
+        version = LEGACY_BASELINE_VERSION
+        # 旧DBに欠けているテーブルだけを作成する (既存テーブルには触れない)
+        metadata.create_all(engine)
+
+    for v, description, fn in _MIGRATIONS:
+        if v <= version or v > target:
+            continue
+        print(f"--- [MIGRATE v{v}] {description} ---")
+        fn(engine)
+        _stamp(engine, v, description)
+        version = v
+    print(f"--- [MIGRATE] データベースは v{version} です ---")
+    return version
+
+
+# --- マイグレーション定義 (追加は末尾に、版番号は増やすだけ) ---
+@migration(3, "recordings.summary_drafts の追加")
+def _v3(engine):
+    add_column_if_missing(engine, "recordings", "summary_drafts", "TEXT")
+
+
+@migration(4, "care_records.care_touch_data の追加")
+def _v4(engine):
+    add_column_if_missing(engine, "care_records", "care_touch_data", "TEXT")
+
+
+@migration(5, "時系列イベントテーブル care_events の作成")
+def _v5(engine):
+    create_table_if_missing(engine, care_events)
+
+
+@migration(6, "caregivers.qr_token の追加と既存ユーザーへの発行")
+def _v6(engine):
+    add_column_if_missing(engine, "caregivers", "qr_token", "TEXT")
+    backfill_in_batches(
+        engine,
+        "SELECT caregiver_id FROM caregivers WHERE qr_token IS NULL OR qr_token = '' LIMIT :limit",
+        "UPDATE caregivers SET qr_token = :token WHERE caregiver_id = :cid",
+        lambda r: {"token": str(uuid.uuid4()), "cid": r.caregiver_id},
+    )
+
+
+@migration(7, "行バージョン (updated_at) の追加")
+def _v7(engine):
+    for table in ("recordings", "care_events"):
+        add_column_if_missing(engine, table, "updated_at", "DATETIME")
+        backfill_sql_in_batches(engine, table, "updated_at = created_at", "updated_at IS NULL AND created_at IS NOT NULL")
+
+
+
+@migration(8, "録音アーカイブ (archived_at / audio_archive / recording_archive) の追加")
+def _v8(engine):
+    add_column_if_missing(engine, "recordings", "archived_at", "DATETIME")
+    add_column_if_missing(engine, "recordings", "audio_archive", "VARCHAR")
+    create_table_if_missing(engine, recording_archive)
+
+
+@migration(9, "ワーカーのジョブリース (lease_owner / lease_expires_at / attempts など) の追加")
+def _v9(engine):
+    add_column_if_missing(engine, "recordings", "lease_owner", "VARCHAR")
+    add_column_if_missing(engine, "recordings", "lease_expires_at", "DATETIME")
+    add_column_if_missing(engine, "recordings", "attempts", "INTEGER NOT NULL DEFAULT 0")
+    add_column_if_missing(engine, "recordings", "next_attempt_at", "DATETIME")
+    add_column_if_missing(engine, "recordings", "last_error", "TEXT")
+
+
+@migration(10, "スケジューリング用カラム (audio_duration / queued_at / started_at / processing_seconds) の追加")
+def _v10(engine):
+    add_column_if_missing(engine, "recordings", "audio_duration", "FLOAT")
+    add_column_if_missing(engine, "recordings", "queued_at", "DATETIME")
+    add_column_if_missing(engine, "recordings", "started_at", "DATETIME")
+    add_column_if_missing(engine, "recordings", "processing_seconds", "FLOAT")
+    # 既存の待ち行列は登録日時から待っていたものとして扱う (長さは不明のまま、既定の見積もりを使う)
+    backfill_sql_in_batches(engine, "recordings", "queued_at = COALESCE(updated_at, created_at)", "queued_at IS NULL")
+
+
+def rebuild_care_touch_daily(engine, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    care_events から日別集計 (care_touch_daily) を作り直す。API の稼働中でも実行できる。
+    入居者ごとに1トランザクションで「その入居者の集計行を消す → その入居者のイベントを読んで合算 → 入れる」を行う。
+     - 先に消すことで書き込みロックを取るので、その間 save_event / delete_event は待つ。作り直した後の書き込みは
+       作り直した集計に差分を加えるだけなので、同じイベントを二重に数えない
+     - /care_touch_summary (入居者1人の月次) は、作り直す前か後のどちらかの集計を丸ごと見る (空や途中の件数は見えない)
+    集計表にだけ残っている入居者 (イベントが消えた入居者) の行も消す。途中で止まっても、再実行すれば全員を作り直す。
+    """
+    with engine.connect() as conn:
+        user_ids = sorted(set(conn.execute(sqlalchemy.select(care_events.c.user_id).distinct()).scalars())
+                          | set(conn.execute(sqlalchemy.select(care_touch_daily.c.user_id).distinct()).scalars()))
+    total = 0
+    for user_id in user_ids:
+        with engine.begin() as conn:
+            conn.execute(care_touch_daily.delete().where(care_touch_daily.c.user_id == user_id))
+            counts = Counter()
+            if user_id:
+                result = conn.execute(
+                    sqlalchemy.select(care_events.c.user_id, care_events.c.event_timestamp, care_events.c.event_type, care_events.c.care_touch_data)
+                    .where(care_events.c.user_id == user_id).execution_options(yield_per=batch_size)
+                )
+                for r in result:
+                    counts.update(care_aggregates.event_counts(r.user_id, r.event_timestamp, r.event_type, r.care_touch_data))
+                    total += 1
+            for key, n in counts.items():
+                conn.execute(care_aggregates.upsert_statement(care_touch_daily, key, n))
+        print(f"[MIGRATE] ... {total} 件のイベントを集計 (入居者 {user_id})")
+        time.sleep(BACKFILL_PAUSE_SECONDS)
+    return total
+
+
+@migration(11, "ケアイベントの日別集計 care_touch_daily の作成と既存イベントの集計")
+def _v11(engine):
+    create_table_if_missing(engine, care_touch_daily)
+    rebuild_care_touch_daily(engine)
+
+
+def rebuild_care_touch_index(engine, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    care_events / care_records から項目索引 (care_touch_index) を作り直す (life_schema.json の変更後など)。API の稼働中でも実行できる。
+    id 順のバッチごとに1トランザクションで「その id の範囲の索引行を消す → 範囲の行を読み直して索引を入れる」を行う。
+     - 先に消すことで書き込みロックを取り、範囲内の行はロックを取った後に読む。save_event / delete_event も
+       行ごとに索引を入れ替えるので、作り直しと重なっても同じ行が二重に索引されない
+     - 最後の範囲より後ろに残った、元の行が無い索引行も消す
+    """
+    sources = [
+        ("event", care_events, care_events.c.event_id, lambda r: touch_index.event_index_rows(r.event_id, r.user_id, r.event_timestamp, r.care_touch_data),
+         [care_events.c.event_id, care_events.c.user_id, care_events.c.event_timestamp, care_events.c.care_touch_data]),
+        ("record", care_records, care_records.c.care_record_id, lambda r: touch_index.record_index_rows(r.care_record_id, r.user_id, r.record_date, r.care_touch_data),
+         [care_records.c.care_record_id, care_records.c.user_id, care_records.c.record_date, care_records.c.care_touch_data]),
+    ]
+    total = 0
+    for source, table, key, make_rows, columns in sources:
+        in_source = care_touch_index.c.source == source
+        count = 0
+        after_id = 0
+        while True:
+            with engine.connect() as conn:
+                keys = conn.execute(sqlalchemy.select(key).where(key > after_id).order_by(key).limit(batch_size)).scalars().all()
+            if not keys:
+                break
+            last_id = keys[-1]
+            with engine.begin() as conn:
+                conn.execute(care_touch_index.delete().where(in_source & (care_touch_index.c.source_id > after_id) & (care_touch_index.c.source_id <= last_id)))
+                rows = conn.execute(sqlalchemy.select(*columns).where((key > after_id) & (key <= last_id))).fetchall()
+                index_rows = [ir for r in rows if r.user_id for ir in make_rows(r)]
+                if index_rows:
+                    conn.execute(care_touch_index.insert(), index_rows)
+            count += len(rows)
+            after_id = last_id
+            print(f"[MIGRATE] ... {table.name}: {count} 件を索引")
+            time.sleep(BACKFILL_PAUSE_SECONDS)
+        with engine.begin() as conn:
+            orphan = ~sqlalchemy.exists().where(key == care_touch_index.c.source_id)
+            conn.execute(care_touch_index.delete().where(in_source & (care_touch_index.c.source_id > after_id) & orphan))
+        total += count
+    return total
+
+
+@migration(12, "care_touch_data の項目索引 care_touch_index の作成と既存データの索引")
+def _v12(engine):
+    create_table_if_missing(engine, care_touch_index)
+    rebuild_care_touch_index(engine)
+
+
+@migration(13, "要約草案の生成キュー (recordings.summary_status / summary_cache) の追加")
+def _v13(engine):
+    add_column_if_missing(engine, "recordings", "summary_status", "VARCHAR")
+    with engine.begin() as conn:
+        # (create_all で作られる索引と同じ名前にする)
+        conn.execute(sqlalchemy.text("CREATE INDEX IF NOT EXISTS ix_recordings_summary_status ON recordings (summary_status)"))
+    create_table_if_missing(engine, summary_cache)
+    # 割当済みで草案がまだ無い録音は、ワーカーに草案を作らせる
+    backfill_sql_in_batches(
+        engine, "recordings", "summary_status = 'pending'",
+        "summary_status IS NULL AND (summary_drafts IS NULL OR summary_drafts IN ('null', '{}'))"
+        " AND EXISTS (SELECT 1 FROM recording_assignments a WHERE a.recording_id = recordings.recording_id)",
+    )
+
+
+@migration(14, "割当スナップショットの版 (recordings.assignment_version) の追加")
+def _v14(engine):
+    add_column_if_missing(engine, "recordings", "assignment_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def backfill_sync_changes(engine, entity: str, table: str, key: str, changed_at_sql: str, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """既存の行を変更フィード (sync_changes) に載せる (key 順のバッチ。トリガーが先に記録した行はそのまま)"""
+    total = 0
+    after_id = 0
+    while True:
+        with engine.begin() as conn:
+            keys = conn.execute(sqlalchemy.text(f"SELECT {key} FROM {table} WHERE {key} > :after ORDER BY {key} LIMIT :limit"), {"after": after_id, "limit": batch_size}).scalars().all()
+            if not keys:
+                break
+            conn.execute(sqlalchemy.text(
+                f"INSERT OR IGNORE INTO sync_changes (entity, entity_key, deleted, changed_at) "
+                f"SELECT '{entity}', {key}, 0, {changed_at_sql} FROM {table} WHERE {key} > :after AND {key} <= :last"
+            ), {"after": after_id, "last": keys[-1]})
+        total += len(keys)
+        after_id = keys[-1]
+        print(f"[MIGRATE] ... {entity}: {total} 行を記録")
+        if len(keys) < batch_size:
+            break
+        time.sleep(BACKFILL_PAUSE_SECONDS)
+    return total
+
+
+@migration(15, "差分同期の変更フィード (sync_changes とトリガー) の作成と既存データの記録")
+def _v15(engine):
+    create_table_if_missing(engine, sync_changes)
+    # (先にトリガーを作り、記録中の書き込みも取りこぼさない)
+    with engine.begin() as conn:
+        install_sync_triggers(conn)
+    backfill_sync_changes(engine, "care_events", "care_events", "event_id", "COALESCE(updated_at, created_at)")
+    backfill_sync_changes(engine, "care_records", "care_records", "care_record_id", "updated_at")
+    backfill_sync_changes(engine, "recordings", "recordings", "recording_id", "COALESCE(updated_at, created_at)")
+    backfill_sync_changes(engine, "assignments", "(SELECT DISTINCT recording_id FROM recording_assignments)", "recording_id", "CURRENT_TIMESTAMP")
+
+
+@migration(16, "文字起こしの段階 (recordings.transcription_tier) と処理の優先度 (recordings.priority) の追加")
+def _v16(engine):
+    add_column_if_missing(engine, "recordings", "transcription_tier", "VARCHAR")
+    add_column_if_missing(engine, "recordings", "priority", "INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(17, "recordings.started_at の索引の追加 (順番待ち・完了予想の集計用)")
+def _v17(engine):
+    with engine.begin() as conn:
+        # (create_all で作られる索引と同じ名前にする)
+        conn.execute(sqlalchemy.text("CREATE INDEX IF NOT EXISTS ix_recordings_started_at ON recordings (started_at)"))
+
+
+@migration(18, "変更フィードの持ち主 (sync_changes.caregiver_id) の追加 (墓標を本人にだけ返すため)")
+def _v18(engine):
+    add_column_if_missing(engine, "sync_changes", "caregiver_id", "VARCHAR")
+    with engine.begin() as conn:
+        install_sync_triggers(conn, replace=True)
+    # 録音が残っている記録は録音から埋める (消えた録音の墓標は持ち主が分からないので、誰にも返さない)
+    backfill_sql_in_batches(
+        engine, "sync_changes",
+        "caregiver_id = (SELECT caregiver_id FROM recordings r WHERE r.recording_id = sync_changes.entity_key)",
+        "caregiver_id IS NULL AND entity IN ('recordings', 'assignments')"
+        " AND EXISTS (SELECT 1 FROM recordings r WHERE r.recording_id = sync_changes.entity_key AND r.caregiver_id IS NOT NULL)",
+    )
+
+
+if __name__ == "__main__":
+    engine = make_engine()
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        print(f"現在の版: v{current_version(engine)} / 最新: v{latest_version()}")
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebuild_aggregates":
+        upgrade(engine)
+        print(f"日別集計を作り直しました ({rebuild_care_touch_daily(engine)} 件)")
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebuild_index":
+        upgrade(engine)
+        print(f"項目索引を作り直しました ({rebuild_care_touch_index(engine)} 件)")
+    else:
+        print(f"DBマイグレーションを実行します (最新: v{latest_version()})...")
+        upgrade(engine)
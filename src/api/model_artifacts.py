@@ -0,0 +1,280 @@
+import base64
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Optional
+
+# --- AIモデルの事前書き出し (ワーカーの起動短縮) ---
+# Pipeline.from_pretrained / whisper.load_model / EncoderClassifier.from_hparams は毎回
+# Hugging Face のキャッシュ解決・モジュール構築・チェックポイントの読み込みを行い、起動に数十秒かかる。
+# prepare_models.py で読み込み済みのモデルを ARTIFACT_DIR/<版>/ に書き出しておき、ワーカーはそこから読む。
+#   形式 (manifest.json の format):
+#     whisper_state  … ModelDimensions + state_dict。torch.load(mmap=True) で重みをメモリマップし、
+#                       load_state_dict(assign=True) でコピーせずにそのまま使う
+#     torch_pickle   … 読み込み済みのオブジェクト全体 (pyannote の Pipeline など)。torch.load(mmap=True) で読む
+#     local_hparams  … SpeechBrain の savedir の複製 (オブジェクト全体を保存できない場合)。HF を解決せずに読める
+#     (traced)       … --trace 指定時、話者埋め込みのネットワークを TorchScript にしたもの (manifest の traced)
+# 版はモデルの指定とライブラリの版から決める。torch などの版が manifest と異なる場合は使わず、従来どおり読み込む
+# (pickle はライブラリの版に依存するため)。書き出しが無い・壊れている場合も従来の読み込みにフォールバックする。
+
+ARTIFACT_DIR = os.environ.get("KOENO_MODEL_ARTIFACTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_artifacts"))
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+# ワーカーが使うモデル (run_worker.load_models と共通)
+# whisper は速い段階、whisper_accurate は高精度の段階 (transcription_tiers.py) で使う
+MODEL_SOURCES = {
+    "diarization": "pyannote/speaker-diarization-3.1",
+    "whisper": os.environ.get("KOENO_WHISPER_MODEL", "base"),
+    "whisper_accurate": os.environ.get("KOENO_WHISPER_ACCURATE_MODEL", "medium"),
+    "embedding": "speechbrain/spkrec-ecapa-voxceleb",
+    "vad": "pyannote/voice-activity-detection",
+}
+WHISPER_MODELS = ("whisper", "whisper_accurate")
+EMBEDDING_SAVEDIR = os.path.join("pretrained_models", "spkrec-ecapa-voxceleb")
+TRACE_EXAMPLE_SECONDS = 3.0
+
+
+def library_versions() -> Dict[str, str]:
+    versions = {}
+    for name in ("torch", "whisper", "pyannote.audio", "speechbrain"):
+        try:
+            from importlib.metadata import version
+            versions[name] = version("openai-whisper" if name == "whisper" else name)
+        except Exception:
+            versions[name] = "unknown"
+    return versions
+
+
+def artifact_version(versions: Dict[str, str]) -> str:
+    digest = hashlib.sha256(json.dumps({"sources": MODEL_SOURCES, "versions": versions}, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{datetime.datetime.now(datetime.UTC).strftime('%Y%m%d-%H%M%S')}-{digest[:8]}"
+
+
+# --- 従来の読み込み (Hugging Face / whisper のキャッシュから) ---
+
+def load_from_source(name: str, device: Any) -> Any:
+    source = MODEL_SOURCES[name]
+    if name in ("diarization", "vad"):
+        from pyannote.audio import Pipeline
+        # (HuggingFaceの認証トークンが .env (HF_TOKEN) や環境変数に必要)
+        pipeline = Pipeline.from_pretrained(source)
+        pipeline.to(device)
+        return pipeline
+    if name in WHISPER_MODELS:
+        import whisper
+        return whisper.load_model(source, device=device)
+    if name == "embedding":
+        from speechbrain.pretrained import EncoderClassifier
+        return EncoderClassifier.from_hparams(source=source, savedir=EMBEDDING_SAVEDIR, run_opts={"device": device})
+    raise ValueError(f"未知のモデルです: {name}")
+
+
+# --- 書き出したモデルからの読み込み ---
+
+def current_artifact_dir(root: str = ARTIFACT_DIR) -> Optional[str]:
+    path = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        version = f.read().strip()
+    directory = os.path.join(root, version)
+    return directory if os.path.exists(os.path.join(directory, MANIFEST_FILE)) else None
+
+
+def load_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_whisper_state(path: str, entry: Dict[str, Any], device: Any) -> Any:
+    import torch
+    import whisper
+    from whisper.model import ModelDimensions, Whisper
+
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    model = Whisper(ModelDimensions(**checkpoint["dims"]))
+    # ★ assign=True: 初期化した重みへコピーせず、メモリマップしたテンソルをそのまま使う
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    if entry.get("alignment_heads"):
+        model.set_alignment_heads(base64.b85decode(entry["alignment_heads"]))
+    return model.to(device)
+
+
+def _load_entry(directory: str, name: str, entry: Dict[str, Any], device: Any) -> Any:
+    import torch
+
+    path = os.path.join(directory, entry["file"])
+    fmt = entry["format"]
+    if fmt == "whisper_state":
+        return _load_whisper_state(path, entry, device)
+    if fmt == "torch_pickle":
+        obj = torch.load(path, map_location="cpu", mmap=True, weights_only=False)
+        if name == "embedding":
+            # (EncoderClassifier は .to() を持たない。run_opts の device を差し替えてモジュールを移す)
+            obj.device = str(device)
+            obj.mods.to(device)
+        else:
+            obj.to(device)
+        return obj
+    if fmt == "local_hparams":
+        from speechbrain.pretrained import EncoderClassifier
+        return EncoderClassifier.from_hparams(source=path, savedir=path, run_opts={"device": device})
+    raise ValueError(f"未知の形式です: {fmt}")
+
+
+def load_from_artifact(name: str, device: Any, root: str = ARTIFACT_DIR) -> Optional[Any]:
+    """書き出したモデルを読み込む。使えるものが無ければ None"""
+    directory = current_artifact_dir(root)
+    if directory is None:
+        return None
+    manifest = load_manifest(directory)
+    entry = manifest.get("models", {}).get(name)
+    if entry is None:
+        return None
+    if manifest.get("versions", {}).get("torch") != library_versions()["torch"]:
+        print(f"AIワーカー: 書き出し済みモデルの torch の版が異なるため使いません ({manifest['versions'].get('torch')} → {library_versions()['torch']})")
+        return None
+    model = _load_entry(directory, name, entry, device)
+    traced = entry.get("traced")
+    if traced and name == "embedding":
+        import torch
+        model.mods.embedding_model = torch.jit.load(os.path.join(directory, traced), map_location=device)
+    return model
+
+
+def load_model(name: str, device: Any) -> Any:
+    """書き出したモデルがあればそこから (速い)、無ければ従来どおり読み込む"""
+    started = time.monotonic()
+    try:
+        model = load_from_artifact(name, device)
+    except Exception as e:
+        print(f"AIワーカー: 書き出し済みモデル ({name}) を読み込めませんでした (従来どおり読み込みます): {e}")
+        model = None
+    origin = "書き出し済み"
+    if model is None:
+        model = load_from_source(name, device)
+        origin = "元の配布元"
+    print(f"AIワーカー: {name} を{origin}から読み込みました ({time.monotonic() - started:.1f}秒)")
+    return model
+
+
+# --- 書き出し (prepare_models.py から使う) ---
+
+def _export_whisper(name: str, model: Any, directory: str) -> Dict[str, Any]:
+    import dataclasses
+
+    import torch
+    import whisper
+
+    file = f"{name}.pt"
+    torch.save({"dims": dataclasses.asdict(model.dims), "model_state_dict": model.state_dict()}, os.path.join(directory, file))
+    entry = {"format": "whisper_state", "file": file, "source": MODEL_SOURCES[name]}
+    heads = getattr(whisper, "_ALIGNMENT_HEADS", {}).get(MODEL_SOURCES[name])
+    if heads:
+        entry["alignment_heads"] = base64.b85encode(heads).decode("ascii")
+    return entry
+
+
+def _export_pickle(name: str, model: Any, directory: str) -> Dict[str, Any]:
+    import torch
+
+    file = f"{name}.pt"
+    path = os.path.join(directory, file)
+    torch.save(model, path)
+    # 保存できても読み戻せないもの (ローカル関数を持つなど) があるため、ここで確かめる
+    torch.load(path, map_location="cpu", mmap=True, weights_only=False)
+    return {"format": "torch_pickle", "file": file, "source": MODEL_SOURCES[name]}
+
+
+def _export_embedding(model: Any, directory: str) -> Dict[str, Any]:
+    try:
+        return _export_pickle("embedding", model, directory)
+    except Exception as e:
+        print(f"  embedding: オブジェクト全体を保存できないため、hparams を複製します ({e})")
+        stale = os.path.join(directory, "embedding.pt")
+        if os.path.exists(stale):
+            os.remove(stale)
+    file = "embedding"
+    shutil.copytree(EMBEDDING_SAVEDIR, os.path.join(directory, file), symlinks=False)
+    return {"format": "local_hparams", "file": file, "source": MODEL_SOURCES["embedding"]}
+
+
+def _trace_embedding(model: Any, directory: str) -> Optional[str]:
+    """話者埋め込みのネットワーク (特徴量 → 埋め込み) を TorchScript にする。長さを変えて結果が一致しなければ使わない"""
+    import torch
+
+    network = model.mods.embedding_model.eval()
+    sample_rate = 16000
+
+    def features(seconds: float):
+        wav = torch.randn(1, int(seconds * sample_rate))
+        feats = model.mods.compute_features(wav)
+        return model.mods.mean_var_norm(feats, torch.ones(1))
+
+    with torch.no_grad():
+        traced = torch.jit.trace(network, features(TRACE_EXAMPLE_SECONDS))
+        check = features(TRACE_EXAMPLE_SECONDS * 2.3)
+        if not torch.allclose(traced(check), network(check), atol=1e-4):
+            print("  embedding: トレース結果が入力の長さで変わるため、トレースは使いません")
+            return None
+    file = "embedding_network.ts"
+    traced.save(os.path.join(directory, file))
+    return file
+
+
+def export_models(names=None, trace: bool = False, root: str = ARTIFACT_DIR) -> str:
+    """モデルを読み込んで新しい版のディレクトリに書き出し、CURRENT をその版に切り替える。版のディレクトリを返す"""
+    import torch
+
+    names = list(names or MODEL_SOURCES)
+    versions = library_versions()
+    version = artifact_version(versions)
+    directory = os.path.join(root, version)
+    tmp = directory + ".tmp"
+    os.makedirs(tmp, exist_ok=True)
+    cpu = torch.device("cpu")
+
+    models: Dict[str, Any] = {}
+    for name in names:
+        print(f"--- {name} ({MODEL_SOURCES[name]}) を書き出します ---")
+        started = time.monotonic()
+        model = load_from_source(name, cpu)
+        if name in WHISPER_MODELS:
+            entry = _export_whisper(name, model, tmp)
+        elif name == "embedding":
+            entry = _export_embedding(model, tmp)
+            if trace:
+                traced = _trace_embedding(model, tmp)
+                if traced:
+                    entry["traced"] = traced
+        else:
+            entry = _export_pickle(name, model, tmp)
+        models[name] = entry
+        print(f"  {entry['format']} ({time.monotonic() - started:.1f}秒)")
+
+    # 一部だけ書き出した場合、残りのモデルは今の版から引き継ぐ (ライブラリの版が同じときだけ)
+    previous = current_artifact_dir(root)
+    if previous is not None:
+        manifest = load_manifest(previous)
+        if manifest.get("versions") == versions:
+            for name, entry in manifest.get("models", {}).items():
+                if name in models:
+                    continue
+                for file in filter(None, (entry["file"], entry.get("traced"))):
+                    src = os.path.join(previous, file)
+                    (shutil.copytree if os.path.isdir(src) else shutil.copy2)(src, os.path.join(tmp, file))
+                models[name] = entry
+
+    manifest = {"version": version, "created_at": datetime.datetime.now(datetime.UTC).isoformat(), "versions": versions, "models": models}
+    with open(os.path.join(tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    # 書き出しが終わってから公開する (途中で止まっても CURRENT は前の版のまま)
+    os.replace(tmp, directory)
+    with open(os.path.join(root, CURRENT_FILE + ".tmp"), "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(os.path.join(root, CURRENT_FILE + ".tmp"), os.path.join(root, CURRENT_FILE))
+    return directory
@@ -0,0 +1,85 @@
+"""
+[モデルの事前書き出し] AIワーカーが使うモデルをローカルの版付きディレクトリに書き出す (オフラインで1回実行)
+
+  py .\\prepare_models.py [--only whisper,embedding] [--trace] [--keep 2]
+  py .\\prepare_models.py status
+
+書き出し先: model_artifacts/<版>/ (環境変数 KOENO_MODEL_ARTIFACTS で変更可)。
+            manifest.json にモデルの配布元・形式・ライブラリの版を記録し、CURRENT を新しい版に切り替える。
+ワーカー (run_worker.py) は起動時に CURRENT の版から重みをメモリマップして読み込む (model_artifacts.py)。
+torch などを更新したら再実行すること (版が合わない書き出しは使われず、従来どおり Hugging Face から読み込む)。
+--trace: 話者埋め込みのネットワークを TorchScript にトレースして一緒に書き出す。
+--keep:  残す版の数 (古い版から削除する。CURRENT の版は必ず残る)。
+書き出しの効果は bench_startup.py --models で確認できる。
+"""
+
+import argparse
+import os
+import shutil
+
+import model_artifacts
+
+
+def list_versions(root: str):
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if os.path.exists(os.path.join(root, name, model_artifacts.MANIFEST_FILE))
+    )
+
+
+def show_status(root: str) -> None:
+    current = model_artifacts.current_artifact_dir(root)
+    versions = list_versions(root)
+    if not versions:
+        print(f"書き出し済みのモデルはありません ({root})")
+        return
+    installed = model_artifacts.library_versions()
+    for version in versions:
+        directory = os.path.join(root, version)
+        manifest = model_artifacts.load_manifest(directory)
+        mark = "*" if current == directory else " "
+        usable = "" if manifest.get("versions", {}).get("torch") == installed["torch"] else "  (torch の版が異なるため使われません)"
+        print(f"{mark} {version}  {manifest.get('created_at', '')}{usable}")
+        for name, entry in manifest.get("models", {}).items():
+            traced = " + traced" if entry.get("traced") else ""
+            print(f"      {name:<12}{entry['format']}{traced}  ({entry['source']})")
+
+
+def prune(root: str, keep: int) -> None:
+    current = model_artifacts.current_artifact_dir(root)
+    versions = list_versions(root)
+    for version in versions[:-keep] if keep > 0 else versions:
+        directory = os.path.join(root, version)
+        if directory == current:
+            continue
+        shutil.rmtree(directory)
+        print(f"古い版を削除しました: {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AIワーカーのモデルを書き出す")
+    parser.add_argument("command", nargs="?", choices=["export", "status"], default="export")
+    parser.add_argument("--only", help=f"書き出すモデル (カンマ区切り: {','.join(model_artifacts.MODEL_SOURCES)})")
+    parser.add_argument("--trace", action="store_true", help="話者埋め込みのネットワークを TorchScript にトレースする")
+    parser.add_argument("--keep", type=int, default=2, help="残す版の数")
+    parser.add_argument("--dir", default=model_artifacts.ARTIFACT_DIR, help="書き出し先")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        show_status(args.dir)
+        return
+
+    names = args.only.split(",") if args.only else None
+    unknown = [n for n in names or [] if n not in model_artifacts.MODEL_SOURCES]
+    if unknown:
+        parser.error(f"未知のモデルです: {','.join(unknown)}")
+    print("（HuggingFace トークン（HF_TOKEN）が環境変数に設定されている必要があります）")
+    directory = model_artifacts.export_models(names, trace=args.trace, root=args.dir)
+    print(f"--- 書き出し完了: {directory} ---")
+    prune(args.dir, args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import job_queue
+from waveform_peaks import peaks_path_for
+
+# --- 別マシンのワーカー用: HTTP のジョブ API クライアント ---
+# KOENO_JOB_SERVER を設定して run_worker.py を起動すると、koeno_app.db を開かずに
+# API サーバーのジョブ API (main.py の /jobs/...) で録音を取得・処理・書き戻す。
+# job_queue モジュールと同じ名前・引数の関数を持ち、worker_pipeline.WorkerPipeline(jobs=...) にそのまま渡せる。
+#   取得     … POST /jobs/claim でリースを取り、音声を DOWNLOAD_DIR にダウンロードしてから返す
+#   延長     … POST /jobs/{id}/heartbeat (409 = リースを失った)
+#   進捗     … publish_status の送り先を差し替え (status_bus.set_publisher)、録音ごとの最新値だけを
+#               PROGRESS_FLUSH_SECONDS ごとに送る (UDP と同じくベストエフォート)
+#   書き戻し … POST /jobs/{id}/complete (波形ピークも一緒に送る) / fail。completed などの通知はサーバー側で行う
+# 通信には標準ライブラリの urllib を使い、別スレッドで実行する (llm_client.py と同じ)。
+
+JOB_SERVER = os.environ.get("KOENO_JOB_SERVER")       # 例: https://koeno.example.jp/api
+WORKER_TOKEN = os.environ.get("KOENO_WORKER_TOKEN")   # サーバーの KOENO_WORKER_TOKENS のいずれか
+DOWNLOAD_DIR = os.environ.get("KOENO_WORKER_DOWNLOAD_DIR", os.path.join(tempfile.gettempdir(), "koeno_jobs"))
+HTTP_TIMEOUT_SECONDS = 60
+PROGRESS_FLUSH_SECONDS = 1.0
+
+
+class RemoteJobs:
+    # (claim の応答でサーバーの設定に合わせる)
+    HEARTBEAT_SECONDS = job_queue.HEARTBEAT_SECONDS
+    MAX_ATTEMPTS = job_queue.MAX_ATTEMPTS
+
+    def __init__(self, base_url: str, token: Optional[str], download_dir: str = DOWNLOAD_DIR):
+        if not token:
+            raise RuntimeError("KOENO_WORKER_TOKEN が設定されていません")
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.download_dir = download_dir
+        self.worker_id: Optional[str] = None   # (進捗の送信に使う。claim_job で記録する)
+        self._progress: Dict[int, Dict[str, Any]] = {}
+        os.makedirs(download_dir, exist_ok=True)
+
+    def _open(self, method: str, path: str, body: Any = None, headers: Optional[Dict[str, str]] = None):
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=None if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8"),
+            headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/json", **(headers or {})},
+            method=method,
+        )
+        return urllib.request.urlopen(req, timeout=HTTP_TIMEOUT_SECONDS)
+
+    def _request(self, method: str, path: str, body: Any = None):
+        """(状態コード, JSON) を返す。409 (リースを失った) はそのまま返し、それ以外のエラーは例外"""
+        try:
+            with self._open(method, path, body) as res:
+                raw = res.read()
+                return res.status, json.loads(raw) if raw else None
+        except urllib.error.HTTPError as e:
+            if e.code == 409:
+                return 409, None
+            raise RuntimeError(f"ジョブ API エラー ({method} {path}): {e.code} {e.read()[:200].decode('utf-8', 'replace')}")
+
+    async def _call(self, method: str, path: str, body: Any = None):
+        return await asyncio.to_thread(self._request, method, path, body)
+
+    def _download(self, recording_id: int, filename: str, worker_id: str) -> str:
+        path = os.path.join(self.download_dir, f"{recording_id}_{os.path.basename(filename) or 'audio'}")
+        tmp_path = path + ".part"
+        try:
+            with self._open("GET", f"/jobs/{recording_id}/audio", headers={"X-Worker-ID": worker_id}) as res, open(tmp_path, "wb") as f:
+                shutil.copyfileobj(res, f, 1024 * 1024)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        return path
+
+    async def expire_exhausted(self) -> list:
+        # (試行回数を使い切った行の回収はサーバーが claim のたびに行う)
+        return []
+
+    async def claim_job(self, worker_id: str):
+        self.worker_id = worker_id
+        status, data = await self._call("POST", "/jobs/claim", {"worker_id": worker_id})
+        if status == 204 or not data:
+            return None
+        self.HEARTBEAT_SECONDS = data["heartbeat_seconds"]
+        self.MAX_ATTEMPTS = data["max_attempts"]
+        recording_id = data["recording_id"]
+        try:
+            path = await asyncio.to_thread(self._download, recording_id, data["filename"], worker_id)
+        except Exception as e:
+            # (ダウンロードできなかった録音はリースを返して再試行に回す)
+            await self.fail_job(recording_id, worker_id, f"音声のダウンロードに失敗: {e}")
+            raise
+        return SimpleNamespace(recording_id=recording_id, attempts=data["attempts"], audio_file_path=path, transcription_tier=data.get("transcription_tier"))
+
+    async def heartbeat(self, record_id: int, worker_id: str) -> bool:
+        status, _ = await self._call("POST", f"/jobs/{record_id}/heartbeat", {"worker_id": worker_id})
+        return status != 409
+
+    async def complete_job(self, record_id: int, worker_id: str, result_data: Any, audio_duration: Optional[float] = None, processing_seconds: Optional[float] = None) -> bool:
+        body = {"worker_id": worker_id, "result": result_data, "audio_duration": audio_duration, "processing_seconds": processing_seconds}
+        peaks = self._local_peaks(record_id)
+        if peaks is not None:
+            body["peaks"] = peaks
+        status, _ = await self._call("POST", f"/jobs/{record_id}/complete", body)
+        return status != 409
+
+    async def fail_job(self, record_id: int, worker_id: str, error: str, retryable: bool = True) -> Optional[str]:
+        status, data = await self._call("POST", f"/jobs/{record_id}/fail", {"worker_id": worker_id, "error": error[:1000], "retryable": retryable})
+        return None if status == 409 else data["ai_status"]
+
+    def _local_files(self, record_id: int):
+        prefix = f"{record_id}_"
+        return [os.path.join(self.download_dir, n) for n in os.listdir(self.download_dir) if n.startswith(prefix)]
+
+    def _local_peaks(self, record_id: int) -> Optional[Dict[str, Any]]:
+        for path in self._local_files(record_id):
+            peaks_path = peaks_path_for(path)
+            if os.path.exists(peaks_path):
+                with open(peaks_path, encoding="utf-8") as f:
+                    return json.load(f)
+        return None
+
+    def release_job(self, job) -> None:
+        """ダウンロードした音声とその派生ファイル (波形ピークなど) を消す"""
+        for path in self._local_files(job.recording_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # --- 進捗の送信 ---
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """(status_bus.set_publisher に渡す) 処理中の進捗だけを送る。別スレッドから呼ばれてもよい"""
+        if event.get("ai_status") == "processing":
+            self._progress[event["recording_id"]] = event
+
+    async def progress_loop(self):
+        while True:
+            await asyncio.sleep(PROGRESS_FLUSH_SECONDS)
+            pending, self._progress = self._progress, {}
+            for record_id, event in pending.items():
+                try:
+                    await self._call("POST", f"/jobs/{record_id}/progress", {"worker_id": self.worker_id, "stage": event.get("stage"), "progress": event.get("progress")})
+                except Exception as e:
+                    print(f"進捗の送信に失敗 (無視します): {e}")
@@ -1,91 +1,101 @@
 import asyncio
+import numpy as np
 import torch
-import whisper
 import json
 import os
 import pydub
-from pyannote.audio import Pipeline
-from speechbrain.pretrained import EncoderClassifier
-import time
+from typing import Any, Dict
 
 # 警告を非表示にする (AIモデルロード時の定型文)
 import warnings
 warnings.filterwarnings("ignore")
 
-# Task 1 で定義したDB接続情報とテーブル定義を main.py からインポートする
-from main import database, recordings
+# Task 1 で定義したDB接続情報とテーブル定義を db.py からインポートする (FastAPI は読み込まない)
+from db import database
+from status_bus import publish_status, set_publisher
+import vad_gate
+import long_audio
+import transcription_tiers
+import job_queue
+from audio_prepare import prepare_audio
+from worker_pipeline import WorkerPipeline
+import summary_queue
+import remote_jobs
+import worker_layout
+import model_artifacts  # (whisper / pyannote / speechbrain はモデルのロード時にここから読み込む)
+from llm_client import make_client
 
-# (DB操作は SQLAlchemy Core の構文も使うため)
-import sqlalchemy
-from sqlalchemy.sql import update
 
 # --- Task 5: AIモデルのグローバルロード ---
 # (ワーカー起動時に一度だけロードする)
+# ★ main() から呼ぶ。デコード用の子プロセス (spawn の場合はこのモジュールを読み込み直す) でモデルをロードしないため
 
-print("AIワーカー: AIモデルのロードを開始します...")
-print("（HuggingFace トークン（HF_TOKEN）が環境変数に設定されている必要があります）")
+DEVICE = None
+diarization_pipeline = None
+whisper_model = None            # 速い段階 (すべての録音)
+whisper_accurate_model = None   # 高精度の段階。依頼された録音が来たときに読み込む (whisper_for)
+embedding_model = None
+vad_pipeline = None
 
-# デバイスの決定 (CUDAが使えるか)
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"AIワーカー: 使用デバイス: {DEVICE}")
 
-# 1. 話者分離 (Pyannote)
-print("AIワーカー: Pyannote (話者分離) モデルをロード中...")
-try:
-    # (HuggingFaceの認証トークンが .env (HF_TOKEN) や環境変数に必要)
-    diarization_pipeline = Pipeline.from_pretrained(
-        "pyannote/speaker-diarization-3.1",
-        # (use_auth_token=True は古い引数。環境変数 HUGGING_FACE_HUB_TOKEN を自動参照)
-    )
-    diarization_pipeline.to(DEVICE)
-    print("AIワーカー: Pyannote ロード完了。")
-except Exception as e:
-    print(f"AIワーカー: Pyannote のロードに失敗しました。HuggingFaceトークンが設定されていますか？ {e}")
-    diarization_pipeline = None
-
-# 2. 文字起こし (Whisper)
-print("AIワーカー: Whisper (文字起こし) モデルをロード中...")
-whisper_model = whisper.load_model("base") # or "medium"
-print("AIワーカー: Whisper ロード完了。")
-
-# 3. 話者埋め込み (SpeechBrain) - PO指示では不要だが、Pyannoteが内部で使う可能性
-print("AIワーカー: SpeechBrain (話者埋め込み) モデルをロード中...")
-try:
-    # ★★★ ここを修正 ★★★
-    # (誤: spkrec-apa-voxceleb)
-    # (正: spkrec-ecapa-voxceleb)
-    embedding_model = EncoderClassifier.from_hparams(
-        source="speechbrain/spkrec-ecapa-voxceleb", 
-        savedir=os.path.join("pretrained_models", "spkrec-ecapa-voxceleb"),
-        run_opts={"device": DEVICE}
-    )
-    # ★★★ ここまで修正 ★★★
-    print("AIワーカー: SpeechBrain ロード完了。")
-except Exception as e:
-    print(f"AIワーカー: SpeechBrain のロードに失敗しました: {e}")
-    embedding_model = None
+def load_models():
+    global DEVICE, diarization_pipeline, whisper_model, embedding_model, vad_pipeline
 
-print("--- AIモデルのロード完了 ---")
+    print("AIワーカー: AIモデルのロードを開始します...")
+    print("（HuggingFace トークン（HF_TOKEN）が環境変数に設定されている必要があります）")
 
+    # デバイスの決定 (CUDAが使えるか)
+    DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"AIワーカー: 使用デバイス: {DEVICE}")
 
-async def set_status_async(record_id: int, status: str, result_data: dict = None):
-    """
-    DBのステータスと結果を更新する (databases ライブラリ版)
-    (result_data は Python dict で受け取る)
-    """
+    # 1. 話者分離 (Pyannote)
+    print("AIワーカー: Pyannote (話者分離) モデルをロード中...")
+    try:
+        # (HuggingFaceの認証トークンが .env (HF_TOKEN) や環境変数に必要。prepare_models.py で書き出し済みなら不要)
+        diarization_pipeline = model_artifacts.load_model("diarization", DEVICE)
+        print("AIワーカー: Pyannote ロード完了。")
+    except Exception as e:
+        print(f"AIワーカー: Pyannote のロードに失敗しました。HuggingFaceトークンが設定されていますか？ {e}")
+        diarization_pipeline = None
+
+    # 2. 文字起こし (Whisper)。速い段階のモデルだけ読み込む (高精度のモデルは whisper_for で必要になったときに)
+    print("AIワーカー: Whisper (文字起こし) モデルをロード中...")
+    whisper_model = model_artifacts.load_model(transcription_tiers.MODEL_NAMES[transcription_tiers.FAST], DEVICE)
+    print("AIワーカー: Whisper ロード完了。")
+
+    # 3. 話者埋め込み (SpeechBrain) - PO指示では不要だが、Pyannoteが内部で使う可能性
+    print("AIワーカー: SpeechBrain (話者埋め込み) モデルをロード中...")
     try:
-        query = (
-            update(recordings)
-            .where(recordings.c.recording_id == record_id)
-            .values(
-                ai_status=status,
-                transcription_result=result_data # Python辞書をそのまま渡す (JSONに自動変換)
-            )
-        )
-        await database.execute(query)
-        print(f"DB更新: ID {record_id} を {status} に更新しました。")
+        # (spkrec-ecapa-voxceleb。誤: spkrec-apa-voxceleb)
+        embedding_model = model_artifacts.load_model("embedding", DEVICE)
+        print("AIワーカー: SpeechBrain ロード完了。")
     except Exception as e:
-        print(f"DBエラー: ID {record_id} の更新に失敗: {e}")
+        print(f"AIワーカー: SpeechBrain のロードに失敗しました: {e}")
+        embedding_model = None
+
+    # 4. 発話区間検出 (VAD) - 無音の録音を省き、発話だけを重いモデルに渡すため (PoC と同じモデル)
+    print("AIワーカー: Pyannote (VAD) モデルをロード中...")
+    try:
+        vad_pipeline = model_artifacts.load_model("vad", DEVICE)
+        print("AIワーカー: VAD ロード完了。")
+    except Exception as e:
+        # (VAD が無くても録音全体を処理すれば結果は同じ。遅くなるだけ)
+        print(f"AIワーカー: VAD のロードに失敗しました (録音全体を処理します): {e}")
+        vad_pipeline = None
+
+    print("--- AIモデルのロード完了 ---")
+
+
+class JobError(Exception):
+    """処理の失敗。retryable=False はファイル欠損など、再試行しても直らないもの"""
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def report_progress(record_id: int, stage: str, progress: float):
+    """処理中の段階と進捗 (0.0〜1.0) を SSE 購読者へ通知する (DBには書かない)"""
+    publish_status(record_id, "processing", stage=stage, progress=progress)
 
 
 def merge_diarization_and_transcription(diarization, transcription):
@@ -123,130 +133,253 @@ def merge_diarization_and_transcription(diarization, transcription):
     return results
 
 
-async def process_recording_task(record_id: int, audio_file_path: str):
+def whisper_for(tier: str):
+    """文字起こしの段階に応じた Whisper モデル (スレッドで呼ぶ。推論は1件ずつなので読み込みが重なることはない)"""
+    global whisper_accurate_model
+    if tier != transcription_tiers.ACCURATE:
+        return whisper_model
+    if whisper_accurate_model is None:
+        print("AIワーカー: Whisper (高精度) モデルをロード中...")
+        whisper_accurate_model = model_artifacts.load_model(transcription_tiers.MODEL_NAMES[tier], DEVICE)
+    return whisper_accurate_model
+
+
+def transcribe(audio, tier: str = transcription_tiers.FAST):
+    """段階のモデルとデコード設定 (貪欲 / ビームサーチ + 温度フォールバック) で文字起こしする"""
+    return whisper_for(tier).transcribe(audio, **transcription_tiers.transcribe_options(tier))
+
+
+def _detect_speech(audio):
     """
-    単一の録音ファイルを処理する (Task 5 の中核ロジック)
-    (AI処理は同期的 (ブロッキング) に実行される)
+    VAD で発話区間を求め、詰めた時間軸 (PackedTimeline) を返す。
+    VAD が使えない場合は None (録音全体を処理する)。
     """
-    print(f"処理開始: ID {record_id} (ファイル: {audio_file_path})")
-    
-    # --- 1. 音声ファイルのロードと前処理 ---
-    try:
-        # (ファイルが存在しない場合)
-        if not os.path.exists(audio_file_path):
-            print(f"エラー: ID {record_id} の音声ファイルが見つかりません: {audio_file_path}")
-            await set_status_async(record_id, "failed")
-            return
-
-        # (pydub の .from_file() を使用)
-        audio = pydub.AudioSegment.from_file(audio_file_path)
-        # (Pyannote用に16kHz, モノラルに変換)
-        audio = audio.set_frame_rate(16000).set_channels(1)
-        # (Whisperはファイルパスで処理するため、一時ファイルに保存)
-        temp_audio_path = audio_file_path + "_whisper_temp.wav"
-        audio.export(temp_audio_path, format="wav")
-    except Exception as e:
-        print(f"エラー: ID {record_id} の音声ファイルロード失敗: {e}")
-        await set_status_async(record_id, "failed")
-        return
+    if vad_pipeline is None:
+        return None
+    samples = torch.tensor(audio.get_array_of_samples(), dtype=torch.float32).unsqueeze(0) / 32768.0
+    vad_result = vad_pipeline({"waveform": samples, "sample_rate": audio.frame_rate})
+    return vad_gate.PackedTimeline(vad_gate.speech_regions(vad_result, len(audio) / 1000.0))
 
-    # --- 2. 話者分離 (Pyannote) ---
-    if diarization_pipeline is None:
-        print(f"エラー: ID {record_id} - Pyannote がロードされていません。")
-        await set_status_async(record_id, "failed")
-        return
-        
-    try:
-        print(f"ID {record_id}: 話者分離を実行中...")
-        diarization = diarization_pipeline(temp_audio_path)
-    except Exception as e:
-        print(f"エラー: ID {record_id} の話者分離に失敗: {e}")
-        await set_status_async(record_id, "failed")
-        if os.path.exists(temp_audio_path): os.remove(temp_audio_path)
-        return
 
-    # --- 3. 文字起こし (Whisper) ---
-    try:
-        print(f"ID {record_id}: 文字起こしを実行中...")
-        # language="ja" を指定
-        transcription = whisper_model.transcribe(temp_audio_path, language="ja")
-    except Exception as e:
-        print(f"エラー: ID {record_id} の文字起こしに失敗: {e}")
-        await set_status_async(record_id, "failed")
-        if os.path.exists(temp_audio_path): os.remove(temp_audio_path)
-        return
-    
-    # --- 4. 結果のマージとDB書き戻し ---
-    print(f"ID {record_id}: 結果をマージ中...")
+async def process_prepared_audio(record_id: int, prepared: Dict[str, Any]):
+    """
+    デコード済みの録音 (audio_prepare.prepare_audio の結果) を処理し、(マージ済みの結果, 音声の長さ秒) を返す (Task 5 の中核ロジック)
+    失敗時は JobError を送出する (ステータスの更新は書き込み段がリース経由で行う)。
+    ★ AI処理は asyncio.to_thread で実行し、その間もイベントループで次の録音の取得・結果の書き込み・ハートビートを進める
+    """
+    if "pcm_path" in prepared:
+        # 長時間録音 (audio_prepare.LONG_RECORDING_SECONDS 超) は窓ごとに処理する
+        return await process_long_audio(record_id, prepared)
+    wav_path = prepared["wav_path"]
+    audio_seconds = prepared["audio_seconds"]
+    tier = prepared.get("tier", transcription_tiers.FAST)
+    print(f"処理開始: ID {record_id} (デコード済み: {wav_path}, デコード {prepared['decode_seconds']:.1f}秒, 段階: {tier})")
+
+    packed_path = wav_path + ".packed.wav"
     try:
-        # Python辞書 (dict) として受け取る
-        result_json: dict = merge_diarization_and_transcription(diarization, transcription)
-        
-        print(f"ID {record_id}: 処理成功。DBに書き戻します。")
-        
-        # Python辞書をそのまま渡す (json.dumps() はしない)
-        await set_status_async(record_id, "completed", result_json)
-        
-    except Exception as e:
-        print(f"エラー: ID {record_id} の結果マージまたはDB書き込みに失敗: {e}")
-        await set_status_async(record_id, "failed")
+        if diarization_pipeline is None:
+            raise JobError("Pyannote がロードされていません。", retryable=False)
+        # (変換済みの wav なので ffmpeg を使わずに読める)
+        audio = await asyncio.to_thread(pydub.AudioSegment.from_wav, wav_path)
+
+        # --- 1. 発話区間の抽出 (VAD)。無音なら重い処理を省き、発話だけを詰めた音声を作る ---
+        timeline = None
+        try:
+            report_progress(record_id, "vad", 0.1)
+            timeline = await asyncio.to_thread(_detect_speech, audio)
+        except Exception as e:
+            print(f"警告: ID {record_id} の発話区間検出に失敗 (録音全体を処理します): {e}")
+        input_path = wav_path
+        if timeline is not None:
+            speech = vad_gate.speech_seconds(timeline.regions)
+            print(f"ID {record_id}: 発話 {speech:.1f}秒 / 録音 {audio_seconds:.1f}秒 ({len(timeline.regions)} 区間)")
+            if speech < vad_gate.MIN_SPEECH_SECONDS:
+                print(f"ID {record_id}: 発話が無いため、話者分離・文字起こしを省略します。")
+                return [], audio_seconds
+            try:
+                # (Whisperはファイルパスで処理するため、一時ファイルに保存)
+                await asyncio.to_thread(vad_gate.pack_audio(audio, timeline).export, packed_path, format="wav")
+            except Exception as e:
+                raise JobError(f"一時ファイルの書き出しに失敗: {e}")
+            input_path = packed_path
+
+        # --- 2. 話者分離 (Pyannote) ---
+        try:
+            print(f"ID {record_id}: 話者分離を実行中...")
+            report_progress(record_id, "diarization", 0.2)
+            diarization = await asyncio.to_thread(diarization_pipeline, input_path)
+        except Exception as e:
+            raise JobError(f"話者分離に失敗: {e}")
+
+        # --- 3. 文字起こし (Whisper) ---
+        try:
+            print(f"ID {record_id}: 文字起こしを実行中...")
+            report_progress(record_id, "transcription", 0.6)
+            # language="ja" を指定 (transcription_tiers.transcribe_options)
+            transcription = await asyncio.to_thread(transcribe, input_path, tier)
+        except Exception as e:
+            raise JobError(f"文字起こしに失敗: {e}")
+
+        # --- 4. 結果のマージ ---
+        print(f"ID {record_id}: 結果をマージ中...")
+        report_progress(record_id, "merging", 0.9)
+        try:
+            result_json = merge_diarization_and_transcription(diarization, transcription)
+            if timeline is not None:
+                # 詰めた時間軸 → 元の録音の時間軸 (音声プレーヤー・波形と一致させる)
+                timeline.remap_segments(result_json)
+            return result_json, audio_seconds
+        except Exception as e:
+            raise JobError(f"結果のマージに失敗: {e}")
+    finally:
+        # --- 5. 最後に一時ファイルを削除 (失敗時も) ---
+        for path in (wav_path, packed_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _speaker_embeddings(diarization, samples, sample_rate: int) -> Dict[str, Any]:
+    """話者ごとの声の埋め込み (窓をまたいだ話者の対応付け用)。発話が短い・モデルが無い話者は None"""
+    embeddings: Dict[str, Any] = {}
+    limit = int(long_audio.MAX_EMBEDDING_SECONDS * sample_rate)
+    for label in diarization.labels():
+        pieces, total = [], 0
+        for turn in diarization.label_timeline(label):
+            piece = samples[int(turn.start * sample_rate):int(turn.end * sample_rate)][:limit - total]
+            pieces.append(piece)
+            total += len(piece)
+            if total >= limit:
+                break
+        if embedding_model is None or total < long_audio.MIN_EMBEDDING_SECONDS * sample_rate:
+            embeddings[label] = None
+            continue
+        wav = torch.from_numpy(np.concatenate(pieces)).unsqueeze(0)
+        with torch.no_grad():
+            embeddings[label] = embedding_model.encode_batch(wav).squeeze().cpu().numpy()
+    return embeddings
+
 
-    # --- 5. 最後に一時ファイルを削除 ---
-    if os.path.exists(temp_audio_path):
-        os.remove(temp_audio_path)
+def _process_window(samples, sample_rate: int, tier: str):
+    """長時間録音の窓1つを処理し、(窓内の時刻の結果, {話者ラベル: 埋め込み}) を返す (スレッドで実行)"""
+    timeline = None
+    if vad_pipeline is not None:
+        waveform = torch.from_numpy(samples).unsqueeze(0)
+        vad_result = vad_pipeline({"waveform": waveform, "sample_rate": sample_rate})
+        timeline = vad_gate.PackedTimeline(vad_gate.speech_regions(vad_result, len(samples) / sample_rate))
+        if vad_gate.speech_seconds(timeline.regions) < vad_gate.MIN_SPEECH_SECONDS:
+            return [], {}
+        samples = vad_gate.pack_samples(samples, timeline, sample_rate)
+    diarization = diarization_pipeline({"waveform": torch.from_numpy(samples).unsqueeze(0), "sample_rate": sample_rate})
+    transcription = transcribe(samples, tier)
+    result_json = merge_diarization_and_transcription(diarization, transcription)
+    embeddings = _speaker_embeddings(diarization, samples, sample_rate)
+    if timeline is not None:
+        timeline.remap_segments(result_json)
+    return result_json, embeddings
+
+
+async def process_long_audio(record_id: int, prepared: Dict[str, Any]):
+    """
+    長時間録音を memmap した PCM の窓ごとに処理し、(結果, 音声の長さ秒) を返す (long_audio.py)
+    ★ メモリに載るのは窓1つぶん (既定10分) だけ。窓ごとの話者ラベルは声の埋め込みで通しのラベルに付け直す
+    """
+    pcm_path = prepared["pcm_path"]
+    sample_rate = prepared["sample_rate"]
+    audio_seconds = prepared["audio_seconds"]
+    pcm = None
+    try:
+        if diarization_pipeline is None:
+            raise JobError("Pyannote がロードされていません。", retryable=False)
+        pcm = long_audio.open_pcm(pcm_path)
+        windows = long_audio.plan_windows(audio_seconds)
+        linker = long_audio.SpeakerLinker()
+        print(f"処理開始: ID {record_id} (長時間録音 {audio_seconds / 60:.0f}分, {len(windows)} 窓)")
+        results = []
+        for i, window in enumerate(windows):
+            report_progress(record_id, "transcription", 0.1 + 0.8 * i / len(windows))
+            samples = long_audio.window_samples(pcm, window, sample_rate)
+            try:
+                segments, embeddings = await asyncio.to_thread(_process_window, samples, sample_rate, prepared.get("tier", transcription_tiers.FAST))
+            except Exception as e:
+                raise JobError(f"長時間録音の処理に失敗 (窓 {i + 1}/{len(windows)}): {e}")
+            del samples
+            mapping = linker.link(embeddings)
+            results.extend(long_audio.relabel(long_audio.take_core_segments(segments, window), mapping))
+        report_progress(record_id, "merging", 0.9)
+        return results, audio_seconds
+    finally:
+        # (窓の音声は window_samples のコピーなので、閉じた memmap を後から読むことはない)
+        if pcm is not None:
+            long_audio.close_pcm(pcm)
+        del pcm
+        if os.path.exists(pcm_path):
+            os.remove(pcm_path)
 
 
 async def main_worker_loop():
     """
-    Task 5 のメインポーリングループ
+    Task 5 のメインループ
+    ★ 録音はリースで取得する。ワーカーが落ちてもリース期限切れ後に再取得される (job_queue.py)
+    ★ 取得・デコード / 推論 / 書き込みを重ねて実行し、モデルを ffmpeg や SQLite の待ちで止めない (worker_pipeline.py)
     """
-    print("AIワーカー: 起動完了。 'pending' ステータスのレコードを検索します...")
-    
-    while True:
-        pending_record = None
-        try:
-            # 1. 'pending' のレコードを1件探す (databases ライブラリ使用)
-            query = recordings.select().where(recordings.c.ai_status == "pending").limit(1)
-            pending_record = await database.fetch_one(query)
-
-            if pending_record:
-                record_id = pending_record.recording_id
-                audio_file_path = pending_record.audio_file_path
-                
-                # 2. 'processing' にステータス更新
-                await set_status_async(record_id, "processing")
-                
-                # 3. AI処理の実行 (ブロッキングだが、1件ずつなのでOK)
-                await process_recording_task(record_id, audio_file_path)
-                
-            else:
-                # 4. pending がなければ待機
-                print(f"AIワーカー: 現在処理対象はありません。60秒後に再検索します... (Ctrl+Cで停止)")
-                await asyncio.sleep(60) # 60秒ポーリング
-        
-        except Exception as e:
-            print(f"AIワーカー: メインループで致命的なエラーが発生しました: {e}")
-            if pending_record:
-                # もし処理中に予期せぬエラーが起きたら 'failed' にする
-                await set_status_async(pending_record.record_id, "failed")
-            
-            print("AIワーカー: 60秒後にリトライします...")
-            await asyncio.sleep(60)
+    worker_id = job_queue.make_worker_id()
+    print(f"AIワーカー: 起動完了 (ワーカーID: {worker_id})。処理対象のレコードを検索します...")
+    pipeline = WorkerPipeline(
+        worker_id,
+        decode=prepare_audio,
+        infer=process_prepared_audio,
+        # 割当済みの録音を再処理した場合は要約草案も作り直す
+        on_completed=summary_queue.mark_pending,
+    )
+    await pipeline.run()
+
+async def remote_worker_loop():
+    """
+    別マシンのワーカー (KOENO_JOB_SERVER を設定した場合)
+    ★ koeno_app.db は開かず、API サーバーのジョブ API で取得・ダウンロード・書き戻しを行う (remote_jobs.py)
+    (要約草案の作り直しは、完了を受け取った API サーバーが行う)
+    """
+    jobs = remote_jobs.RemoteJobs(remote_jobs.JOB_SERVER, remote_jobs.WORKER_TOKEN)
+    worker_id = job_queue.make_worker_id()
+    print(f"AIワーカー: 起動完了 (ワーカーID: {worker_id}, ジョブ API: {remote_jobs.JOB_SERVER})。処理対象のレコードを検索します...")
+    # 進捗の通知は UDP ではなくジョブ API へ送る
+    set_publisher(jobs.publish)
+    progress_task = asyncio.create_task(jobs.progress_loop())
+    try:
+        await WorkerPipeline(worker_id, decode=prepare_audio, infer=process_prepared_audio, jobs=jobs).run()
+    finally:
+        progress_task.cancel()
+        set_publisher(None)
 
 async def main():
     """
     ワーカープロセスのエントリーポイント
     """
+    # launch_workers.py から起動された場合は、tune_workers.py が決めた CPU の枠とスレッド数を使う (モデルのロード前に)
+    worker_layout.apply_configured_layout()
+    load_models()
     if diarization_pipeline is None or embedding_model is None:
         print("致命的エラー: AIモデルのロードに失敗したため、ワーカーを起動できません。")
         print("HuggingFace トークン（HF_TOKEN）が正しく設定されているか確認してください。")
         return
 
+    if remote_jobs.JOB_SERVER:
+        await remote_worker_loop()
+        return
+
     print("AIワーカー: データベース（非同期）に接続します...")
     await database.connect()
+    # ★ 要約草案の生成は文字起こしと並行して回す (LLM 待ちで文字起こしを止めない)
+    summary_task = None
+    try:
+        summary_task = asyncio.create_task(summary_queue.summary_loop(make_client()))
+    except (RuntimeError, ValueError) as e:
+        print(f"警告: 要約ワーカーを起動できません (要約草案は生成されません): {e}")
     try:
         await main_worker_loop()
     finally:
+        if summary_task:
+            summary_task.cancel()
         await database.disconnect()
         print("AIワーカー: データベース接続を切断しました。")
 
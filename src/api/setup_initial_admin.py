@@ -1,9 +1,9 @@
 import asyncio
 import datetime
-import sqlalchemy
 
-# main.py からDB定義（接続情報、テーブル定義）をインポート
-from main import database, caregivers, administrators, metadata, DATABASE_URL
+# db.py からDB定義（接続情報、テーブル定義）をインポート (FastAPI は読み込まない)
+from db import database, caregivers, administrators, DATABASE_URL
+from migrations import upgrade
 
 async def main():
     """
@@ -14,8 +14,7 @@ async def main():
     # --- 1. DBテーブルのセットアップ ---
     # (スクリプトを単体実行してもテーブルが作成されるように)
     try:
-        engine = sqlalchemy.create_engine(DATABASE_URL)
-        metadata.create_all(engine)
+        upgrade()
         print(f"データベース '{DATABASE_URL}' のテーブル定義を確認しました。")
     except Exception as e:
         print(f"エラー: DBテーブルの定義に失敗しました: {e}")
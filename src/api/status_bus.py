@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+# --- ai_status のローカル Pub/Sub ---
+# ワーカー (run_worker.py) は別プロセスなので、同一マシン内の UDP データグラムで
+# ステータス変化を API サーバー (main.py) に通知する。
+# API 側は受け取ったイベントを、その録音の介護士の SSE 接続へ配る。
+# 配送は「ベストエフォート」: 取りこぼしてもDBが正なので、クライアントは再接続時のスナップショットで追いつける。
+
+STATUS_BUS_HOST = os.environ.get("KOENO_STATUS_BUS_HOST", "127.0.0.1")
+STATUS_BUS_PORT = int(os.environ.get("KOENO_STATUS_BUS_PORT", "8765"))
+
+# 1接続あたりの未送信イベント上限 (遅いクライアントでメモリが膨らまないように)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_publish_socket: Optional[socket.socket] = None
+# 別マシンのワーカー (remote_jobs.py) は UDP の代わりにこの関数でジョブ API へ送る
+_publisher: Optional[Callable[[Dict[str, Any]], None]] = None
+
+
+def make_event(recording_id: int, ai_status: str, stage: Optional[str] = None, progress: Optional[float] = None) -> Dict[str, Any]:
+    return {
+        "recording_id": recording_id,
+        "ai_status": ai_status,
+        "stage": stage,
+        "progress": None if progress is None else round(progress, 3),
+        "ts": time.time(),
+    }
+
+
+def set_publisher(publisher: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+    """(ワーカー側) publish_status の送り先を差し替える (None で UDP に戻す)"""
+    global _publisher
+    _publisher = publisher
+
+
+def publish_status(recording_id: int, ai_status: str, stage: Optional[str] = None, progress: Optional[float] = None) -> None:
+    """
+    (ワーカー側) ステータス変化を送信する。API が起動していなくても例外は出さない。
+    """
+    global _publish_socket
+    event = make_event(recording_id, ai_status, stage, progress)
+    if _publisher is not None:
+        _publisher(event)
+        return
+    try:
+        if _publish_socket is None:
+            _publish_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _publish_socket.sendto(json.dumps(event).encode("utf-8"), (STATUS_BUS_HOST, STATUS_BUS_PORT))
+    except OSError as e:
+        print(f"ステータス通知の送信に失敗 (無視します): {e}")
+
+
+class _BusProtocol(asyncio.DatagramProtocol):
+    def __init__(self, broker: "StatusBroker"):
+        self.broker = broker
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            event = json.loads(data.decode("utf-8"))
+        except ValueError:
+            return
+        asyncio.ensure_future(self.broker.dispatch(event))
+
+
+class StatusBroker:
+    """
+    (API側) UDP で受けたステータスイベントを、介護士ごとの購読キューへ配る。
+    """
+
+    def __init__(self, resolve_owner):
+        # resolve_owner: recording_id -> caregiver_id (awaitable)
+        self._resolve_owner = resolve_owner
+        self._owners: Dict[int, str] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._transport = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _BusProtocol(self), local_addr=(STATUS_BUS_HOST, STATUS_BUS_PORT)
+            )
+            print(f"--- ステータス通知の待受開始 (udp://{STATUS_BUS_HOST}:{STATUS_BUS_PORT}) ---")
+        except OSError as e:
+            print(f"警告: ステータス通知ポートを開けませんでした。SSE はAPI内の更新のみ配信します: {e}")
+
+    def stop(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def subscribe(self, caregiver_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(caregiver_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, caregiver_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(caregiver_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[caregiver_id]
+
+    async def dispatch(self, event: Dict[str, Any]) -> None:
+        """イベントを録音の持ち主 (介護士) の購読者に配る (API内からの直接呼び出しも可)"""
+        if not self._subscribers:
+            return
+        recording_id = event.get("recording_id")
+        owner = self._owners.get(recording_id)
+        if owner is None:
+            owner = await self._resolve_owner(recording_id)
+            if owner is None:
+                return
+            if len(self._owners) > 10000:
+                self._owners.clear()
+            self._owners[recording_id] = owner
+        for queue in self._subscribers.get(owner, ()):
+            if queue.full():
+                # 古いイベントを捨てて最新を優先 (進捗は最新値だけ意味がある)
+                queue.get_nowait()
+            queue.put_nowait(event)
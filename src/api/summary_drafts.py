@@ -0,0 +1,40 @@
+import hashlib
+from typing import Any
+
+# --- 要約草案 (summary_drafts) の材料とキャッシュキー ---
+# 入居者ごとに割り当てた発話だけを取り出してプロンプトにし、
+# (発話テキストのハッシュ, プロンプト版, モデル, 入居者) をキーにキャッシュする。
+# プロンプトを変えたら PROMPT_VERSION を上げること (古いキャッシュは使われなくなる)。
+
+PROMPT_VERSION = "v1"
+
+SYSTEM_INSTRUCTION = "あなたは介護記録の作成を支援するAIです。"
+
+
+def user_transcript(segments: Any, user_id: str) -> str:
+    """割当スナップショット (無ければ文字起こし結果) から、その入居者に割り当てた発話を「話者: 本文」の行にする"""
+    if not isinstance(segments, list):
+        return ""
+    lines = []
+    for seg in segments:
+        if not isinstance(seg, dict) or seg.get("type", "transcript") != "transcript":
+            continue
+        if "assignedTo" in seg and seg["assignedTo"] != user_id:
+            continue
+        lines.append(f"{seg.get('speaker', '')}: {seg.get('text', '')}")
+    return "\n".join(lines)
+
+
+def build_prompt(transcript: str) -> str:
+    # (入居者名はサーバー側で分からないため、フロントエンドと同様に「利用者」と呼ぶ)
+    return (
+        f"{SYSTEM_INSTRUCTION}\n"
+        "以下は介護職員と利用者の会話の文字起こしです。利用者の様子・実施したケア・気になる点を、"
+        "介護記録の「個別要約」として箇条書き3行以内でまとめてください。推測は書かないでください。\n\n"
+        f"# 会話\n{transcript}"
+    )
+
+
+def cache_key(transcript: str, user_id: str, model_id: str, prompt_version: str = PROMPT_VERSION) -> str:
+    text_hash = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{prompt_version}|{model_id}|{user_id}|{text_hash}".encode("utf-8")).hexdigest()
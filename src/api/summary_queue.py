@@ -0,0 +1,158 @@
+import asyncio
+import datetime
+import os
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy
+
+from db import database, recordings, recording_assignments, recording_archive, summary_cache
+import archive_store
+from llm_client import LLMClient
+from summary_drafts import PROMPT_VERSION, build_prompt, cache_key, user_transcript
+
+# --- 要約草案の生成キュー (ワーカー側) ---
+# 割当が保存されると recordings.summary_status が pending になる (main.py の save_assign)。
+# ワーカーはそれをまとめて拾い、入居者ごとの要約を作って summary_drafts に書き込む。
+#  - 同じ発話・同じプロンプト版・同じ入居者の要約は summary_cache から返す (LLM を呼ばない)
+#  - キャッシュに無いものだけを LLM の max_batch 件ずつにまとめ、同時実行数を LLM_CONCURRENCY に抑える
+#  - 人が編集した草案 (サーバーが作った文面と一致しないもの) は上書きしない
+#  - 処理中に割当が更新されていたら書き込まずに次の周回でやり直す (キャッシュに残るので無駄にならない)
+
+SUMMARY_BATCH_RECORDINGS = 20
+LLM_CONCURRENCY = int(os.environ.get("KOENO_LLM_CONCURRENCY", "2"))
+SUMMARY_POLL_SECONDS = 10
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC)
+
+
+async def _fetch_pending(limit: int):
+    j = recordings.outerjoin(recording_archive, recording_archive.c.recording_id == recordings.c.recording_id)
+    return await database.fetch_all(
+        sqlalchemy.select(
+            recordings.c.recording_id, recordings.c.assignment_snapshot, recordings.c.transcription_result,
+            recordings.c.summary_drafts, recordings.c.updated_at,
+            recording_archive.c.assignment_snapshot_z, recording_archive.c.transcription_result_z,
+        ).select_from(j)
+        .where(recordings.c.summary_status == "pending")
+        .order_by(recordings.c.updated_at)
+        .limit(limit)
+    )
+
+
+async def _generate_missing(client: LLMClient, requests: Dict[str, Tuple[str, str]]) -> Dict[str, str]:
+    """requests: cache_key → (user_id, 発話)。LLM をまとめて呼び、cache_key → 要約 を返す"""
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    keys = list(requests)
+    chunks = [keys[i:i + client.max_batch] for i in range(0, len(keys), client.max_batch)]
+
+    async def run(chunk: List[str]) -> Dict[str, str]:
+        async with semaphore:
+            summaries = await client.summarize_batch([build_prompt(requests[k][1]) for k in chunk])
+        return dict(zip(chunk, summaries))
+
+    results: Dict[str, str] = {}
+    for part in await asyncio.gather(*(run(c) for c in chunks)):
+        results.update(part)
+    if results:
+        now = _now()
+        rows = [{"cache_key": k, "user_id": requests[k][0], "prompt_version": PROMPT_VERSION, "model_id": client.model_id, "summary_text": v, "created_at": now} for k, v in results.items()]
+        await database.execute_many(summary_cache.insert().prefix_with("OR IGNORE"), rows)
+    return results
+
+
+async def process_pending_summaries(client: LLMClient, limit: int = SUMMARY_BATCH_RECORDINGS) -> int:
+    """pending の録音を最大 limit 件処理し、草案を書き込んだ件数を返す"""
+    rows = await _fetch_pending(limit)
+    if not rows:
+        return 0
+    ids = [r.recording_id for r in rows]
+    assigned: Dict[int, List[str]] = {}
+    for a in await database.fetch_all(sqlalchemy.select(recording_assignments.c.recording_id, recording_assignments.c.user_id).where(recording_assignments.c.recording_id.in_(ids))):
+        assigned.setdefault(a.recording_id, []).append(a.user_id)
+
+    # 1. 録音 × 入居者ごとのキャッシュキー
+    wanted: Dict[int, Dict[str, str]] = {}        # recording_id → {user_id: cache_key}
+    requests: Dict[str, Tuple[str, str]] = {}     # cache_key → (user_id, 発話)
+    for r in rows:
+        snapshot = r.assignment_snapshot
+        if snapshot is None and r.assignment_snapshot_z is not None:
+            snapshot = archive_store.decompress_json(r.assignment_snapshot_z)
+        transcription = r.transcription_result
+        if not snapshot and transcription is None and r.transcription_result_z is not None:
+            transcription = archive_store.decompress_json(r.transcription_result_z)
+        wanted[r.recording_id] = {}
+        for user_id in assigned.get(r.recording_id, []):
+            text = user_transcript(snapshot or transcription, user_id)
+            if not text.strip():
+                continue
+            key = cache_key(text, user_id, client.model_id)
+            wanted[r.recording_id][user_id] = key
+            requests[key] = (user_id, text)
+
+    # 2. キャッシュを引き、無いものだけ生成
+    summaries: Dict[str, str] = {}
+    if requests:
+        cached = await database.fetch_all(sqlalchemy.select(summary_cache.c.cache_key, summary_cache.c.summary_text).where(summary_cache.c.cache_key.in_(list(requests))))
+        summaries = {c.cache_key: c.summary_text for c in cached}
+        missing = {k: v for k, v in requests.items() if k not in summaries}
+        if missing:
+            print(f"要約: {len(missing)} 件を生成します (キャッシュ命中 {len(summaries)} 件)")
+            summaries.update(await _generate_missing(client, missing))
+
+    # 3. 録音ごとに書き戻す (割当が変わっていなければ)
+    written = 0
+    for r in rows:
+        if await _write_drafts(r, wanted[r.recording_id], summaries):
+            written += 1
+    return written
+
+
+async def _server_generated(user_id: str, text: str) -> bool:
+    row = await database.fetch_one(sqlalchemy.select(summary_cache.c.cache_key).where((summary_cache.c.user_id == user_id) & (summary_cache.c.summary_text == text)).limit(1))
+    return row is not None
+
+
+async def _write_drafts(row, wanted: Dict[str, str], summaries: Dict[str, str]) -> bool:
+    drafts = dict(row.summary_drafts or {})
+    for user_id, key in wanted.items():
+        new_text = summaries.get(key)
+        if new_text is None or drafts.get(user_id) == new_text:
+            continue
+        current = drafts.get(user_id)
+        if current and not await _server_generated(user_id, current):
+            continue  # 人が編集した草案は残す
+        drafts[user_id] = new_text
+    async with database.transaction():
+        # 読んだ後に割当が保存されていたら書かない (pending のまま次の周回へ)
+        await database.execute(
+            recordings.update()
+            .where((recordings.c.recording_id == row.recording_id) & (recordings.c.updated_at == row.updated_at) & (recordings.c.summary_status == "pending"))
+            .values(summary_drafts=drafts, summary_status="ready", updated_at=_now())
+        )
+        status = await database.fetch_val(sqlalchemy.select(recordings.c.summary_status).where(recordings.c.recording_id == row.recording_id))
+    return status == "ready"
+
+
+async def summary_loop(client: LLMClient, poll_seconds: int = SUMMARY_POLL_SECONDS):
+    """ワーカーの文字起こしループと並行して回す"""
+    print(f"要約ワーカー: 起動 (モデル: {client.model_id}, 同時実行 {LLM_CONCURRENCY})")
+    while True:
+        try:
+            written = await process_pending_summaries(client)
+            if written:
+                print(f"要約: {written} 件の録音に草案を書き込みました。")
+                continue
+        except Exception as e:
+            print(f"要約ワーカー: エラーが発生しました (次の周回で再試行します): {e}")
+        await asyncio.sleep(poll_seconds)
+
+
+async def mark_pending(recording_id: int, now: Optional[datetime.datetime] = None) -> None:
+    """割当済みの録音の要約を作り直す (再文字起こし後など)"""
+    has_assignment = sqlalchemy.exists().where(recording_assignments.c.recording_id == recordings.c.recording_id)
+    await database.execute(
+        recordings.update().where((recordings.c.recording_id == recording_id) & has_assignment)
+        .values(summary_status="pending", updated_at=now or _now())
+    )
@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+# (API のモジュールは src/api 直下にあり、パッケージではない。py .\main.py と同じく直下を import パスに入れる)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """DB (./koeno_app.db) とアップロード先 (uploads) は作業ディレクトリからの相対パスなので、テストごとに空のディレクトリで動かす"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def engine():
+    """作業ディレクトリの DB への同期接続 (テストの準備・確認用。API とは別の接続)"""
+    import migrations
+
+    engine = migrations.make_engine()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+async def db():
+    """最新版まで上げた空の DB に databases で接続する (job_queue などを直接呼ぶテスト用)"""
+    import migrations
+    from db import database
+
+    migrations.upgrade()
+    await database.connect()
+    try:
+        yield database
+    finally:
+        await database.disconnect()
+
+
+@pytest.fixture
+def client():
+    """起動処理 (マイグレーション・DB 接続) を含めて API を動かす"""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    # (順番待ちの見積もりの使い回しはプロセス内に残るので、前のテストの DB の分を捨てる)
+    main._queue_positions.update(value=None, loaded_at=0.0)
+    with TestClient(main.app) as c:
+        yield c
+
+
+def upload(client, caregiver_id: str, memo: str = "メモ") -> int:
+    r = client.post(
+        "/upload_recording",
+        files={"audio_blob": ("rec.webm", b"\x1a\x45\xdf\xa3" + b"\0" * 2048)},
+        data={"caregiver_id": caregiver_id, "memo_text": memo, "created_at_iso": "2026-10-19T10:00:00+09:00"},
+    )
+    assert r.status_code == 200, r.text
+    return r.json()["recording_id"]
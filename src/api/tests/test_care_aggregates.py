@@ -0,0 +1,100 @@
+import datetime
+from collections import Counter
+
+import sqlalchemy
+
+import care_aggregates
+import migrations
+from db import care_events, care_touch_daily
+
+MEAL = {"category": "食事", "tags": ["完食", "水分"], "conditions": ["拒否あり"], "place": "食堂"}
+
+
+def test_event_counts():
+    counts = care_aggregates.event_counts("u1", "2026-10-19T01:00:00Z", "care_touch", MEAL)
+    base = ("u1", "2026-10-19", "care_touch", "食事")
+    assert counts == Counter({
+        base + ("event", ""): 1,
+        base + ("tag", "完食"): 1,
+        base + ("tag", "水分"): 1,
+        base + ("condition", "拒否あり"): 1,
+        base + ("place", "食堂"): 1,
+    })
+
+
+def test_event_counts_use_the_jst_date():
+    # UTC 15:00 は JST の翌日 0:00
+    utc = datetime.datetime(2026, 10, 19, 15, 0)
+    [key] = care_aggregates.event_counts("u1", utc, None, None)
+    assert key == ("u1", "2026-10-20", "care_touch", "", "event", "")
+    assert care_aggregates.jst_date(datetime.datetime(2026, 10, 19, 14, 59, 59, tzinfo=datetime.timezone.utc)) == "2026-10-19"
+
+
+def test_event_counts_ignore_rows_without_user_or_time():
+    assert care_aggregates.event_counts("", "2026-10-19T01:00:00Z", None, MEAL) == Counter()
+    assert care_aggregates.event_counts("u1", None, None, MEAL) == Counter()
+
+
+def test_event_delta():
+    old = care_aggregates.event_counts("u1", "2026-10-19T01:00:00Z", "care_touch", MEAL)
+    new = care_aggregates.event_counts("u1", "2026-10-19T01:00:00Z", "care_touch", {**MEAL, "tags": ["完食", "半量"], "place": None})
+    base = ("u1", "2026-10-19", "care_touch", "食事")
+    # (変わらない項目は含めない)
+    assert care_aggregates.event_delta(old, new) == {base + ("tag", "水分"): -1, base + ("tag", "半量"): 1, base + ("place", "食堂"): -1}
+    assert care_aggregates.event_delta(old, old) == {}
+    assert care_aggregates.event_delta(None, new) == dict(new)
+    assert care_aggregates.event_delta(old, None) == {k: -v for k, v in old.items()}
+
+
+def test_moving_an_event_to_another_day_moves_its_counts():
+    old = care_aggregates.event_counts("u1", "2026-10-19T01:00:00Z", "care_touch", MEAL)
+    new = care_aggregates.event_counts("u1", "2026-10-20T01:00:00Z", "care_touch", MEAL)
+    delta = care_aggregates.event_delta(old, new)
+    assert sum(delta.values()) == 0
+    assert {k[1] for k, v in delta.items() if v < 0} == {"2026-10-19"}
+    assert {k[1] for k, v in delta.items() if v > 0} == {"2026-10-20"}
+
+
+def daily_table(engine) -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(sqlalchemy.select(care_touch_daily)).all()
+    return {(r.user_id, r.record_date, r.event_type, r.category, r.item_kind, r.item): r.total for r in rows}
+
+
+def recount(engine) -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(sqlalchemy.select(care_events.c.user_id, care_events.c.event_timestamp, care_events.c.event_type, care_events.c.care_touch_data)).all()
+    counts = Counter()
+    for r in rows:
+        counts.update(care_aggregates.event_counts(r.user_id, r.event_timestamp, r.event_type, r.care_touch_data))
+    return dict(counts)
+
+
+def test_save_update_delete_keep_the_daily_table_equal_to_a_recount(client, engine):
+    headers = {"X-Caller-ID": "cg1"}
+
+    def save(body):
+        r = client.post("/save_event", json={"event_type": "care_touch", **body}, headers=headers)
+        assert r.status_code == 201, r.text
+        return r.json()["event_id"]
+
+    a = save({"user_id": "u1", "event_timestamp": "2026-10-19T08:00:00+09:00", "care_touch_data": MEAL})
+    b = save({"user_id": "u1", "event_timestamp": "2026-10-19T12:00:00+09:00", "care_touch_data": MEAL})
+    c = save({"user_id": "u2", "event_timestamp": "2026-10-19T23:30:00+09:00", "care_touch_data": {"category": "排泄", "tags": ["排尿"]}})
+    assert daily_table(engine) == recount(engine)
+
+    # 内容・日付・入居者の変更
+    save({"event_id": a, "user_id": "u1", "event_timestamp": "2026-10-19T08:00:00+09:00", "care_touch_data": {**MEAL, "tags": ["半量"]}})
+    save({"event_id": b, "user_id": "u1", "event_timestamp": "2026-10-20T00:30:00+09:00", "care_touch_data": MEAL})
+    save({"event_id": c, "user_id": "u1", "event_timestamp": "2026-10-19T23:30:00+09:00", "care_touch_data": {"category": "排泄", "tags": ["排尿"]}})
+    assert daily_table(engine) == recount(engine)
+
+    assert client.delete(f"/care_events/{b}", headers=headers).status_code == 204
+    assert daily_table(engine) == recount(engine)
+    # (件数が 0 になった行は残さない)
+    assert all(total > 0 for total in daily_table(engine).values())
+    assert not any(key[0] == "u2" for key in daily_table(engine))
+
+    # 作り直しても同じ集計になる
+    migrations.rebuild_care_touch_daily(engine)
+    assert daily_table(engine) == recount(engine)
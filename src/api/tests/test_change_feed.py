@@ -0,0 +1,75 @@
+import pytest
+import sqlalchemy
+
+from conftest import upload
+from db import caregivers, recording_assignments, recordings, sync_changes
+
+
+@pytest.fixture
+def two_caregivers(client, engine):
+    with engine.begin() as conn:
+        conn.execute(caregivers.insert(), [{"caregiver_id": "cg1", "name": "一"}, {"caregiver_id": "cg2", "name": "二"}])
+
+
+def changes(client, caller: str, cursor: int = 0):
+    r = client.get("/sync/changes", params={"cursor": cursor}, headers={"X-Caller-ID": caller})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def owned(feed):
+    return {(c["entity"], c["id"], c["deleted"]) for c in feed["changes"] if c["entity"] in ("recordings", "assignments")}
+
+
+def assign(client, caller: str, rid: int, user_ids):
+    r = client.post("/save_assignments", json={"recording_id": rid, "user_ids": user_ids, "assignment_snapshot": [], "summary_drafts": {}}, headers={"X-Caller-ID": caller})
+    assert r.status_code == 201, r.text
+
+
+def delete_recording(engine, rid: int):
+    # (録音を消す API は無い。運用での削除と同じく DB から直接消し、トリガーが墓標を残すことを確かめる)
+    with engine.begin() as conn:
+        conn.execute(recording_assignments.delete().where(recording_assignments.c.recording_id == rid))
+        conn.execute(recordings.delete().where(recordings.c.recording_id == rid))
+
+
+def test_recordings_and_assignments_are_returned_only_to_their_owner(client, two_caregivers):
+    mine = upload(client, "cg1")
+    theirs = upload(client, "cg2")
+    assign(client, "cg1", mine, ["u1"])
+    assign(client, "cg2", theirs, ["u2"])
+
+    assert owned(changes(client, "cg1")) == {("recordings", mine, False), ("assignments", mine, False)}
+    assert owned(changes(client, "cg2")) == {("recordings", theirs, False), ("assignments", theirs, False)}
+
+
+def test_tombstones_are_returned_only_to_the_owner(client, engine, two_caregivers):
+    mine = upload(client, "cg1")
+    theirs = upload(client, "cg2")
+    assign(client, "cg2", theirs, ["u2"])
+    cursors = {cid: changes(client, cid)["cursor"] for cid in ("cg1", "cg2")}
+
+    delete_recording(engine, theirs)
+
+    feed = changes(client, "cg1", cursors["cg1"])
+    assert owned(feed) == set()
+    # (読み飛ばした墓標の分もカーソルは進む)
+    assert feed["cursor"] > cursors["cg1"]
+    assert owned(changes(client, "cg2", cursors["cg2"])) == {("recordings", theirs, True), ("assignments", theirs, True)}
+    # 初回の全件取得でも他の人の墓標は返さない
+    assert owned(changes(client, "cg1")) == {("recordings", mine, False)}
+
+
+def test_tombstones_without_a_known_owner_are_not_returned(client, engine, two_caregivers):
+    with engine.begin() as conn:
+        conn.execute(sync_changes.insert().values(entity="recordings", entity_key=999, deleted=1, changed_at=sqlalchemy.func.current_timestamp(), caregiver_id=None))
+    for cid in ("cg1", "cg2"):
+        assert owned(changes(client, cid)) == set()
+
+
+def test_trigger_records_the_owner(client, engine, two_caregivers):
+    rid = upload(client, "cg2")
+    assign(client, "cg2", rid, ["u1"])
+    with engine.connect() as conn:
+        rows = conn.execute(sqlalchemy.select(sync_changes.c.entity, sync_changes.c.caregiver_id).where(sync_changes.c.entity_key == rid)).all()
+    assert {(r.entity, r.caregiver_id) for r in rows} == {("recordings", "cg2"), ("assignments", "cg2")}
@@ -0,0 +1,78 @@
+from conftest import upload
+
+CARE_TOUCH = {"category": "食事", "tags": ["完食"], "place": "食堂"}
+
+
+def save_event(client, event_timestamp: str, event_id=None, data=CARE_TOUCH) -> int:
+    body = {"user_id": "u1", "event_timestamp": event_timestamp, "care_touch_data": data}
+    if event_id is not None:
+        body["event_id"] = event_id
+    r = client.post("/save_event", json=body, headers={"X-Caller-ID": "cg1"})
+    assert r.status_code == 201, r.text
+    return r.json()["event_id"]
+
+
+def test_transcription_returns_304_until_the_recording_changes(client):
+    rid = upload(client, "cg1")
+    headers = {"X-Caller-ID": "cg1"}
+
+    first = client.get(f"/recording_transcription/{rid}", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.json()["queue_position"] == 1
+
+    again = client.get(f"/recording_transcription/{rid}", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+
+    r = client.post("/save_assignments", json={"recording_id": rid, "user_ids": ["u1"], "assignment_snapshot": [{"id": "s0", "text": "こんにちは"}], "summary_drafts": {}}, headers=headers)
+    assert r.status_code == 201
+    changed = client.get(f"/recording_transcription/{rid}", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["assignment_version"] == first.json()["assignment_version"] + 1
+
+
+def test_transcription_validators_do_not_bypass_the_owner_check(client):
+    rid = upload(client, "cg1")
+    etag = client.get(f"/recording_transcription/{rid}", headers={"X-Caller-ID": "cg1"}).headers["ETag"]
+    r = client.get(f"/recording_transcription/{rid}", headers={"X-Caller-ID": "cg2", "If-None-Match": etag})
+    assert r.status_code == 403
+
+
+def test_daily_events_conditional_get(client):
+    event_id = save_event(client, "2026-10-19T10:00:00+09:00")
+    params = {"user_id": "u1", "date": "2026-10-19"}
+
+    first = client.get("/daily_events", params=params)
+    assert first.status_code == 200
+    assert [e["event_id"] for e in first.json()] == [event_id]
+    etag, last_modified = first.headers["ETag"], first.headers["Last-Modified"]
+
+    assert client.get("/daily_events", params=params, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/daily_events", params=params, headers={"If-Modified-Since": last_modified}).status_code == 304
+    # (If-None-Match があれば If-Modified-Since は見ない)
+    assert client.get("/daily_events", params=params, headers={"If-None-Match": 'W/"other"', "If-Modified-Since": last_modified}).status_code == 200
+
+    save_event(client, "2026-10-19T11:00:00+09:00", event_id=event_id, data={**CARE_TOUCH, "tags": ["半量"]})
+    changed = client.get("/daily_events", params=params, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+    # 別の日のイベントは、この日の版を変えない
+    etag = changed.headers["ETag"]
+    save_event(client, "2026-10-20T10:00:00+09:00")
+    assert client.get("/daily_events", params=params, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_daily_events_change_when_an_event_is_deleted(client):
+    keep = save_event(client, "2026-10-19T09:00:00+09:00")
+    gone = save_event(client, "2026-10-19T10:00:00+09:00")
+    params = {"user_id": "u1", "date": "2026-10-19"}
+    etag = client.get("/daily_events", params=params).headers["ETag"]
+
+    assert client.delete(f"/care_events/{gone}", headers={"X-Caller-ID": "cg1"}).status_code == 204
+    r = client.get("/daily_events", params=params, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert [e["event_id"] for e in r.json()] == [keep]
@@ -0,0 +1,112 @@
+import asyncio
+import datetime
+
+import pytest
+import sqlalchemy
+
+import job_queue
+from db import recordings
+
+pytestmark = pytest.mark.anyio
+
+
+async def add_pending(database, count: int, caregiver_id: str = "cg1") -> list:
+    now = datetime.datetime.now(datetime.UTC)
+    ids = []
+    for i in range(count):
+        ids.append(await database.execute(recordings.insert().values(
+            caregiver_id=caregiver_id, audio_file_path=f"rec_{i}.webm", memo_text="", ai_status="pending",
+            created_at=now, updated_at=now, queued_at=now, audio_duration=5.0 + i,
+        )))
+    return ids
+
+
+async def fetch(database, record_id: int):
+    return await database.fetch_one(recordings.select().where(recordings.c.recording_id == record_id))
+
+
+async def expire_lease(database, record_id: int):
+    past = datetime.datetime.now(datetime.UTC) - datetime.timedelta(seconds=1)
+    await database.execute(recordings.update().where(recordings.c.recording_id == record_id).values(lease_expires_at=past))
+
+
+async def test_concurrent_claims_lease_each_recording_once(db):
+    ids = await add_pending(db, 5)
+    # (タスクごとに別の接続になるので、取得が実際に並行して DB とぶつかる)
+    claimed = await asyncio.gather(*[job_queue.claim_job(f"worker-{i}") for i in range(8)])
+    got = [job for job in claimed if job is not None]
+
+    assert sorted(job.recording_id for job in got) == sorted(ids)
+    for job in got:
+        row = await fetch(db, job.recording_id)
+        assert row.ai_status == "processing"
+        assert row.lease_owner == job.lease_owner
+        assert row.attempts == 1
+    assert await job_queue.claim_job("worker-late") is None
+
+
+async def test_complete_and_heartbeat_require_the_lease(db):
+    [rid] = await add_pending(db, 1)
+    job = await job_queue.claim_job("w1")
+
+    assert not await job_queue.heartbeat(rid, "w2")
+    assert not await job_queue.complete_job(rid, "w2", {"segments": []})
+    assert (await fetch(db, rid)).ai_status == "processing"
+
+    assert await job_queue.heartbeat(rid, "w1")
+    assert await job_queue.complete_job(job.recording_id, "w1", {"segments": []}, audio_duration=5.0, processing_seconds=1.0)
+    row = await fetch(db, rid)
+    assert row.ai_status == "completed"
+    assert row.lease_owner is None
+    assert not await job_queue.heartbeat(rid, "w1")
+
+
+async def test_expired_lease_is_reclaimed_and_the_old_owner_cannot_write(db):
+    [rid] = await add_pending(db, 1)
+    await job_queue.claim_job("w1")
+    await expire_lease(db, rid)
+
+    job = await job_queue.claim_job("w2")
+    assert job.recording_id == rid
+    assert job.attempts == 2
+
+    assert not await job_queue.complete_job(rid, "w1", {"segments": []})
+    assert await job_queue.fail_job(rid, "w1", "遅れて戻った") is None
+    row = await fetch(db, rid)
+    assert (row.ai_status, row.lease_owner) == ("processing", "w2")
+
+    assert await job_queue.fail_job(rid, "w2", "一時的な失敗") == "pending"
+    row = await fetch(db, rid)
+    assert row.lease_owner is None
+    assert row.next_attempt_at is not None
+    # (バックオフ中は取得しない)
+    assert await job_queue.claim_job("w3") is None
+
+
+async def test_complete_and_fail_race_has_one_winner(db):
+    ids = await add_pending(db, 4)
+    for _ in ids:
+        await job_queue.claim_job("w1")
+
+    for rid in ids:
+        completed, status = await asyncio.gather(
+            job_queue.complete_job(rid, "w1", {"segments": []}),
+            job_queue.fail_job(rid, "w1", "同時の失敗"),
+        )
+        assert completed != (status is not None)
+        row = await fetch(db, rid)
+        assert row.ai_status == ("completed" if completed else status)
+        assert row.lease_owner is None
+
+
+async def test_fail_without_retry_budget_marks_failed(db, monkeypatch):
+    monkeypatch.setattr(job_queue, "MAX_ATTEMPTS", 1)
+    [rid] = await add_pending(db, 1)
+    await job_queue.claim_job("w1")
+    assert await job_queue.fail_job(rid, "w1", "失敗") == "failed"
+
+    await db.execute(recordings.update().where(recordings.c.recording_id == rid).values(ai_status="processing", lease_owner="w1"))
+    await expire_lease(db, rid)
+    assert await job_queue.expire_exhausted() == [rid]
+    assert (await fetch(db, rid)).ai_status == "failed"
+    assert await db.fetch_val(sqlalchemy.select(sqlalchemy.func.count()).select_from(recordings).where(recordings.c.lease_owner.isnot(None))) == 0
@@ -0,0 +1,102 @@
+import datetime
+
+import pytest
+import sqlalchemy
+
+import migrations
+from db import care_touch_daily, recordings, sync_changes
+
+# migrate_db_v3.py 導入前 (v2) の koeno_app.db のテーブル (schema_version は無い)
+LEGACY_V2_DDL = [
+    "CREATE TABLE caregivers (caregiver_id VARCHAR PRIMARY KEY, name VARCHAR, created_at DATETIME)",
+    "CREATE TABLE administrators (admin_id INTEGER PRIMARY KEY AUTOINCREMENT, caregiver_id VARCHAR UNIQUE REFERENCES caregivers (caregiver_id), role VARCHAR, granted_at DATETIME)",
+    "CREATE TABLE recordings (recording_id INTEGER PRIMARY KEY AUTOINCREMENT, caregiver_id VARCHAR, audio_file_path VARCHAR, memo_text TEXT, "
+    "ai_status VARCHAR, transcription_result JSON, assignment_snapshot JSON, created_at DATETIME)",
+    "CREATE TABLE care_records (care_record_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id VARCHAR, record_date VARCHAR, final_text TEXT, last_updated_by VARCHAR, updated_at DATETIME)",
+    "CREATE TABLE recording_assignments (assignment_id INTEGER PRIMARY KEY AUTOINCREMENT, recording_id INTEGER REFERENCES recordings (recording_id), "
+    "user_id VARCHAR, assigned_at DATETIME, assigned_by VARCHAR)",
+]
+
+CREATED_AT = "2024-05-01 01:00:00.000000"
+
+
+@pytest.fixture
+def legacy_db(engine):
+    with engine.begin() as conn:
+        for ddl in LEGACY_V2_DDL:
+            conn.exec_driver_sql(ddl)
+        conn.exec_driver_sql("INSERT INTO caregivers (caregiver_id, name, created_at) VALUES ('cg1', '一', ?), ('cg2', '二', ?)", (CREATED_AT, CREATED_AT))
+        conn.exec_driver_sql(
+            "INSERT INTO recordings (caregiver_id, audio_file_path, memo_text, ai_status, transcription_result, created_at) VALUES "
+            "('cg1', 'a.webm', '', 'completed', '{\"segments\": []}', ?), ('cg2', 'b.webm', '', 'pending', NULL, ?)",
+            (CREATED_AT, CREATED_AT),
+        )
+        conn.exec_driver_sql("INSERT INTO recording_assignments (recording_id, user_id, assigned_at, assigned_by) VALUES (1, 'u1', ?, 'cg1')", (CREATED_AT,))
+        conn.exec_driver_sql("INSERT INTO care_records (user_id, record_date, final_text, last_updated_by, updated_at) VALUES ('u1', '2024-05-01', '日報', 'cg1', ?)", (CREATED_AT,))
+    return engine
+
+
+def scalar(engine, sql: str):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(sql).scalar()
+
+
+def test_fresh_database_is_created_at_the_latest_version(engine):
+    assert migrations.upgrade(engine) == migrations.latest_version()
+    assert migrations.current_version(engine) == migrations.latest_version()
+    # (2回目は schema_version を読むだけ)
+    assert migrations.upgrade(engine) == migrations.latest_version()
+    assert scalar(engine, "SELECT COUNT(*) FROM schema_version") == 1
+
+
+def test_legacy_baseline_is_upgraded_to_the_latest_version(legacy_db):
+    engine = legacy_db
+    assert migrations.current_version(engine) is None
+
+    # 途中の版 (集計表の作成前) で止めて、その間に記録されたケアイベントを後の版が集計することも確かめる
+    assert migrations.upgrade(engine, target=10) == 10
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO care_events (user_id, event_timestamp, event_type, care_touch_data, recorded_by, created_at) VALUES "
+            "('u1', '2024-05-01 16:00:00.000000', 'care_touch', '{\"category\": \"食事\", \"tags\": [\"完食\"]}', 'cg1', ?)",
+            (CREATED_AT,),
+        )
+
+    assert migrations.upgrade(engine) == migrations.latest_version()
+    assert migrations.current_version(engine) == migrations.latest_version()
+    with engine.connect() as conn:
+        applied = conn.exec_driver_sql("SELECT version FROM schema_version ORDER BY version").scalars().all()
+    assert applied == list(range(3, migrations.latest_version() + 1))
+
+    # 追加したカラムと埋め戻し
+    assert scalar(engine, "SELECT COUNT(*) FROM caregivers WHERE qr_token IS NULL OR qr_token = ''") == 0
+    assert scalar(engine, "SELECT COUNT(*) FROM recordings WHERE updated_at IS NULL OR updated_at != created_at") == 0
+    assert scalar(engine, "SELECT COUNT(*) FROM recordings WHERE assignment_version IS NULL") == 0
+
+    # ケアイベントの日別集計 (UTC 16:00 は JST の翌日)
+    with engine.connect() as conn:
+        daily = {(r.record_date, r.item_kind, r.item): r.total for r in conn.execute(sqlalchemy.select(care_touch_daily))}
+    assert daily == {("2024-05-02", "event", ""): 1, ("2024-05-02", "tag", "完食"): 1}
+
+    # 既存の行の変更フィードへの記録と持ち主
+    with engine.connect() as conn:
+        log = {(r.entity, r.entity_key): r.caregiver_id for r in conn.execute(sqlalchemy.select(sync_changes))}
+    assert log[("recordings", 1)] == "cg1"
+    assert log[("recordings", 2)] == "cg2"
+    assert log[("assignments", 1)] == "cg1"
+    assert log[("care_records", 1)] is None
+
+
+def test_triggers_work_after_upgrading_a_legacy_database(legacy_db):
+    engine = legacy_db
+    migrations.upgrade(engine)
+    now = datetime.datetime.now(datetime.UTC)
+    with engine.begin() as conn:
+        conn.execute(recordings.update().where(recordings.c.recording_id == 2).values(ai_status="completed", updated_at=now))
+        conn.exec_driver_sql("DELETE FROM recording_assignments WHERE recording_id = 1")
+        conn.exec_driver_sql("DELETE FROM recordings WHERE recording_id = 1")
+    with engine.connect() as conn:
+        log = {(r.entity, r.entity_key): (r.deleted, r.caregiver_id) for r in conn.execute(sqlalchemy.select(sync_changes))}
+    assert log[("recordings", 2)] == (False, "cg2")
+    assert log[("recordings", 1)] == (True, "cg1")
+    assert log[("assignments", 1)] == (True, "cg1")
@@ -0,0 +1,40 @@
+from typing import Any, Dict, Optional
+
+# --- 文字起こしの処理段階 (速い / 高精度) ---
+# アップロードされた録音はすべて「速い」段階で処理する: 小さい Whisper モデル + 貪欲デコード (温度 0 のみ)。
+# 確認する人が録音を指定して高精度を求めた場合だけ (POST /recordings/{id}/upgrade_transcription)、
+# 「高精度」段階で処理し直す: 大きいモデル + ビームサーチ + 温度フォールバック (Whisper の既定の再デコード)。
+#   - 録音の段階は recordings.transcription_tier (None は速い)。ワーカーは取得した録音の段階でモデルと設定を選ぶ
+#   - 高精度の依頼は recordings.priority を上げて待ち行列の先頭側に入れ直す (job_scheduler.py)
+#   - 高精度のモデルは最初に必要になったときに読み込む (速い段階だけのワーカーはメモリを使わない)
+# モデルは model_artifacts.MODEL_SOURCES の whisper (速い) / whisper_accurate (高精度) で、環境変数で差し替えられる。
+
+FAST = "fast"
+ACCURATE = "accurate"
+
+UPGRADE_PRIORITY = 1   # 高精度の依頼 (通常の録音は 0)
+
+# 段階ごとの Whisper のモデル (model_artifacts の名前)
+MODEL_NAMES = {
+    FAST: "whisper",
+    ACCURATE: "whisper_accurate",
+}
+
+# 段階ごとの transcribe() の設定
+DECODE_OPTIONS: Dict[str, Dict[str, Any]] = {
+    # 貪欲デコード。温度を1つだけにし、圧縮率・確信度が悪くても再デコードしない
+    FAST: {"temperature": 0.0, "beam_size": None, "best_of": None},
+    # ビームサーチ。結果が繰り返し・低確信度なら温度を上げてサンプリングで再デコードする
+    ACCURATE: {"temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0), "beam_size": 5, "best_of": 5},
+}
+
+LANGUAGE = "ja"
+
+
+def normalize(tier: Optional[str]) -> str:
+    """DB の値 (None / 未知の値は速い) を段階に直す"""
+    return tier if tier in DECODE_OPTIONS else FAST
+
+
+def transcribe_options(tier: Optional[str]) -> Dict[str, Any]:
+    return {"language": LANGUAGE, **DECODE_OPTIONS[normalize(tier)]}
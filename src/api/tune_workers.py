@@ -0,0 +1,156 @@
+"""
+[ワーカー配置の自動調整] CPU の分け方 (プロセス数 × 演算内スレッド数 × 演算間スレッド数) の候補を実際の録音で測り、
+一番処理量の多い配置を worker_layout.json に書き出す
+
+  py .\\tune_workers.py [--corpus uploads] [--files 4] [--max-processes 4] [--dry-run]
+
+各候補について、配置どおりに CPU を固定したワーカーを別プロセスで起動し、全プロセスのモデルの読み込みが
+終わってから一斉に同じ録音群 (--corpus から --files 件) を処理させる。
+処理量 = 全プロセスが処理した音声の秒数 / 一番遅いプロセスの所要秒数 (モデルの読み込み時間は含めない)。
+デコード (ffmpeg) も同じ CPU で行うため含めて測る。
+結果は launch_workers.py がワーカーの起動時に使う。CPU やメモリを変えたら再実行すること。
+--dry-run: 測らずに、このマシンの物理コアと候補の配置だけを表示する。
+(候補の数だけモデルを読み込み直すため時間がかかる。model_artifacts の書き出し (prepare_models.py) を先に済ませておくと速い)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import worker_layout
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+AUDIO_EXTENSIONS = (".webm", ".wav", ".m4a", ".mp3", ".ogg", ".mp4", ".aac")
+
+
+def pick_corpus(directory: str, n_files: int):
+    files = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory)
+         if name.lower().endswith(AUDIO_EXTENSIONS) and "_prepared" not in name),
+        key=os.path.getmtime, reverse=True,
+    )
+    return files[:n_files]
+
+
+# --- 測定用の子プロセス ---
+
+async def run_child(layout, slot: int, files):
+    """配置を適用してモデルを読み込み、READY を出してから GO を待って録音群を処理し、結果を JSON で出す"""
+    worker_layout.apply_layout(layout, slot)
+    import run_worker
+    from audio_prepare import prepare_audio
+    from status_bus import set_publisher
+
+    set_publisher(lambda event: None)   # (進捗の通知は不要)
+    run_worker.load_models()
+    # (prepare_audio は音声の隣に変換済みファイルを書くため、プロセスごとに複製して使う)
+    workdir = tempfile.mkdtemp(prefix="koeno_tune_")
+    copies = [shutil.copy(f, workdir) for f in files]
+    print("READY", flush=True)
+    sys.stdin.readline()
+
+    started = time.perf_counter()
+    audio_seconds = 0.0
+    for i, path in enumerate(copies):
+        prepared = prepare_audio(i, path)
+        _, seconds = await run_worker.process_prepared_audio(i, prepared)
+        audio_seconds += seconds
+    elapsed = time.perf_counter() - started
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({"elapsed": elapsed, "audio_seconds": audio_seconds}), flush=True)
+
+
+# --- 親プロセス ---
+
+def measure(layout, files):
+    """配置 layout で全プロセスを同時に走らせ、(処理量 = 音声秒/実時間秒, 所要秒数) を返す"""
+    env = {**os.environ, **worker_layout.thread_env(layout), "PYTHONPATH": HERE + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    procs = []
+    for slot in range(layout["processes"]):
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--child", json.dumps(layout), str(slot), *files],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env, cwd=HERE,
+        ))
+    try:
+        # 全プロセスのモデルの読み込みを待ってから一斉に始める
+        for p in procs:
+            for line in p.stdout:
+                if line.strip() == "READY":
+                    break
+            else:
+                raise RuntimeError("測定用のワーカーがモデルを読み込めませんでした")
+        for p in procs:
+            p.stdin.write("GO\n")
+            p.stdin.flush()
+        results = []
+        for p in procs:
+            out, _ = p.communicate()
+            lines = [l for l in out.strip().splitlines() if l.startswith("{")]
+            if p.returncode != 0 or not lines:
+                raise RuntimeError(f"測定用のワーカーが失敗しました (終了コード {p.returncode})")
+            results.append(json.loads(lines[-1]))
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+    wall = max(r["elapsed"] for r in results)
+    return sum(r["audio_seconds"] for r in results) / wall if wall > 0 else 0.0, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ワーカーの CPU 配置を自動調整する")
+    parser.add_argument("--corpus", default="uploads", help="測定に使う録音のディレクトリ")
+    parser.add_argument("--files", type=int, default=4, help="測定に使う録音の数 (新しいものから)")
+    parser.add_argument("--max-processes", type=int, default=worker_layout.MAX_PROCESSES, help="試すプロセス数の上限 (メモリに合わせる)")
+    parser.add_argument("--dry-run", action="store_true", help="測らずに候補だけを表示する")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        import asyncio
+        asyncio.run(run_child(json.loads(args.child[0]), int(args.child[1]), args.child[2:]))
+        return
+
+    cores = worker_layout.physical_cores()
+    candidates = worker_layout.candidate_layouts(cores, args.max_processes)
+    print(f"--- CPU: 物理コア {len(cores)} / 論理 CPU {sum(len(c) for c in cores)} / 候補 {len(candidates)} 件 ---")
+    if args.dry_run:
+        for c in candidates:
+            print(f"  {c['processes']}プロセス × {c['intra_op_threads']}スレッド (inter-op {c['inter_op_threads']})  CPU {worker_layout.assign_slots(cores, c['processes'])}")
+        return
+
+    files = pick_corpus(args.corpus, args.files) if os.path.isdir(args.corpus) else []
+    if not files:
+        parser.error(f"測定に使う録音がありません: {args.corpus}")
+    print(f"測定に使う録音: {len(files)} 件 ({args.corpus})")
+
+    results = []
+    for c in candidates:
+        layout = worker_layout.make_layout(c, cores)
+        label = f"{c['processes']}プロセス × {c['intra_op_threads']}スレッド (inter-op {c['inter_op_threads']})"
+        try:
+            throughput, wall = measure(layout, files)
+        except Exception as e:
+            print(f"  {label:<36} 失敗: {e}")
+            continue
+        results.append({**c, "throughput": round(throughput, 3), "seconds": round(wall, 1)})
+        print(f"  {label:<36} 処理量 {throughput:6.2f} 音声秒/秒  ({wall:.1f}秒)")
+
+    if not results:
+        print("すべての候補の測定に失敗しました。配置ファイルは更新しません。")
+        sys.exit(1)
+    best = max(results, key=lambda r: r["throughput"])
+    candidate = {k: best[k] for k in ("processes", "intra_op_threads", "inter_op_threads")}
+    layout = worker_layout.make_layout(candidate, cores, throughput=best["throughput"], corpus_files=len(files), results=results)
+    worker_layout.save_layout(layout)
+    print(f"--- 最良: {best['processes']}プロセス × {best['intra_op_threads']}スレッド (inter-op {best['inter_op_threads']}), "
+          f"処理量 {best['throughput']} 音声秒/秒 → {worker_layout.LAYOUT_FILE} ---")
+
+
+if __name__ == "__main__":
+    main()
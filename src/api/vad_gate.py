@@ -0,0 +1,103 @@
+import bisect
+from typing import Any, Dict, List, Tuple
+
+# --- 発話区間の抽出 (VAD ゲート) と時間軸の詰め直し ---
+# ハンズフリー録音は大半が無音・物音のため、重い話者分離・文字起こしの前に
+# pyannote/voice-activity-detection で発話区間だけを取り出し、短い無音を挟んで連結した
+# 「詰めた音声」を作る。モデルの出力 (詰めた時間軸) は to_original() で元の時間軸に戻す。
+# 処理時間が録音の長さではなく発話の長さに比例するようになる。
+
+SPEECH_PAD_SECONDS = 0.2      # 区間の前後に残す余白 (語頭・語尾の欠け防止)
+MERGE_GAP_SECONDS = 0.6       # これより短い無音は区間をつなげる (文中の息継ぎ)
+PACK_GAP_SECONDS = 0.3        # 詰めた音声で区間の間に挟む無音 (Whisper が発話をまたいで繋げないため)
+MIN_SPEECH_SECONDS = 0.5      # 発話の合計がこれ未満なら無音の録音として重い処理を省く
+
+Region = Tuple[float, float]
+
+
+def speech_regions(vad_result: Any, total_seconds: float) -> List[Region]:
+    """VAD の結果 (pyannote Annotation) を、余白を付けて近いものをまとめた (開始, 終了) 秒のリストにする"""
+    raw = [(seg.start, seg.end) for seg in vad_result.get_timeline().support()]
+    return merge_regions(raw, total_seconds)
+
+
+def merge_regions(raw: List[Region], total_seconds: float) -> List[Region]:
+    regions: List[Region] = []
+    for start, end in sorted(raw):
+        # (pydub はミリ秒単位で切り出すため、対応表とずれないよう ms に丸める)
+        start = round(max(start - SPEECH_PAD_SECONDS, 0.0), 3)
+        end = round(min(end + SPEECH_PAD_SECONDS, total_seconds), 3)
+        if end <= start:
+            continue
+        if regions and start - regions[-1][1] <= MERGE_GAP_SECONDS:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def speech_seconds(regions: List[Region]) -> float:
+    return sum(end - start for start, end in regions)
+
+
+class PackedTimeline:
+    """
+    詰めた音声の時間軸と元の時間軸の対応表。
+    区間 i は詰めた音声の packed_starts[i] から始まり、元の regions[i] に対応する。
+    """
+
+    def __init__(self, regions: List[Region], gap: float = PACK_GAP_SECONDS):
+        self.regions = regions
+        self.gap = gap
+        self.packed_starts: List[float] = []
+        t = 0.0
+        for start, end in regions:
+            self.packed_starts.append(t)
+            t += (end - start) + gap
+        self.packed_seconds = max(t - gap, 0.0)
+
+    def to_original(self, t: float, snap_forward: bool = False) -> float:
+        """
+        詰めた時間軸の t 秒を元の時間軸に戻す。
+        挟んだ無音の中は、直前の区間の終わり (snap_forward なら次の区間の始まり) に寄せる。
+        """
+        if not self.regions:
+            return t
+        i = max(bisect.bisect_right(self.packed_starts, t) - 1, 0)
+        start, end = self.regions[i]
+        offset = max(t - self.packed_starts[i], 0.0)
+        if offset > end - start and snap_forward and i + 1 < len(self.regions):
+            return self.regions[i + 1][0]
+        return min(start + offset, end)
+
+    def remap_segments(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """merge_diarization_and_transcription の結果の start / end を元の時間軸に戻す"""
+        for seg in segments:
+            seg["start"] = round(self.to_original(seg["start"], snap_forward=True), 2)
+            seg["end"] = round(max(self.to_original(seg["end"]), seg["start"]), 2)
+        return segments
+
+
+def pack_audio(audio: Any, timeline: PackedTimeline) -> Any:
+    """pydub.AudioSegment から発話区間だけを切り出し、短い無音を挟んで連結する"""
+    import pydub  # (API サーバー側では使わないため遅延インポート)
+
+    gap = pydub.AudioSegment.silent(duration=round(timeline.gap * 1000), frame_rate=audio.frame_rate)
+    packed = None
+    for start, end in timeline.regions:
+        piece = audio[round(start * 1000):round(end * 1000)]
+        packed = piece if packed is None else packed + gap + piece
+    return packed if packed is not None else audio[:0]
+
+
+def pack_samples(samples: Any, timeline: PackedTimeline, sample_rate: int) -> Any:
+    """pack_audio の numpy 版 (長時間録音の窓 (float32) 用)。区間の切り出しは pack_audio と同じくミリ秒単位"""
+    import numpy as np
+
+    gap = np.zeros(int(round(timeline.gap * 1000)) * sample_rate // 1000, dtype=samples.dtype)
+    pieces = []
+    for start, end in timeline.regions:
+        if pieces:
+            pieces.append(gap)
+        pieces.append(samples[round(start * 1000) * sample_rate // 1000:round(end * 1000) * sample_rate // 1000])
+    return np.concatenate(pieces) if pieces else samples[:0]
@@ -0,0 +1,65 @@
+import json
+import os
+from typing import Any, Dict
+
+# --- 波形ピークの事前計算 ---
+# レビュー画面のタイムライン描画用に、音声全体をデコードしなくて済むよう
+# 区間ごとの (最小, 最大) を 8bit に量子化して保存する。
+# 形式は BBC audiowaveform の JSON 形式 (peaks.js などでそのまま読める) に合わせる。
+
+PEAKS_VERSION = 2
+SAMPLES_PER_PEAK = 320  # 16kHz で 50 ピーク/秒 (20ms 単位)
+PEAK_CHUNK = 16384      # 一度に計算するピーク数 (約5分ぶん)
+
+
+def peaks_path_for(audio_file_path: str) -> str:
+    return audio_file_path + ".peaks.json"
+
+
+def compute_peaks(samples: Any, sample_rate: int, samples_per_peak: int = SAMPLES_PER_PEAK) -> Dict[str, Any]:
+    """
+    モノラル 16bit PCM のサンプル列から audiowaveform 形式のピークを作る。
+    data は [min0, max0, min1, max1, ...] (int8 範囲)。
+    """
+    import numpy as np  # (API サーバー側は peaks_path_for だけを使うため遅延インポート)
+
+    pcm = np.asarray(samples, dtype=np.int16)
+    n_peaks = -(-len(pcm) // samples_per_peak) if len(pcm) else 0
+    data = []
+    # (長い録音 (memmap) でも一度に全体をコピーしないよう、PEAK_CHUNK 個ずつ計算する)
+    for first in range(0, n_peaks, PEAK_CHUNK):
+        count = min(PEAK_CHUNK, n_peaks - first)
+        block = pcm[first * samples_per_peak:(first + count) * samples_per_peak]
+        # 端数は 0 で埋めてまとめて min/max を取る
+        padded = np.zeros(count * samples_per_peak, dtype=np.int16)
+        padded[:len(block)] = block
+        frames = padded.reshape(count, samples_per_peak)
+        pairs = np.empty((count, 2), dtype=np.int8)
+        pairs[:, 0] = frames.min(axis=1) >> 8
+        pairs[:, 1] = frames.max(axis=1) >> 8
+        data.extend(pairs.reshape(-1).tolist())
+    return {
+        "version": PEAKS_VERSION,
+        "channels": 1,
+        "sample_rate": sample_rate,
+        "samples_per_pixel": samples_per_peak,
+        "bits": 8,
+        "length": n_peaks,
+        "data": data,
+    }
+
+
+def write_peaks(audio_file_path: str, samples: Any, sample_rate: int) -> str:
+    """ピークを計算して音声ファイルの隣に保存し、保存先パスを返す"""
+    return save_peaks(audio_file_path, compute_peaks(samples, sample_rate))
+
+
+def save_peaks(audio_file_path: str, peaks: Dict[str, Any]) -> str:
+    """計算済みのピーク (別マシンのワーカーから受け取ったものなど) を音声ファイルの隣に保存する"""
+    path = peaks_path_for(audio_file_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(peaks, f, separators=(",", ":"))
+    # 書きかけのファイルを API が配信しないよう、置き換えで公開する
+    os.replace(tmp_path, path)
+    return path
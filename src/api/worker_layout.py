@@ -0,0 +1,143 @@
+import datetime
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+# --- CPU でのワーカーの配置 (プロセス数 × スレッド数 × CPU の割り当て) ---
+# CPU だけのマシンでは「1プロセスで多くのスレッド」か「少ないスレッドのプロセスを複数」かで処理量が大きく変わる。
+# tune_workers.py が候補の配置を実際の録音で測り、一番速かったものを LAYOUT_FILE に書き出す。
+# launch_workers.py はその配置でワーカーを起動し、各ワーカー (run_worker.py) は起動時に apply_layout() で
+#   - 自分の枠 (KOENO_WORKER_SLOT) の CPU に固定する (sched_setaffinity。デコード用の子プロセスも引き継ぐ)
+#   - torch の演算内スレッド数 (intra-op) と演算間スレッド数 (inter-op) を設定する
+# CPU は物理コア単位で割り当てる (同じコアの SMT の兄弟スレッドを別のワーカーに分けない)。
+# 配置ファイルが無い・このマシンの CPU と合わない場合は何もしない (torch の既定のまま)。
+
+LAYOUT_FILE = os.environ.get("KOENO_WORKER_LAYOUT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker_layout.json"))
+SLOT_ENV = "KOENO_WORKER_SLOT"
+MAX_PROCESSES = int(os.environ.get("KOENO_TUNE_MAX_PROCESSES", "4"))   # 1プロセスごとにモデルを読み込むため、メモリで上限を決める
+LAYOUT_VERSION = 1
+
+
+def usable_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def physical_cores(cpus: Optional[List[int]] = None) -> List[List[int]]:
+    """使える論理 CPU を物理コアごとにまとめる ([[0, 4], [1, 5], ...])。トポロジーが読めなければ1論理 CPU = 1コア"""
+    cpus = usable_cpus() if cpus is None else cpus
+    cores: Dict[Any, List[int]] = {}
+    for cpu in cpus:
+        base = f"/sys/devices/system/cpu/cpu{cpu}/topology/"
+        package = _read_int(base + "physical_package_id")
+        core = _read_int(base + "core_id")
+        key = (package, core) if package is not None and core is not None else ("cpu", cpu)
+        cores.setdefault(key, []).append(cpu)
+    # (同じパッケージのコアが連続するように並べる。1ワーカーがなるべくソケットをまたがない)
+    return [sorted(v) for _, v in sorted(cores.items(), key=lambda kv: (str(kv[0][0]), kv[0][1]))]
+
+
+def candidate_layouts(cores: List[List[int]], max_processes: int = MAX_PROCESSES) -> List[Dict[str, int]]:
+    """試す配置の候補: プロセス数 × 演算内スレッド数 (物理コア数 / 論理 CPU 数) × 演算間スレッド数 (1 / 2)"""
+    n_cores = len(cores)
+    n_logical = sum(len(c) for c in cores)
+    candidates = []
+    for processes in range(1, min(n_cores, max_processes) + 1):
+        per_process = n_cores // processes
+        # (コアを割り切れないプロセス数は、余りのコアが遊ぶだけなので 1/2/4… と割り切れるものに絞る)
+        if per_process == 0 or (n_cores % processes and processes != 1):
+            continue
+        for intra in sorted({per_process, max(1, n_logical // processes)}):
+            for inter in (1, 2):
+                candidates.append({"processes": processes, "intra_op_threads": intra, "inter_op_threads": inter})
+    return candidates
+
+
+def assign_slots(cores: List[List[int]], processes: int) -> List[List[int]]:
+    """物理コアを連続した塊でプロセスに割り当て、プロセスごとの論理 CPU のリストを返す"""
+    per_process = max(1, len(cores) // processes)
+    slots = []
+    for i in range(processes):
+        chunk = cores[i * per_process:(i + 1) * per_process] or cores
+        slots.append(sorted(cpu for core in chunk for cpu in core))
+    return slots
+
+
+def make_layout(candidate: Dict[str, int], cores: List[List[int]], **extra: Any) -> Dict[str, Any]:
+    return {
+        "version": LAYOUT_VERSION,
+        "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "cpu": {"logical": sum(len(c) for c in cores), "physical": len(cores)},
+        **candidate,
+        "slots": assign_slots(cores, candidate["processes"]),
+        **extra,
+    }
+
+
+def load_layout(path: str = LAYOUT_FILE) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        layout = json.load(f)
+    if layout.get("version") != LAYOUT_VERSION:
+        return None
+    return layout
+
+
+def save_layout(layout: Dict[str, Any], path: str = LAYOUT_FILE) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(layout, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def thread_env(layout: Dict[str, Any]) -> Dict[str, str]:
+    """(起動する側で設定する) OpenMP / MKL のスレッド数。torch の読み込み前に効かせるため環境変数で渡す"""
+    threads = str(layout["intra_op_threads"])
+    return {"OMP_NUM_THREADS": threads, "MKL_NUM_THREADS": threads}
+
+
+def apply_layout(layout: Dict[str, Any], slot: int) -> Optional[List[int]]:
+    """
+    このプロセスを枠 slot の CPU に固定し、torch のスレッド数を設定する。固定した CPU のリストを返す。
+    (torch のスレッド数はモデルを読み込む前に呼ぶこと。inter-op は並列処理を始めた後は変えられない)
+    """
+    import torch
+
+    cpus = None
+    slots = layout.get("slots") or []
+    if hasattr(os, "sched_setaffinity") and slots:
+        wanted = set(slots[slot % len(slots)])
+        if wanted <= set(usable_cpus()):
+            os.sched_setaffinity(0, wanted)
+            cpus = sorted(wanted)
+        else:
+            print(f"警告: 配置ファイルの CPU {sorted(wanted)} はこのマシンで使えないため、CPU の固定は行いません")
+    torch.set_num_threads(layout["intra_op_threads"])
+    try:
+        torch.set_num_interop_threads(layout["inter_op_threads"])
+    except RuntimeError as e:
+        print(f"警告: 演算間スレッド数を設定できませんでした: {e}")
+    return cpus
+
+
+def apply_configured_layout() -> None:
+    """(run_worker.py の起動時) KOENO_WORKER_SLOT が設定されていれば、配置ファイルのその枠を適用する"""
+    slot = os.environ.get(SLOT_ENV)
+    if slot is None:
+        return
+    layout = load_layout()
+    if layout is None:
+        print(f"警告: 配置ファイル ({LAYOUT_FILE}) が無いため、torch の既定のスレッド数で動かします")
+        return
+    cpus = apply_layout(layout, int(slot))
+    print(f"AIワーカー: 配置 {layout['processes']}プロセス × {layout['intra_op_threads']}スレッド (inter-op {layout['inter_op_threads']}) の枠 {slot}, CPU {cpus or '固定なし'}")
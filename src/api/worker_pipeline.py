@@ -0,0 +1,231 @@
+import asyncio
+import concurrent.futures
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import job_queue
+import transcription_tiers
+from status_bus import publish_status
+
+# --- ワーカーのパイプライン実行 ---
+# 以前は1件ずつ「デコード → 推論 → DB書き込み → 次の取得」を直列に行っていたため、
+# ffmpeg のデコード中や SQLite への書き込み中は重いモデルが遊んでいた。これを3段に分けて重ねる。
+#   取得・デコード … 次の PREFETCH_JOBS 件までリースし、プロセスプールで波形を用意しておく (audio_prepare.py)
+#   推論           … 用意できた順に1件ずつモデルにかける (モデルは1組なので直列)
+#   書き込み       … 結果の書き戻し・通知は別タスクで行い、推論は書き込みを待たずに次の録音へ進む
+# 先読み中の録音もリースを持つため、取得した時点から書き込みが終わるまでハートビートを送る。
+# (先読みは PREFETCH_JOBS 件までなので、複数ワーカーでも録音を抱え込みすぎない)
+# ジョブの取得・延長・完了は jobs (既定は job_queue モジュール = DB 直結) を通す。
+# 別マシンのワーカーは同じ関数を持つ remote_jobs.RemoteJobs (HTTP のジョブ API) を渡す。
+# prepared には取得した録音の文字起こしの段階 ("tier": fast / accurate) を添えて渡す (transcription_tiers.py)。
+
+PREFETCH_JOBS = int(os.environ.get("KOENO_PREFETCH_JOBS", "2"))
+DECODE_PROCESSES = int(os.environ.get("KOENO_DECODE_PROCESSES", "2"))
+IDLE_POLL_SECONDS = 60
+
+# decode(record_id, audio_file_path) → prepared (プロセスプールで実行するため、モジュール直下の関数であること)
+DecodeFn = Callable[[int, str], Dict[str, Any]]
+# infer(record_id, prepared) → (結果, 音声の長さ秒)
+InferFn = Callable[[int, Dict[str, Any]], Awaitable[Tuple[Any, float]]]
+
+
+class PipelineJob:
+    """パイプラインを流れる1件 (リース済みの録音)"""
+
+    def __init__(self, job, decoded: asyncio.Future, heartbeat: asyncio.Task, pool: concurrent.futures.ProcessPoolExecutor):
+        self.job = job
+        self.decoded = decoded
+        # (デコードを投げたプロセスプール。プールが落ちたとき、作り直すのはこのプールが現役の場合だけ)
+        self.pool = pool
+        self.heartbeat = heartbeat
+        self.result: Any = None
+        self.audio_seconds: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self.processing_seconds = 0.0
+
+    @property
+    def record_id(self) -> int:
+        return self.job.recording_id
+
+    def with_tier(self, prepared: Dict[str, Any]) -> Dict[str, Any]:
+        """デコード結果に録音の文字起こしの段階 (transcription_tiers.py) を添える"""
+        return {**prepared, "tier": transcription_tiers.normalize(getattr(self.job, "transcription_tier", None))}
+
+
+async def heartbeat_loop(record_id: int, worker_id: str, jobs: Any = job_queue):
+    """処理中はリースを定期的に延長する (リースを失ったら警告だけ出す。結果の書き込みは complete_job が拒否する)"""
+    while True:
+        await asyncio.sleep(jobs.HEARTBEAT_SECONDS)
+        try:
+            if not await jobs.heartbeat(record_id, worker_id):
+                print(f"警告: ID {record_id} のリースを失いました (他のワーカーが再取得済み)")
+                return
+        except Exception as e:
+            print(f"警告: ID {record_id} のハートビート送信に失敗: {e}")
+
+
+class WorkerPipeline:
+    def __init__(
+        self,
+        worker_id: str,
+        decode: DecodeFn,
+        infer: InferFn,
+        on_completed: Optional[Callable[[int], Awaitable[None]]] = None,
+        prefetch: int = PREFETCH_JOBS,
+        decode_processes: int = DECODE_PROCESSES,
+        jobs: Any = job_queue,
+    ):
+        self.worker_id = worker_id
+        self.jobs = jobs
+        self.decode = decode
+        self.infer = infer
+        self.on_completed = on_completed
+        self.prefetch = max(0, prefetch)
+        self.decode_processes = max(1, decode_processes)
+
+    async def run(self):
+        # 取得済みで推論が終わっていない件数 (推論中の1件 + 先読み) を制限する
+        self.slots = asyncio.Semaphore(self.prefetch + 1)
+        self.ready: asyncio.Queue = asyncio.Queue()
+        self.finished: asyncio.Queue = asyncio.Queue()
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.decode_processes)
+        print(f"AIワーカー: パイプライン開始 (先読み {self.prefetch} 件, デコード {self.decode_processes} プロセス)")
+        tasks = [
+            asyncio.create_task(self._claim_loop()),
+            asyncio.create_task(self._infer_loop()),
+            asyncio.create_task(self._write_loop()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            # (先読み中の録音はリースが切れれば再取得される)
+            while not self.ready.empty():
+                self.ready.get_nowait().heartbeat.cancel()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _claim_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            try:
+                # 1. 試行回数を使い切った期限切れの行を failed にする
+                for record_id in await self.jobs.expire_exhausted():
+                    print(f"DB更新: ID {record_id} は試行回数の上限に達したため failed にしました。")
+                    publish_status(record_id, "failed")
+                # 2. 処理可能なレコードを1件リースする (pending / 期限切れの processing)
+                job = await self.jobs.claim_job(self.worker_id)
+            except Exception as e:
+                # (処理中の行はリースが切れれば他のワーカーか再起動後の自分が再取得する)
+                self.slots.release()
+                print(f"AIワーカー: 取得ループでエラーが発生しました: {e}")
+                print(f"AIワーカー: {IDLE_POLL_SECONDS}秒後にリトライします...")
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+                continue
+            if job is None:
+                # 3. 対象がなければ待機
+                self.slots.release()
+                print(f"AIワーカー: 現在処理対象はありません。{IDLE_POLL_SECONDS}秒後に再検索します... (Ctrl+Cで停止)")
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+                continue
+            # 4. デコードをプロセスプールに投げ、推論段へ渡す (デコードの完了は推論段が待つ)
+            publish_status(job.recording_id, "processing", stage="decoding", progress=0.05)
+            pool = self.pool
+            try:
+                decoded = loop.run_in_executor(pool, self.decode, job.recording_id, job.audio_file_path)
+            except concurrent.futures.process.BrokenProcessPool as e:
+                # (プールが落ちた通知を推論段が受け取る前に投げた。ここで作り直して投げ直す)
+                self._replace_pool(pool, e)
+                pool = self.pool
+                decoded = loop.run_in_executor(pool, self.decode, job.recording_id, job.audio_file_path)
+            heartbeat = asyncio.create_task(heartbeat_loop(job.recording_id, self.worker_id, self.jobs))
+            self.ready.put_nowait(PipelineJob(job, decoded, heartbeat, pool))
+
+    async def _infer_loop(self):
+        while True:
+            item = await self.ready.get()
+            prepared = await self._decoded(item)
+            if prepared is None:
+                self._done(item)
+                continue
+            prepared = item.with_tier(prepared)
+            try:
+                # (処理時間は推論の実時間。デコードは前の録音の推論と重なるため含めない)
+                started = time.monotonic()
+                item.result, item.audio_seconds = await self.infer(item.record_id, prepared)
+                item.processing_seconds = time.monotonic() - started
+            except Exception as e:
+                item.error = e
+            self._done(item)
+
+    async def _decoded(self, item: PipelineJob) -> Optional[Dict[str, Any]]:
+        """デコードの完了を待つ。失敗したら item.error を設定して None"""
+        try:
+            # (shield: パイプライン自体の停止でデコードを取り消さない。取り消されたのがデコードか自分かを区別するため)
+            return await asyncio.shield(item.decoded)
+        except concurrent.futures.process.BrokenProcessPool as e:
+            # デコード用プロセスが落ちた (メモリ不足など)。この録音は再試行に回す
+            item.error = e
+            self._replace_pool(item.pool, e)
+        except asyncio.CancelledError:
+            if not item.decoded.cancelled():
+                raise
+            # デコードが取り消された (プールの停止で未着手のデコードが捨てられた)。この録音は再試行に回す
+            item.error = RuntimeError("デコードが取り消されました (デコード用プロセスプールの停止)")
+        except Exception as e:
+            item.error = e
+        return None
+
+    def _replace_pool(self, broken: concurrent.futures.ProcessPoolExecutor, error: BaseException):
+        """
+        落ちたプールを作り直す。broken が今のプールのときだけ (同じプールに投げていた先読みも続けて失敗するため、作り直すのは最初の1回)
+        ★ 作り直した後のプールには新しいデコードが投げられている。古いプールの失敗が後から届いても止めない (巻き添えで取り消してしまう)
+        """
+        if broken is not self.pool:
+            return
+        print(f"警告: デコード用プロセスプールが停止したため作り直します: {error}")
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.decode_processes)
+
+    def _done(self, item: PipelineJob):
+        self.slots.release()
+        self.finished.put_nowait(item)
+
+    async def _write_loop(self):
+        while True:
+            item = await self.finished.get()
+            try:
+                await self._write(item)
+            except Exception as e:
+                # (書き込めなかった録音はリースが切れれば再処理される)
+                print(f"エラー: ID {item.record_id} の結果の書き込みに失敗しました: {e}")
+            finally:
+                item.heartbeat.cancel()
+                # (ジョブ API から取得した録音は、ダウンロードした音声を消す)
+                release = getattr(self.jobs, "release_job", None)
+                if release:
+                    release(item.job)
+
+    async def _write(self, item: PipelineJob):
+        record_id = item.record_id
+        if item.error is not None:
+            e = item.error
+            retryable = getattr(e, "retryable", True)
+            print(f"エラー: ID {record_id} の処理に失敗 (試行 {item.job.attempts}/{self.jobs.MAX_ATTEMPTS}): {e}")
+            status = await self.jobs.fail_job(record_id, self.worker_id, str(e), retryable=retryable)
+            if status:
+                print(f"DB更新: ID {record_id} を {status} に更新しました。")
+                publish_status(record_id, status)
+            return
+
+        print(f"ID {record_id}: 処理成功。DBに書き戻します。")
+        if await self.jobs.complete_job(record_id, self.worker_id, item.result, audio_duration=item.audio_seconds, processing_seconds=item.processing_seconds):
+            print(f"DB更新: ID {record_id} を completed に更新しました。")
+            # API サーバーの SSE 購読者へ通知 (DB 書き込み後に送る)
+            publish_status(record_id, "completed", progress=1.0)
+            if self.on_completed:
+                await self.on_completed(record_id)
+        else:
+            print(f"警告: ID {record_id} はリース切れのため結果を破棄しました。")
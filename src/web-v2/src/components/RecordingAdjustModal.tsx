@@ -31,11 +31,13 @@ import {
   Check as CheckIcon,
   RestartAlt as ResetIcon,
   WarningAmber as WarningIcon,
-  History as HistoryIcon // ★ 追加
+  History as HistoryIcon, // ★ 追加
+  HighQuality as HighQualityIcon
 } from '@mui/icons-material';
 
 // 共通ユーザーマスタ
 import { USERS_MASTER, type User } from '../data/usersMaster';
+import { diffSnapshot } from '../utils/assignmentDelta';
 
 // --- 型定義 ---
 interface TranscriptionSegment {
@@ -73,6 +75,8 @@ interface TranscriptionResponse {
   ai_status: string;
   transcription_data: TranscriptionSegment[] | TableRowData[] | null;
   summary_drafts: Record<string, string> | null;
+  assignment_version: number;
+  transcription_tier?: string; // fast / accurate
 }
 
 interface Props {
@@ -101,6 +105,12 @@ export const RecordingAdjustModal: React.FC<Props> = ({ open, onClose, recording
   const [saving, setSaving] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
+  // ★ 差分保存用: 読み込んだ時点の割当スナップショットとその版 (まだ割り当てていない録音は null)
+  const [baseRows, setBaseRows] = useState<TableRowData[] | null>(null);
+  const [baseVersion, setBaseVersion] = useState(0);
+  // ★ 文字起こしの段階 (fast: 全件の速い処理 / accurate: 依頼して高精度で処理し直したもの)
+  const [transcriptionTier, setTranscriptionTier] = useState('fast');
+
   const recalculateState = useCallback((rows: TableRowData[]) => {
     const newActiveGroups = new Map<string, AssignmentRow>();
     rows.forEach(row => {
@@ -122,6 +132,7 @@ export const RecordingAdjustModal: React.FC<Props> = ({ open, onClose, recording
       setError(null);
       setTableRows([]);
       setActiveGroups(new Map());
+      setBaseRows(null);
 
       try {
         const response = await fetch(`${API_PATH}/recording_transcription/${recordingId}`, {
@@ -133,6 +144,7 @@ export const RecordingAdjustModal: React.FC<Props> = ({ open, onClose, recording
         }
 
         const data: TranscriptionResponse = await response.json();
+        setTranscriptionTier(data.transcription_tier ?? 'fast');
 
         if (data.ai_status !== 'completed' || !data.transcription_data) {
           setError(`この録音(ID: ${recordingId})は、まだAI処理が完了していません。(ステータス: ${data.ai_status})`);
@@ -141,6 +153,8 @@ export const RecordingAdjustModal: React.FC<Props> = ({ open, onClose, recording
             const loadedRows = data.transcription_data as TableRowData[];
             setTableRows(loadedRows);
             recalculateState(loadedRows);
+            setBaseRows(loadedRows);
+            setBaseVersion(data.assignment_version ?? 0);
           } else {
             const initialTranscriptRows: TranscriptRow[] = (data.transcription_data as TranscriptionSegment[]).map((seg, index) => ({
               ...seg,
@@ -290,6 +304,28 @@ export const RecordingAdjustModal: React.FC<Props> = ({ open, onClose, recording
     const assignedUserIds = Array.from(activeGroups.keys());
 
     try {
+      // ★ 割当済みの録音は変更した行だけを送る (他の端末が先に保存していたら 409)
+      if (baseRows) {
+        const response = await fetch(`${API_PATH}/recordings/${recordingId}/assignments`, {
+          method: 'PATCH',
+          headers: {
+            'Content-Type': 'application/json',
+            'X-Caller-ID': auth.caregiverId,
+          },
+          body: JSON.stringify({
+            base_version: baseVersion,
+            changes: diffSnapshot(baseRows, rowsToSave),
+            user_ids: assignedUserIds,
+          }),
+        });
+        if (response.status === 409) {
+          throw new Error('他の端末でこの録音の割り当てが更新されました。閉じてから開き直してください。');
+        }
+        if (!response.ok) throw new Error(`保存失敗: ${response.status}`);
+        onSaveSuccess();
+        return;
+      }
+
       const response = await fetch(`${API_PATH}/save_assignments`, {
         method: 'POST',
         headers: {
@@ -313,6 +349,28 @@ export const RecordingAdjustModal: React.FC<Props> = ({ open, onClose, recording
     }
   };
 
+  // --- 高精度での再処理の依頼 (割り当て前の録音だけ。処理し終えたら未割り当ての一覧に戻る) ---
+  const handleUpgradeTranscription = async () => {
+    if (!auth.caregiverId || !recordingId) return;
+    setSaving(true);
+    setError(null);
+    try {
+      const response = await fetch(`${API_PATH}/recordings/${recordingId}/upgrade_transcription`, {
+        method: 'POST',
+        headers: { 'X-Caller-ID': auth.caregiverId },
+      });
+      if (response.status === 409) {
+        throw new Error('この録音は処理中か割り当て済みのため、高精度で再処理できません。');
+      }
+      if (!response.ok) throw new Error(`再処理の依頼に失敗: ${response.status}`);
+      onSaveSuccess();
+    } catch (err) {
+      setError(err instanceof Error ? err.message : "再処理の依頼に失敗しました。");
+    } finally {
+      setSaving(false);
+    }
+  };
+
   const hasUnassignedRows = tableRows.some(row => row.type === 'transcript' && row.assignedTo === null);
 
   return (
@@ -345,6 +403,11 @@ export const RecordingAdjustModal: React.FC<Props> = ({ open, onClose, recording
             <Button variant="outlined" color="error" startIcon={<ResetIcon />} onClick={handleClearAllAssignments} disabled={loading || saving} sx={{ ml: 'auto' }}>
               全解除
             </Button>
+            {!isHistoryMode && !baseRows && transcriptionTier !== 'accurate' && (
+              <Button variant="outlined" startIcon={<HighQualityIcon />} onClick={handleUpgradeTranscription} disabled={loading || saving || tableRows.length === 0}>
+                高精度で再処理
+              </Button>
+            )}
           </Stack>
 
           {loading && <CircularProgress sx={{ mb: 2, display: 'block', mx: 'auto' }} />}
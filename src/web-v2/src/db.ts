@@ -17,9 +17,34 @@ export interface LocalRecording {
   created_at: Date;       // ★ JSTの Date オブジェクト
 }
 
+/**
+ * 同期の状態 (key-value)。サービスワーカーと画面の両方から読み書きする
+ * - 'upload_retry_at': サーバーが 503 + Retry-After を返したとき、次にアップロードしてよい時刻 (ms)
+ */
+export interface SyncState {
+  key: string;
+  value: number;
+}
+
+/**
+ * サーバーの変更フィード (GET /sync/changes) で同期した行。data はサーバーの行そのまま
+ * - care_events / care_records / recordings (自分の録音のみ) / assignments (自分の録音ごとの割当入居者と版)
+ */
+export type SyncEntity = 'care_events' | 'care_records' | 'recordings' | 'assignments';
+
+export interface SyncedRow {
+  key: string;              // `${entity}:${id}` (主キー)
+  entity: SyncEntity;
+  id: number;
+  version: number;          // サーバーでの行の版 (変更フィードの seq)
+  data: Record<string, any>;
+}
+
 export class KoenoDexie extends Dexie {
   // 'local_recordings' テーブルを定義
   local_recordings!: Table<LocalRecording>; 
+  sync_state!: Table<SyncState>;
+  synced_rows!: Table<SyncedRow>;
 
   constructor() {
     super('koenoAppDatabase');
@@ -30,8 +55,105 @@ export class KoenoDexie extends Dexie {
       local_recordings: '++local_id, caregiver_id, upload_status, created_at',
     });
     
-    // (v2 へのマイグレーションは不要)
+    // v2: 同期の状態 (サーバー混雑時の再送待ち)。既存データの移行は不要
+    this.version(2).stores({
+      local_recordings: '++local_id, caregiver_id, upload_status, created_at',
+      sync_state: 'key',
+    });
+
+    // v3: サーバーの変更フィードで同期した行 (entity ごとに引けるよう索引を付ける)
+    this.version(3).stores({
+      local_recordings: '++local_id, caregiver_id, upload_status, created_at',
+      sync_state: 'key',
+      synced_rows: 'key, entity',
+    });
+  }
+}
+
+export const db = new KoenoDexie();
+
+// --- アップロードの再送待ち (サーバーの受け入れ制御) ---
+// サーバーは混雑時・空き容量不足時に 503 と Retry-After (秒 または HTTP 日付) を返す。
+// その時刻までは同期を行わず、サーバーに一斉に再送しないようにする。
+
+const UPLOAD_RETRY_KEY = 'upload_retry_at';
+const DEFAULT_RETRY_SECONDS = 60;
+
+/** Retry-After ヘッダーを「次に送ってよい時刻 (ms)」にする */
+export const parseRetryAfter = (header: string | null, now: number = Date.now()): number => {
+  if (header) {
+    const seconds = Number(header);
+    if (Number.isFinite(seconds) && seconds >= 0) return now + seconds * 1000;
+    const date = Date.parse(header);
+    if (!Number.isNaN(date)) return date;
   }
+  return now + DEFAULT_RETRY_SECONDS * 1000;
+};
+
+export const getUploadRetryAt = async (): Promise<number> => {
+  const state = await db.sync_state.get(UPLOAD_RETRY_KEY);
+  return state ? state.value : 0;
+};
+
+export const setUploadRetryAt = async (retryAt: number): Promise<void> => {
+  await db.sync_state.put({ key: UPLOAD_RETRY_KEY, value: retryAt });
+};
+
+export const clearUploadRetryAt = async (): Promise<void> => {
+  await db.sync_state.delete(UPLOAD_RETRY_KEY);
+};
+
+// --- サーバーとの差分同期 (GET /sync/changes) ---
+// 前回受け取ったカーソル以降に作成・更新・削除された行だけを取り、ローカルに反映する。
+// 再接続時に日ごとの一覧を取り直さずに済む。削除は墓標 (deleted: true) で届く。
+// サーバーが reset を返した (DB が作り直された等) ときは、同期した行を捨てて最初から取り直す。
+
+const CHANGE_CURSOR_KEY = 'change_cursor';
+const CHANGE_PAGE_SIZE = 500;
+
+interface ChangeFeedResponse {
+  cursor: number;
+  has_more: boolean;
+  reset: boolean;
+  changes: { entity: SyncEntity; id: number; version: number; deleted: boolean; data: Record<string, any> | null }[];
 }
 
-export const db = new KoenoDexie();
\ No newline at end of file
+/** 変更フィードを最後まで取り込み、反映した変更の件数を返す */
+export const pullChanges = async (apiBaseUrl: string, caregiverId: string): Promise<number> => {
+  let applied = 0;
+  for (;;) {
+    const state = await db.sync_state.get(CHANGE_CURSOR_KEY);
+    const cursor = state ? state.value : 0;
+    const response = await fetch(`${apiBaseUrl}/sync/changes?cursor=${cursor}&limit=${CHANGE_PAGE_SIZE}`, {
+      headers: { 'X-Caller-ID': caregiverId },
+    });
+    if (!response.ok) throw new Error(`差分同期に失敗: ${response.status}`);
+    const feed: ChangeFeedResponse = await response.json();
+
+    await db.transaction('rw', db.synced_rows, db.sync_state, async () => {
+      if (feed.reset) {
+        await db.synced_rows.clear();
+      }
+      const removed = feed.changes.filter(c => c.deleted).map(c => `${c.entity}:${c.id}`);
+      const upserted = feed.changes
+        .filter(c => !c.deleted && c.data)
+        .map(c => ({ key: `${c.entity}:${c.id}`, entity: c.entity, id: c.id, version: c.version, data: c.data! }));
+      if (removed.length > 0) await db.synced_rows.bulkDelete(removed);
+      if (upserted.length > 0) await db.synced_rows.bulkPut(upserted);
+      // (行とカーソルを同じトランザクションで書く。途中で切れても取り直すだけで済む)
+      await db.sync_state.put({ key: CHANGE_CURSOR_KEY, value: feed.cursor });
+    });
+    applied += feed.changes.length;
+    if (!feed.has_more) return applied;
+  }
+};
+
+/** サーバーが混雑中 (503) であることを表すエラー。retryAt までは再送しない */
+export class UploadDeferredError extends Error {
+  retryAt: number;
+  constructor(retryAt: number) {
+    super(`サーバーが混雑しています。${new Date(retryAt).toLocaleTimeString()} 以降に再送します。`);
+    this.name = 'UploadDeferredError';
+    this.retryAt = retryAt;
+  }
+}
\ No newline at end of file
@@ -60,16 +60,12 @@ export const KirokuDetailPage = () => {
 
     try {
       const headers = { 'X-Caller-ID': auth.caregiverId };
-      const detailRes = await fetch(`${API_PATH}/care_record_detail?user_id=${userId}&record_date=${date}`, { headers });
-      if (detailRes.ok) {
-        const detailData: CareRecordDetail = await detailRes.json();
-        setRecordText(detailData.final_text); 
-      }
-      
-      const assignedRes = await fetch(`${API_PATH}/assigned_recordings?user_id=${userId}&record_date=${date}`, { headers });
-      if (assignedRes.ok) {
-        const assignedData: RecordingBase[] = await assignedRes.json();
-        setAssignedList(assignedData);
+      // ★ 日報と割当済み録音は /day_view で1往復にまとめて取得
+      const dayRes = await fetch(`${API_PATH}/day_view?user_id=${userId}&record_date=${date}`, { headers });
+      if (dayRes.ok) {
+        const dayData: { care_record: CareRecordDetail; assigned_recordings: RecordingBase[] } = await dayRes.json();
+        setRecordText(dayData.care_record.final_text); 
+        setAssignedList(dayData.assigned_recordings);
       }
 
       const unassignedRes = await fetch(`${API_PATH}/unassigned_recordings?caregiver_id=${auth.caregiverId}&record_date=${date}`, { headers });
@@ -1,6 +1,6 @@
 import { useState, useRef, useEffect } from 'react';
 import { useAuth } from '../contexts/AuthContext';
-import { db } from '../db';
+import { db, clearUploadRetryAt, getUploadRetryAt, parseRetryAfter, setUploadRetryAt, UploadDeferredError } from '../db';
 import { useNavigate } from 'react-router-dom';
 
 // ★★★ [PO 2.1][PO 2.3] MUIコンポーネントをインポート ★★★
@@ -43,6 +43,12 @@ const processSyncQueue_Foreground = async (
   const API_URL = `${API_BASE_URL}/upload_recording`; // -> /api/upload_recording
 
   try {
+    // ★ サーバーが混雑中 (503 + Retry-After) なら、指定された時刻まではアップロードせずバックグラウンド同期に任せる
+    const retryAt = await getUploadRetryAt();
+    if (Date.now() < retryAt) {
+      return await deferToBackgroundSync(new UploadDeferredError(retryAt), setStatus);
+    }
+
     const pendingRecords = await db.local_recordings.where('upload_status').equals('pending').toArray();
     if (pendingRecords.length === 0) {
       console.log('[APP] 同期対象のデータはありませんでした。');
@@ -53,8 +59,9 @@ const processSyncQueue_Foreground = async (
     console.log(`[APP] ${pendingRecords.length} 件のデータをアップロードします...`);
     setStatus(`同期中... ( ${pendingRecords.length} 件)`, 'info');
 
-    const uploadPromises = pendingRecords.map(async (record) => {
-      if (!record.local_id) return; // 型ガード
+    // ★ 1件ずつ送る (施設全体の一括同期でサーバーに同時に押し寄せないように)
+    for (const record of pendingRecords) {
+      if (!record.local_id) continue; // 型ガード
 
       const formData = new FormData();
       formData.append('caregiver_id', record.caregiver_id);
@@ -65,24 +72,29 @@ const processSyncQueue_Foreground = async (
       // (Date オブジェクトを ISO 文字列に変換して送信)
       formData.append('created_at_iso', record.created_at.toISOString()); 
       
+      let response: Response;
       try {
         // (API_URL が /api/upload_recording になっている)
-        const response = await fetch(API_URL, { method: 'POST', body: formData });
-        if (response.ok) {
-          await db.local_recordings.update(record.local_id, { upload_status: 'uploaded' });
-          console.log(`[APP] ${record.local_id} のアップロード成功。`);
-        } else {
-          console.error(`[APP] ${record.local_id} のアップロード失敗 (サーバーエラー):`, response.status);
-          throw new Error(`Server error: ${response.status}`);
-        }
+        response = await fetch(API_URL, { method: 'POST', body: formData });
       } catch (fetchError) {
         console.error(`[APP] ${record.local_id} のアップロード失敗 (ネットワーク):`, fetchError);
         throw fetchError;
       }
-    });
+      if (response.ok) {
+        await db.local_recordings.update(record.local_id, { upload_status: 'uploaded' });
+        console.log(`[APP] ${record.local_id} のアップロード成功。`);
+      } else if (response.status === 503) {
+        // サーバーの受け入れ制御 (混雑・空き容量不足)。残りは Retry-After の時刻以降にバックグラウンド同期で送る
+        const nextRetryAt = parseRetryAfter(response.headers.get('Retry-After'));
+        await setUploadRetryAt(nextRetryAt);
+        return await deferToBackgroundSync(new UploadDeferredError(nextRetryAt), setStatus);
+      } else {
+        console.error(`[APP] ${record.local_id} のアップロード失敗 (サーバーエラー):`, response.status);
+        throw new Error(`Server error: ${response.status}`);
+      }
+    }
 
-    await Promise.all(uploadPromises);
-    
+    await clearUploadRetryAt();
     console.log('[APP] 同期処理が完了しました。');
     setStatus('同期処理が正常に完了しました。', 'success');
     return true; // 正常終了
@@ -99,6 +111,23 @@ const processSyncQueue_Foreground = async (
   }
 };
 
+/**
+ * サーバーが混雑中のとき: 録音は端末に残したまま、バックグラウンド同期に再送を任せる
+ * (サービスワーカーも Retry-After の時刻までは送らない)
+ */
+const deferToBackgroundSync = async (
+  deferred: UploadDeferredError,
+  setStatus: (message: string, severity: AlertColor) => void
+) => {
+  console.warn(`[APP] ${deferred.message}`);
+  const registration = await navigator.serviceWorker.ready;
+  if (registration && registration.sync) {
+    await registration.sync.register('koeno-sync');
+  }
+  setStatus(`${deferred.message} (録音は端末に保存されています)`, 'warning');
+  return false;
+};
+
 
 export const RecordPage = () => {
   const auth = useAuth();
@@ -14,6 +14,7 @@ import { USERS_MASTER, type User } from '../data/usersMaster';
 import { RecordingAdjustModal } from '../components/RecordingAdjustModal';
 import { ProcessedSelectionModal, type ProcessedCandidate } from '../components/ProcessedSelectionModal';
 import { AudioRecorderModal } from '../components/AudioRecorderModal';
+import { pullChanges } from '../db';
 
 import { 
   ContentCopy as CopyIcon, 
@@ -466,9 +467,25 @@ export const StaffInputPage = () => {
     finally { if (currentRequestId === requestIdRef.current) setLoading(false); }
   };
 
+  // ★ 差分同期: 再接続したら前回以降の変更だけを取り込み、変更があったときだけ表示中の日を読み直す
+  const [syncTick, setSyncTick] = useState(0);
+  useEffect(() => {
+    if (!auth.caregiverId) return;
+    const sync = async (refresh: boolean) => {
+      try {
+        const applied = await pullChanges(API_PATH, auth.caregiverId!);
+        if (refresh && applied > 0) setSyncTick(t => t + 1);
+      } catch (e) { console.warn(e); }
+    };
+    const onOnline = () => { sync(true); };
+    sync(false);
+    window.addEventListener('online', onOnline);
+    return () => window.removeEventListener('online', onOnline);
+  }, [auth.caregiverId]);
+
   useEffect(() => {
     loadUserData();
-  }, [selectedUserId, dateStr, auth.caregiverId]);
+  }, [selectedUserId, dateStr, auth.caregiverId, syncTick]);
 
   useEffect(() => {
     if (!currentProcessItem && processQueue.length > 0 && !aiLoading && !editingId) {
@@ -624,21 +641,21 @@ export const StaffInputPage = () => {
   const markAssignmentAsProcessed = async (recordingId: number, groupId: string) => {
     const targetRec = assignedList.find(r => r.recording_id === recordingId);
     if (!targetRec || !targetRec.assignment_snapshot) return;
-    const newSnapshot = targetRec.assignment_snapshot.map((row: any) => {
-      if (row.type === 'assignment' && row.id === groupId) return { ...row, processed: true };
-      return row;
-    });
-    const userIds = Array.from(new Set(newSnapshot.filter((r:any) => r.type==='assignment').map((r:any) => r.userId)));
-    await fetch(`${API_PATH}/save_assignments`, {
-        method: 'POST',
+    // ★ 処理済みフラグ1つだけを差分で送る (スナップショット全体は送らない)
+    const send = (version: number) => fetch(`${API_PATH}/recordings/${recordingId}/assignments`, {
+        method: 'PATCH',
         headers: { 'Content-Type': 'application/json', 'X-Caller-ID': auth.caregiverId! },
         body: JSON.stringify({
-          recording_id: recordingId,
-          user_ids: userIds,
-          assignment_snapshot: newSnapshot,
-          summary_drafts: targetRec.summary_drafts || {} 
+          base_version: version,
+          changes: [{ op: 'update', id: groupId, set: { processed: true } }]
         }),
     });
+    const res = await send(targetRec.assignment_version ?? 0);
+    // 他の端末が先に保存していた場合も、フラグを立てるだけなので最新の版に対してやり直す
+    if (res.status === 409) {
+      const conflict = await res.json();
+      await send(conflict.assignment_version);
+    }
   };
 
   const defaultLayout: LayoutData = {
@@ -1,6 +1,6 @@
 /// <reference lib="WebWorker" />
 import { precacheAndRoute } from 'workbox-precaching'
-import { db } from './db' // Dexie (IndexedDB)
+import { db, clearUploadRetryAt, getUploadRetryAt, parseRetryAfter, setUploadRetryAt, UploadDeferredError } from './db' // Dexie (IndexedDB)
 
 declare const self: ServiceWorkerGlobalScope & { __WB_MANIFEST: any }
 
@@ -42,6 +42,13 @@ const processSyncQueue = async () => {
   const API_URL = `${API_BASE_URL}/upload_recording`; // -> /api/upload_recording
 
   try {
+    // ★ サーバーが混雑中 (503 + Retry-After) なら、指定された時刻まではアップロードしない
+    // (失敗として返し、ブラウザに後で sync を再実行させる)
+    const retryAt = await getUploadRetryAt();
+    if (Date.now() < retryAt) {
+      throw new UploadDeferredError(retryAt);
+    }
+
     const pendingRecords = await db.local_recordings.where('upload_status').equals('pending').toArray();
     
     if (pendingRecords.length === 0) {
@@ -51,8 +58,9 @@ const processSyncQueue = async () => {
 
     console.log(`[SW] ${pendingRecords.length} 件のデータをアップロードします...`);
     
-    const uploadPromises = pendingRecords.map(async (record) => {
-      if (!record.local_id) return; // 型ガード
+    // ★ 1件ずつ送る (施設全体の一括同期でサーバーに同時に押し寄せないように)
+    for (const record of pendingRecords) {
+      if (!record.local_id) continue; // 型ガード
 
       const formData = new FormData();
       formData.append('caregiver_id', record.caregiver_id);
@@ -63,31 +71,40 @@ const processSyncQueue = async () => {
       // (Date オブジェクトを ISO 文字列に変換して送信)
       formData.append('created_at_iso', record.created_at.toISOString());
 
+      let response: Response;
       try {
         // (API_URL が /api/upload_recording になっている)
-        const response = await fetch(API_URL, { method: 'POST', body: formData });
-        
-        if (response.ok) {
-          // アップロード成功
-          await db.local_recordings.update(record.local_id, { upload_status: 'uploaded' });
-          console.log(`[SW] ${record.local_id} のアップロード成功。`);
-        } else {
-          // サーバーが 404 や 500 を返した場合
-          console.error(`[SW] ${record.local_id} のアップロード失敗 (サーバーエラー):`, response.status);
-        }
+        response = await fetch(API_URL, { method: 'POST', body: formData });
       } catch (fetchError) {
         // ネットワークエラー (APIサーバーが落ちている場合など)
         console.error(`[SW] ${record.local_id} のアップロード失敗 (ネットワーク):`, fetchError);
         throw fetchError;
       }
-    });
 
-    await Promise.all(uploadPromises);
-    
+      if (response.ok) {
+        // アップロード成功
+        await db.local_recordings.update(record.local_id, { upload_status: 'uploaded' });
+        console.log(`[SW] ${record.local_id} のアップロード成功。`);
+      } else if (response.status === 503) {
+        // サーバーの受け入れ制御 (混雑・空き容量不足)。残りは Retry-After の時刻まで送らない
+        const nextRetryAt = parseRetryAfter(response.headers.get('Retry-After'));
+        await setUploadRetryAt(nextRetryAt);
+        throw new UploadDeferredError(nextRetryAt);
+      } else {
+        // サーバーが 404 や 500 を返した場合
+        console.error(`[SW] ${record.local_id} のアップロード失敗 (サーバーエラー):`, response.status);
+      }
+    }
+
+    await clearUploadRetryAt();
     console.log('[SW] 同期処理が完了しました。');
 
   } catch (error) {
-    console.error('[SW] 同期キューの処理中にエラーが発生しました:', error);
+    if (error instanceof UploadDeferredError) {
+      console.warn(`[SW] ${error.message}`);
+    } else {
+      console.error('[SW] 同期キューの処理中にエラーが発生しました:', error);
+    }
     throw new Error('Sync processing failed, will retry.');
   }
 };
@@ -0,0 +1,65 @@
+/**
+ * 割当スナップショットの差分 (PATCH /recordings/{id}/assignments の changes) を作る
+ * 読み込んだ時点の行 (base) と編集後の行 (next) を比べ、行の id ごとに
+ * delete → insert / move (先頭から順に、直前の行の後ろへ) → update の順で並べる。
+ * サーバー側 (assignment_delta.apply_changes) は先頭から順に適用する。
+ */
+export type AssignmentChange =
+  | { op: 'update'; id: string; set: Record<string, unknown> }
+  | { op: 'insert'; row: Record<string, unknown>; after: string | null }
+  | { op: 'delete'; id: string }
+  | { op: 'move'; id: string; after: string | null };
+
+type Row = { id: string } & Record<string, unknown>;
+
+const IMMUTABLE_FIELDS = ['id', 'type'];
+
+const changedFields = (before: Row, after: Row): Record<string, unknown> => {
+  const set: Record<string, unknown> = {};
+  const keys = new Set([...Object.keys(before), ...Object.keys(after)]);
+  keys.forEach(key => {
+    if (IMMUTABLE_FIELDS.includes(key)) return;
+    if (JSON.stringify(before[key]) !== JSON.stringify(after[key])) {
+      // (消えた項目は null にする)
+      set[key] = after[key] === undefined ? null : after[key];
+    }
+  });
+  return set;
+};
+
+export const diffSnapshot = (base: Row[], next: Row[]): AssignmentChange[] => {
+  const changes: AssignmentChange[] = [];
+  const nextIds = new Set(next.map(row => row.id));
+  const baseById = new Map(base.map(row => [row.id, row]));
+
+  // 1. 削除
+  const working = base.filter(row => {
+    if (nextIds.has(row.id)) return true;
+    changes.push({ op: 'delete', id: row.id });
+    return false;
+  }).map(row => row.id);
+
+  // 2. 追加・移動 (working をサーバーと同じ手順で並べ替えながら、位置が違う行だけを出す)
+  next.forEach((row, i) => {
+    const after = i === 0 ? null : next[i - 1].id;
+    if (!baseById.has(row.id)) {
+      changes.push({ op: 'insert', row, after });
+      working.splice(i, 0, row.id);
+      return;
+    }
+    if (working[i] === row.id) return;
+    changes.push({ op: 'move', id: row.id, after });
+    working.splice(working.indexOf(row.id), 1);
+    working.splice(i, 0, row.id);
+  });
+
+  // 3. 項目の変更
+  next.forEach(row => {
+    const before = baseById.get(row.id);
+    if (!before) return;
+    const set = changedFields(before, row);
+    if (Object.keys(set).length > 0) changes.push({ op: 'update', id: row.id, set });
+  });
+
+  return changes;
+};